@@ -0,0 +1,65 @@
+import logging
+import sys
+import os
+import time
+import django
+from django.db import transaction
+
+import numpy as np
+
+# Configurer Django
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mygutenberg.settings')
+django.setup()
+
+from book.models import Book
+from book.graph import JACCARD_THRESHOLD, jaccard_graph, pagerank
+from book.similarity import load_book_term_matrix
+
+# Logging
+logging.basicConfig(level=logging.INFO)
+
+# Livres par UPDATE lors de l'enregistrement des scores
+SAVE_BATCH_SIZE = 1000
+
+
+def save_pagerank(book_ids, scores, batch_size=SAVE_BATCH_SIZE):
+    books = [Book(id=int(book_id), pagerank=float(score)) for book_id, score in zip(book_ids, scores)]
+    with transaction.atomic():
+        Book.objects.bulk_update(books, ['pagerank'], batch_size=batch_size)
+
+
+def compute_corpus_pagerank(threshold=JACCARD_THRESHOLD):
+    """Graphe de Jaccard de tout le corpus, PageRank, puis Book.pagerank"""
+    start = time.monotonic()
+    book_ids = np.array(sorted(Book.objects.values_list('id', flat=True)), dtype=np.int64)
+    if not len(book_ids):
+        logging.warning("Aucun livre trouvé !")
+        return
+
+    incidence = load_book_term_matrix(book_ids)
+    logging.info(
+        f"Matrice d'incidence : {incidence.shape[0]} livres x {incidence.shape[1]} termes, "
+        f"{incidence.nnz} postings en {time.monotonic() - start:.1f}s"
+    )
+
+    start = time.monotonic()
+    adjacency = jaccard_graph(incidence, threshold)
+    logging.info(f"Graphe de Jaccard : {adjacency.nnz // 2} arêtes (seuil {threshold}) en {time.monotonic() - start:.1f}s")
+
+    start = time.monotonic()
+    scores = pagerank(adjacency)
+    save_pagerank(book_ids, scores)
+    logging.info(f"PageRank enregistré pour {len(book_ids)} livres en {time.monotonic() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Calculer le PageRank du graphe de Jaccard du corpus')
+    parser.add_argument('--threshold', type=float, default=JACCARD_THRESHOLD,
+                       help='Similarité de Jaccard minimale pour relier deux livres')
+
+    args = parser.parse_args()
+
+    compute_corpus_pagerank(threshold=args.threshold)
@@ -0,0 +1,79 @@
+import logging
+import sys
+import os
+import time
+import django
+from django.db import transaction
+
+import numpy as np
+
+# Configurer Django
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mygutenberg.settings')
+django.setup()
+
+from book.models import Book, SimilarBook
+from book.bulk_load import copy_rows, supports_copy
+from book.similarity import (COSINE_THRESHOLD, MAX_DOCUMENT_RATIO, NEIGHBOURS, cosine_neighbours,
+                             load_book_term_matrix, normalized_rows)
+
+# Logging
+logging.basicConfig(level=logging.INFO)
+
+# Lignes par INSERT quand COPY n'est pas disponible
+INSERT_BATCH_SIZE = 5000
+
+
+def save_neighbours(rows):
+    """Remplace toute la table SimilarBook par les lignes (livre, voisin, similarité)"""
+    with transaction.atomic():
+        SimilarBook.objects.all().delete()
+        if supports_copy():
+            return copy_rows(SimilarBook._meta.db_table, ('book_id', 'similar_id', 'similarity'), rows)
+        SimilarBook.objects.bulk_create(
+            (SimilarBook(book_id=book_id, similar_id=similar_id, similarity=similarity)
+             for book_id, similar_id, similarity in rows),
+            batch_size=INSERT_BATCH_SIZE,
+        )
+        return SimilarBook.objects.count()
+
+
+def compute_similar_books(k=NEIGHBOURS, threshold=COSINE_THRESHOLD, max_document_ratio=MAX_DOCUMENT_RATIO, workers=None):
+    """Matrice TF-IDF du corpus, voisins par blocs, puis table SimilarBook"""
+    start = time.monotonic()
+    book_ids = np.array(sorted(Book.objects.values_list('id', flat=True)), dtype=np.int64)
+    if not len(book_ids):
+        logging.warning("Aucun livre trouvé !")
+        return
+
+    matrix = normalized_rows(load_book_term_matrix(book_ids, weighted=True), max_document_ratio)
+    logging.info(
+        f"Matrice TF-IDF : {matrix.shape[0]} livres x {matrix.shape[1]} termes, "
+        f"{matrix.nnz} poids en {time.monotonic() - start:.1f}s"
+    )
+
+    start = time.monotonic()
+    rows, columns, scores = cosine_neighbours(matrix, k, threshold, workers=workers)
+    logging.info(f"{len(rows)} voisins (seuil {threshold}) calculés en {time.monotonic() - start:.1f}s")
+
+    start = time.monotonic()
+    saved = save_neighbours(zip(book_ids[rows].tolist(), book_ids[columns].tolist(), scores.tolist()))
+    logging.info(f"{saved} lignes SimilarBook enregistrées en {time.monotonic() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Précalculer les livres similaires (cosinus TF-IDF)')
+    parser.add_argument('--neighbours', type=int, default=NEIGHBOURS,
+                       help='Nombre de voisins gardés par livre')
+    parser.add_argument('--threshold', type=float, default=COSINE_THRESHOLD,
+                       help='Similarité cosinus minimale')
+    parser.add_argument('--max-document-ratio', type=float, default=MAX_DOCUMENT_RATIO,
+                       help='Retirer les termes présents dans une plus grande proportion de livres')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Processus de calcul des blocs (défaut : nombre de CPU)')
+
+    args = parser.parse_args()
+
+    compute_similar_books(args.neighbours, args.threshold, args.max_document_ratio, args.workers)
@@ -1,12 +1,14 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 import os
 import sys
 import requests
 import django
 import logging
 import time
+import asyncio
+from contextlib import aclosing
 from tqdm import tqdm
-from django.db import transaction
+from django.conf import settings
 from requests.exceptions import RequestException, ConnectionError, Timeout
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
@@ -16,7 +18,9 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mygutenberg.settings')
 django.setup()
 
-from book.models import Book, Author
+from book.async_fetcher import AsyncFetcher
+from book.importer import AuthorResolver, is_importable, prepare_book_text, store_books
+from book.text_cache import ImportCheckpoint, TextCache
 
 # Configuration de la session avec retry automatique
 session = requests.Session()
@@ -56,14 +60,41 @@ def make_api_request(url, max_retries=3):
     logging.error(f"Échec de la requête après {max_retries} tentatives : {url}")
     return None
 
-def fetch_book_text(book_data):
-    text_url = None
-    possible_formats = ['text/plain', 'text/plain; charset=utf-8', 'text/plain; charset=iso-8859-1', 'text/plain; charset=us-ascii']
+TEXT_FORMATS = ['text/plain', 'text/plain; charset=utf-8', 'text/plain; charset=iso-8859-1', 'text/plain; charset=us-ascii']
+API_URL = "https://gutendex.com/books/"
+
+# Textes complets (non tronqués) déjà téléchargés : aucun accès réseau pour eux
+text_cache = TextCache(settings.BOOK_TEXT_CACHE_DIR)
+
+# Cache nom -> id des auteurs, conservé d'une page à l'autre
+author_resolver = AuthorResolver()
 
-    for fmt in possible_formats:
+def select_text_url(book_data):
+    for fmt in TEXT_FORMATS:
         if fmt in book_data['formats']:
-            text_url = book_data['formats'][fmt]
-            break
+            return book_data['formats'][fmt]
+    return None
+
+def cached_book_text(book_data):
+    """Texte préparé depuis le cache disque, ou None s'il faut le télécharger"""
+    raw_text = text_cache.get(book_data['id'])
+    if raw_text is None:
+        return None
+    return prepare_book_text(book_data, raw_text)
+
+def cache_book_text(book_data, raw_text):
+    """Met le texte complet en cache puis le prépare pour la base"""
+    raw_text = raw_text.strip()
+    if raw_text:
+        text_cache.put(book_data['id'], raw_text)
+    return prepare_book_text(book_data, raw_text)
+
+def fetch_book_text(book_data):
+    cached = cached_book_text(book_data)
+    if cached is not None:
+        return cached
+
+    text_url = select_text_url(book_data)
 
     if not text_url:
         logging.warning(f"Aucun texte disponible pour le livre ID {book_data['id']}.")
@@ -71,64 +102,62 @@ def fetch_book_text(book_data):
 
     response = make_api_request(text_url, max_retries=3)
     if response:
-        text_content = response.text.strip()
-        if not text_content:
-            logging.warning(f"Le livre ID {book_data['id']} semble vide.")
-            return None, 0
-        word_count = len(text_content.split())
-        return text_content[:100000], word_count
+        return cache_book_text(book_data, response.text)
     
     logging.error(f"Échec du téléchargement du livre {book_data['id']}.")
     return None, 0
 
+async def fetch_book_text_async(fetcher, book_data):
+    cached = cached_book_text(book_data)
+    if cached is not None:
+        return cached
+
+    text_url = select_text_url(book_data)
+
+    if not text_url:
+        logging.warning(f"Aucun texte disponible pour le livre ID {book_data['id']}.")
+        return None, 0
+
+    raw_text = await fetcher.get(text_url)
+    if raw_text is not None:
+        return await asyncio.to_thread(cache_book_text, book_data, raw_text)
+
+    logging.error(f"Échec du téléchargement du livre {book_data['id']}.")
+    return None, 0
 
-def process_book(book_data):
-    try:
-        book_text, word_count = fetch_book_text(book_data)
-
-        if not book_text or word_count < 10000:
-            logging.info(f"Livre ignoré : {book_data['title']} (ID: {book_data['id']}), {word_count} mots.")
-            return None
-
-        with transaction.atomic():
-            book, created = Book.objects.get_or_create(
-                id=book_data['id'],
-                defaults={  # Defaults pour un nouveau livre
-                    'title': book_data['title'],
-                    'language': ', '.join(book_data['languages']),
-                    'description': book_data.get('summaries', [''])[0] if book_data.get('summaries') else '',
-                    'subjects': ', '.join(book_data.get('subjects', [])),
-                    'bookshelves': ', '.join(book_data.get('bookshelves', [])),
-                    'cover_image': book_data['formats'].get('image/jpeg', ''),
-                    'download_count': book_data['download_count'],
-                    'copyright': book_data.get('copyright', False),
-                    'text_content': book_text
-                }
-            )
-
-            if created:
-                logging.info(f"Livre importé : {book.title} (ID: {book.id}) - {word_count} mots.")
-
-            for author_data in book_data.get('authors', []):
-                author, _ = Author.objects.get_or_create(
-                    name=author_data['name'],
-                    defaults={
-                        'birth_year': author_data.get('birth_year'),
-                        'death_year': author_data.get('death_year')
-                    }
-                )
-                book.authors.add(author)
 
-        return book
+def store_page(books_data, texts, limit):
+    """Insère en masse les livres importables d'une page, au plus limit.
 
+    Renvoie (nombre de livres insérés, page entièrement traitée ?).
+    """
+    entries = [
+        (book_data, book_text)
+        for book_data, (book_text, word_count) in zip(books_data, texts)
+        if is_importable(book_data, book_text, word_count)
+    ]
+    complete = len(entries) <= limit
+    try:
+        books = store_books(entries[:limit], author_resolver)
     except Exception as e:
-        logging.error(f"Erreur lors de l'insertion du livre ID {book_data['id']}: {e}")
-        return None
+        logging.error(f"Erreur lors de l'insertion de la page ({len(entries)} livres) : {e}")
+        return 0, False
+    return len(books), complete
+
+def load_checkpoint(resume):
+    """Point de reprise de l'import ; remis à zéro si on ne reprend pas"""
+    checkpoint = ImportCheckpoint(settings.BOOK_IMPORT_CHECKPOINT)
+    if not resume:
+        checkpoint.clear()
+    elif checkpoint.next_url:
+        logging.info(f"Reprise de l'import à {checkpoint.next_url} ({checkpoint.books_done} livres déjà importés)")
+    return checkpoint
 
-def fetch_and_insert_books(max_books=50, workers=2):
+def fetch_and_insert_books(max_books=50, workers=2, resume=False):
     logging.info("Début de l'importation des livres...")
-    url = "https://gutendex.com/books/"
-    total_books_fetched = 0
+    checkpoint = load_checkpoint(resume)
+    url = checkpoint.next_url or API_URL
+    total_books_fetched = checkpoint.books_done
     
     # Requête initiale avec retry
     response = make_api_request(url)
@@ -140,7 +169,7 @@ def fetch_and_insert_books(max_books=50, workers=2):
     total_books_to_fetch = data.get('count', 0)
     logging.info(f"Total de livres disponibles : {total_books_to_fetch}")
 
-    with tqdm(total=min(total_books_to_fetch, max_books), desc="Importing books") as pbar:
+    with tqdm(total=min(total_books_to_fetch, max_books), initial=total_books_fetched, desc="Importing books") as pbar:
         with ThreadPoolExecutor(max_workers=workers) as executor:
             while url and total_books_fetched < max_books:
                 logging.info(f"Récupération des livres depuis {url}")
@@ -154,20 +183,18 @@ def fetch_and_insert_books(max_books=50, workers=2):
                 data = response.json()
                 books_data = data.get('results', [])
 
-                # Traitement des livres de cette page
-                futures = {executor.submit(process_book, book_data): book_data for book_data in books_data}
+                # Textes téléchargés en parallèle, puis insertion groupée de la page
+                texts = list(executor.map(fetch_book_text, books_data))
+                stored, complete = store_page(books_data, texts, max_books - total_books_fetched)
+                pbar.update(stored)
+                total_books_fetched += stored
 
-                # Attendre que chaque future se termine
-                for future in as_completed(futures):
-                    try:
-                        book = future.result()
-                        if book:
-                            pbar.update(1)
-                            total_books_fetched += 1
-                    except Exception as e:
-                        logging.error(f"Erreur lors du traitement d'un livre : {e}")
+                # Une page incomplète sera reprise en entier (les textes viennent du cache)
+                if not complete:
+                    break
 
                 url = data.get('next')
+                checkpoint.save(url, total_books_fetched)
                 logging.info(f"URL suivante : {url}")
                 logging.info(f"Livres récupérés jusqu'ici : {total_books_fetched}")
                 
@@ -176,8 +203,71 @@ def fetch_and_insert_books(max_books=50, workers=2):
                     logging.info("Pause de 5 secondes avant la page suivante...")
                     time.sleep(5)
 
+    if not url:
+        checkpoint.clear()
     logging.info(f"Importation terminée. Total de livres traités : {total_books_fetched}")
 
 
-# Réduire considérablement le nombre de livres et de workers pour tester
-fetch_and_insert_books(max_books=100, workers=2)  # Commencer avec moins de livres et moins de workers
\ No newline at end of file
+async def fetch_and_insert_books_async(max_books=50, concurrency=20, per_host=4, url=API_URL, resume=False):
+    """Import asynchrone : pages préchargées, textes téléchargés en parallèle.
+
+    Le débit est piloté par les réponses 429/503 de chaque hôte (voir
+    book.async_fetcher) plutôt que par des pauses fixes. Les insertions
+    restent synchrones : une insertion groupée par page, dans un thread.
+    """
+    logging.info("Début de l'importation asynchrone des livres...")
+    checkpoint = load_checkpoint(resume)
+    url = checkpoint.next_url or url
+    total_books_fetched = checkpoint.books_done
+
+    async with AsyncFetcher(concurrency=concurrency, per_host=per_host) as fetcher:
+        with tqdm(total=max_books, initial=total_books_fetched, desc="Importing books") as pbar, \
+                aclosing(fetcher.iter_pages(url)) as pages:
+            async for page in pages:
+                books_data = page.get('results', [])
+                logging.info(f"Page reçue : {len(books_data)} livres (total disponible : {page.get('count', 0)})")
+
+                texts = await asyncio.gather(*(fetch_book_text_async(fetcher, book_data) for book_data in books_data))
+
+                stored, complete = await asyncio.to_thread(
+                    store_page, books_data, texts, max_books - total_books_fetched
+                )
+                pbar.update(stored)
+                total_books_fetched += stored
+
+                # Une page incomplète sera reprise en entier (les textes viennent du cache)
+                if not complete:
+                    break
+                checkpoint.save(page.get('next'), total_books_fetched)
+
+                logging.info(f"Livres récupérés jusqu'ici : {total_books_fetched}")
+                if total_books_fetched >= max_books:
+                    break
+
+    # Plus de page suivante : catalogue entièrement parcouru
+    if checkpoint.next_url is None:
+        checkpoint.clear()
+    logging.info(f"Importation terminée. Total de livres traités : {total_books_fetched}")
+    return total_books_fetched
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Importer les livres depuis gutendex")
+    parser.add_argument('--max-books', type=int, default=100, help='Nombre de livres à importer')
+    parser.add_argument('--workers', type=int, default=2, help='Threads de téléchargement (mode synchrone)')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Import asynchrone (asyncio + aiohttp)')
+    parser.add_argument('--concurrency', type=int, default=20, help='Taille du pool de connexions (mode async)')
+    parser.add_argument('--per-host', type=int, default=4, help='Requêtes simultanées par hôte (mode async)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Reprendre au dernier point de reprise (--max-books compte les livres déjà importés)')
+
+    args = parser.parse_args()
+
+    if args.use_async:
+        asyncio.run(fetch_and_insert_books_async(args.max_books, args.concurrency, args.per_host, resume=args.resume))
+    else:
+        # Commencer avec peu de livres et peu de workers
+        fetch_and_insert_books(max_books=args.max_books, workers=args.workers, resume=args.resume)
@@ -1,156 +1,484 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import logging
 import sys
 import os
-import re
 import django
-import nltk
 import math
+import pickle
+import heapq
+import tempfile
+import hashlib
+import time
+from contextlib import nullcontext
+from itertools import chain, groupby, islice
+from operator import itemgetter
 from django.db import transaction, connection
-from django.db.models import Count, Sum
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import MD5
+from django.utils import timezone
 from django.db import models
-from nltk.corpus import stopwords
-from collections import Counter
+from collections import Counter, deque
 
 # Configurer Django
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mygutenberg.settings')
 django.setup()
 
-from book.models import Book, Index, ForwardIndex
+from book.models import Book, Posting, Term, IndexGeneration
+from book.bulk_load import POSTING_COLUMNS, StagingTable, replace_book_rows
+from book.analyzer import extract_words_with_offsets, primary_language
+from book.positions import encode_positions
+from book.minhash import encode_signature, signature
 
 # Logging
 logging.basicConfig(level=logging.INFO)
 
-# Télécharger les ressources nécessaires
-nltk.download('stopwords')
-nltk.download('punkt')
-
-LANGUAGE_MAPPING = {
-    'en': 'english',
-    'fr': 'french',
-    'es': 'spanish',
-    'de': 'german',
-    'it': 'italian',
-}
-
-def load_stopwords(language):
-    nltk_language = LANGUAGE_MAPPING.get(language, 'english')
-    return set(stopwords.words(nltk_language)) if nltk_language in stopwords.fileids() else set()
-
-def extract_words_with_positions(text, language='english'):
-    """Extrait les mots et leurs positions, filtre les stopwords"""
-    stop_words = load_stopwords(language)
-    word_positions = {}
-    
-    for match in re.finditer(r'\b\w+\b', text):
-        word = match.group().lower()
-        pos = match.start()
-        if word not in stop_words and len(word) > 2:  # Ignorer les mots très courts
-            word_positions.setdefault(word, []).append(pos)
-    return word_positions
-
-def calculate_tf_idf_for_corpus():
-    """Calcule le TF-IDF pour tous les livres dans le corpus"""
-    logging.info("Début du calcul TF-IDF pour le corpus...")
-    
-    # Nettoyer les anciennes données
-    logging.info("Nettoyage des anciennes données...")
-    Index.objects.all().delete()
-    ForwardIndex.objects.all().delete()
-    
-    # Récupérer tous les livres avec du contenu
-    books_with_content = list(Book.objects.filter(text_content__isnull=False))
-    total_books = len(books_with_content)
-    
-    if total_books == 0:
-        logging.warning("Aucun livre avec contenu trouvé !")
-        return
-    
-    logging.info(f"Traitement de {total_books} livres...")
-    
-    # Étape 1: Extraire tous les mots de tous les livres
-    logging.info("Étape 1: Extraction des mots de tous les livres...")
-    all_book_words = {}  # {book_id: {word: count, ...}, ...}
-    all_words_doc_frequency = Counter()  # Compteur de documents contenant chaque mot
-    
-    for book in books_with_content:
-        language = book.language.split(',')[0].strip().lower()
-        word_positions_map = extract_words_with_positions(book.text_content, language)
-        
-        # Stocker les mots du livre
-        all_book_words[book.id] = {word: len(positions) for word, positions in word_positions_map.items()}
-        
-        # Incrémenter le compteur de fréquence documentaire
-        for word in word_positions_map.keys():
-            all_words_doc_frequency[word] += 1
-        
-        logging.info(f"Livre traité: {book.title} ({len(word_positions_map)} mots uniques)")
-    
-    logging.info(f"Total de {len(all_words_doc_frequency)} mots uniques dans le corpus")
-    
-    # Étape 2: Calculer TF-IDF pour chaque livre
-    logging.info("Étape 2: Calcul du TF-IDF...")
-    
-    for book in books_with_content:
-        book_words = all_book_words[book.id]
-        total_words_in_book = sum(book_words.values())
-        
-        if total_words_in_book == 0:
-            continue
-        
-        language = book.language.split(',')[0].strip().lower()
-        word_positions_map = extract_words_with_positions(book.text_content, language)
-        
-        index_entries = []
-        forward_index_entries = []
-        
-        for word, positions in word_positions_map.items():
-            # Calcul TF (Term Frequency)
-            tf = len(positions) / total_words_in_book
-            
-            # Calcul IDF (Inverse Document Frequency)
-            documents_containing_word = all_words_doc_frequency[word]
-            idf = math.log(total_books / documents_containing_word)
-            
-            # Calcul TF-IDF
-            tf_idf = tf * idf
-            
-            # Créer les entrées d'index
-            index_entries.append(Index(
-                word=word,
-                book=book,
-                occurrences_count=len(positions),
-                positions=positions
-            ))
-            
-            forward_index_entries.append(ForwardIndex(
-                book=book,
-                word=word,
-                occurrences_count=len(positions),
-                positions=positions,
-                tf=tf,
-                idf=idf,
-                tfidf=tf_idf
-            ))
-        
-        # Sauvegarder par lots pour éviter les problèmes de mémoire
-        try:
-            with transaction.atomic():
-                Index.objects.bulk_create(index_entries, ignore_conflicts=True)
-                ForwardIndex.objects.bulk_create(forward_index_entries, ignore_conflicts=True)
-            
-            logging.info(f"TF-IDF calculé pour '{book.title}' ({len(forward_index_entries)} termes)")
-            
-        except Exception as e:
-            logging.error(f"Erreur lors de la sauvegarde du livre '{book.title}': {e}")
-            continue
-    
+# Nombre de livres ramenés par aller-retour du curseur serveur
+BOOK_CHUNK_SIZE = 100
+# Nombre de livres par fichier de run temporaire
+RUN_SIZE = 100
+# Nombre de mots par requête lors de la mise à jour des DF
+WORD_BATCH_SIZE = 5000
+# Nombre de livres par UPDATE lors du recalcul TF-IDF
+RECOMPUTE_BOOK_BATCH = 200
+# Nombre de signatures MinHash par UPDATE lors de leur recalcul
+MINHASH_BATCH_SIZE = 500
+# Nombre de processus de tokenisation par défaut (--workers N pour un pool de processus)
+DEFAULT_WORKERS = 1
+
+def iter_books_with_content(chunk_size=BOOK_CHUNK_SIZE, full=False):
+    """Parcourt les livres à indexer via un curseur côté serveur (sans tout charger en RAM).
+
+    En mode incrémental, seuls les livres nouveaux ou dont le md5 du texte
+    diffère de l'empreinte enregistrée sont renvoyés.
+    """
+    books = Book.objects.filter(text_content__isnull=False)
+    if not full:
+        books = books.annotate(current_fingerprint=MD5('text_content')).exclude(
+            content_fingerprint=F('current_fingerprint')
+        )
+    return (
+        books.only('id', 'title', 'language', 'text_content', 'indexed_generation')
+        .order_by('id')
+        .iterator(chunk_size=chunk_size)
+    )
+
+def content_fingerprint(text):
+    """Empreinte du texte, identique au md5() de PostgreSQL"""
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+def spill_run(run_dir, run_number, book_records):
+    """Écrit un lot de statistiques par livre dans un fichier de run temporaire.
+
+    Chaque run contient deux fichiers :
+    - ``run_<n>.books`` : les enregistrements (book_id, titre, empreinte, {mot: (occurrences, positions, numéros de mot)}) à la suite
+    - ``run_<n>.df`` : la fréquence documentaire locale du run, triée par mot
+    """
+    books_path = os.path.join(run_dir, f"run_{run_number:05d}.books")
+    df_path = os.path.join(run_dir, f"run_{run_number:05d}.df")
+
+    run_doc_frequency = Counter()
+    count = 0
+    with open(books_path, 'wb') as books_file:
+        for record in book_records:
+            pickle.dump(record, books_file, protocol=pickle.HIGHEST_PROTOCOL)
+            run_doc_frequency.update(record[-1].keys())
+            count += 1
+
+    with open(df_path, 'w', encoding='utf-8') as df_file:
+        for word, doc_count in sorted(run_doc_frequency.items()):
+            df_file.write(f"{word}\t{doc_count}\n")
+
+    return books_path, df_path, count
+
+def iter_run_records(books_path):
+    """Relit les enregistrements d'un run un par un"""
+    with open(books_path, 'rb') as books_file:
+        while True:
+            try:
+                yield pickle.load(books_file)
+            except EOFError:
+                return
+
+def iter_run_doc_frequency(df_path):
+    """Relit la DF d'un run ligne par ligne (déjà triée par mot)"""
+    with open(df_path, encoding='utf-8') as df_file:
+        for line in df_file:
+            word, doc_count = line.rstrip('\n').split('\t')
+            yield word, int(doc_count)
+
+def merge_doc_frequencies(df_paths):
+    """Fusionne (merge k-voies) les fréquences documentaires triées de chaque run"""
+    doc_frequency = {}
+    merged = heapq.merge(*(iter_run_doc_frequency(path) for path in df_paths))
+    for word, group in groupby(merged, key=itemgetter(0)):
+        doc_frequency[word] = sum(count for _, count in group)
+    return doc_frequency
+
+def tokenize_book(book):
+    """Tokenise un livre (book_id, titre, langue, texte) : (book_id, titre, empreinte, {mot: (occurrences, positions, numéros de mot)}).
+
+    Exécuté dans un processus du pool avec ``workers`` > 1 : seuls des tuples
+    transitent, le worker n'accède pas à la base. Les positions et les numéros
+    des mots sont renvoyés déjà encodés (delta + varint), tels qu'écrits dans
+    Posting.
+    """
+    book_id, title, language, text = book
+    word_offsets = extract_words_with_offsets(text, primary_language(language))
+    terms = {
+        word: (len(positions), encode_positions(positions), encode_positions(ordinals))
+        for word, (positions, ordinals) in word_offsets.items()
+    }
+    return book_id, title, content_fingerprint(text), terms
+
+def iter_tokenized_in_pool(books, workers):
+    """Tokenise dans un pool de processus, dans l'ordre, avec au plus ``workers * 2`` livres en cours"""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for book in books:
+            pending.append(executor.submit(tokenize_book, book))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def iter_book_records(books, reindexed_book_ids, workers=1):
+    """Tokenise chaque livre une seule fois et produit (book_id, titre, empreinte, {mot: (occurrences, positions, numéros de mot)})"""
+    def payloads():
+        for book in books:
+            if book.indexed_generation is not None:
+                reindexed_book_ids.append(book.id)
+            yield book.id, book.title, book.language, book.text_content
+
+    records = iter_tokenized_in_pool(payloads(), workers) if workers > 1 else map(tokenize_book, payloads())
+    for record in records:
+        logging.info(f"Livre traité: {record[1]} ({len(record[3])} mots uniques)")
+        yield record
+
+def tokenize_corpus_into_runs(run_dir, books, run_size=RUN_SIZE, workers=1):
+    """Étape 1 : déverse les statistiques des livres dans des runs de ``run_size`` livres.
+
+    Les enregistrements sont écrits au fil de l'eau : un seul livre tokenisé
+    est présent en mémoire à la fois (au plus ``workers * 2`` avec le pool).
+    Renvoie aussi les IDs des livres déjà indexés auparavant (leurs anciens
+    termes doivent être retirés des DF).
+    """
+    runs = []
+    total_books = 0
+    reindexed_book_ids = []
+    records = iter_book_records(books, reindexed_book_ids, workers)
+
+    while True:
+        batch = list(islice(records, 1))
+        if not batch:
+            break
+        # Le premier livre du run est déjà tokenisé, les suivants arrivent en flux
+        run_records = chain(batch, islice(records, run_size - 1))
+        books_path, df_path, count = spill_run(run_dir, len(runs), run_records)
+        runs.append((books_path, df_path))
+        total_books += count
+
+    return runs, total_books, reindexed_book_ids
+
+def iter_batches(items, size=WORD_BATCH_SIZE):
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def indexed_doc_frequency(book_ids):
+    """DF des termes actuellement indexés pour ces livres (contribution à retirer)"""
+    doc_frequency = Counter()
+    for batch in iter_batches(book_ids):
+        rows = Posting.objects.filter(book_id__in=batch).values('word').annotate(doc_count=Count('book_id'))
+        for row in rows:
+            doc_frequency[row['word']] += row['doc_count']
+    return doc_frequency
+
+def doc_frequency_with_delta(delta):
+    """DF attendues des mots touchés (Term + delta), sans rien écrire.
+
+    Elles servent au calcul du TF-IDF des livres de l'exécution ; Term n'est
+    mis à jour qu'à la fin, depuis les postings réellement écrits
+    (``refresh_term_table_from_index``).
+    """
+    doc_frequency = {}
+    for words in iter_batches(sorted(delta)):
+        current = dict(Term.objects.filter(word__in=words).values_list('word', 'document_frequency'))
+        for word in words:
+            new_df = current.get(word, 0) + delta[word]
+            if new_df > 0:
+                doc_frequency[word] = new_df
+    return doc_frequency
+
+def refresh_idf_for_words(words, total_books):
+    """Recalcule IDF et TF-IDF des postings existants pour ces mots"""
+    with connection.cursor() as cursor:
+        for batch in iter_batches(words):
+            cursor.execute(
+                f"""
+                UPDATE {Posting._meta.db_table} AS fi
+                SET idf = LN(%s::float / t.document_frequency),
+                    tfidf = fi.tf * LN(%s::float / t.document_frequency)
+                FROM {Term._meta.db_table} AS t
+                WHERE t.word = fi.word AND fi.word = ANY(%s)
+                """,
+                [total_books, total_books, batch],
+            )
+
+def remove_book_from_index(book_ids):
+    """Retire de l'index les livres qui n'ont plus de contenu"""
+    with transaction.atomic():
+        Posting.objects.filter(book_id__in=book_ids).delete()
+        Book.objects.filter(id__in=book_ids).update(content_fingerprint=None, indexed_generation=None, minhash=None)
+
+def save_book_tfidf(book_id, title, fingerprint, terms, doc_frequency, total_books, generation, stage=None):
+    """Calcule le TF-IDF d'un livre ({mot: (occurrences, positions, numéros de mot encodés)}) et remplace ses postings.
+
+    Le remplacement se fait dans une transaction par livre : les recherches
+    voient soit l'ancienne version du livre, soit la nouvelle. Les lignes
+    sont chargées par COPY (voir ``book.bulk_load``).
+
+    Avec ``stage`` (StagingTable), les lignes sont seulement mises en transit
+    et les champs du livre sont appliqués avec la bascule de toute
+    l'exécution (voir ``merge_staged_books``). Renvoie les champs du livre,
+    None si l'écriture a échoué (le livre garde son ancienne empreinte et
+    sera repris à l'exécution suivante).
+    """
+    total_words_in_book = sum(count for count, _, _ in terms.values())
+
+    posting_rows = []
+
+    for word, (count, positions, ordinals) in terms.items():
+        # Calcul TF (Term Frequency)
+        tf = count / total_words_in_book
+
+        # Calcul IDF (Inverse Document Frequency)
+        idf = math.log(total_books / doc_frequency[word])
+
+        # Calcul TF-IDF
+        tf_idf = tf * idf
+
+        # Créer la ligne de posting (positions et numéros de mot déjà encodés par tokenize_book)
+        posting_rows.append((word, book_id, count, positions, ordinals, tf, idf, tf_idf))
+
+    book_fields = dict(
+        content_fingerprint=fingerprint,
+        indexed_generation=generation.number,
+        # Signature MinHash du vocabulaire pour les livres similaires
+        minhash=encode_signature(signature(terms)),
+    )
+
+    # Sauvegarder livre par livre pour éviter les problèmes de mémoire
+    try:
+        if stage is not None:
+            stage.add(posting_rows, [book_id])
+            logging.info(f"TF-IDF calculé pour '{title}' ({len(posting_rows)} termes, en transit)")
+            return book_fields
+
+        with transaction.atomic():
+            replace_book_rows(Posting, POSTING_COLUMNS, posting_rows, [book_id])
+            Book.objects.filter(id=book_id).update(**book_fields)
+
+        logging.info(f"TF-IDF calculé pour '{title}' ({len(posting_rows)} termes)")
+        return book_fields
+
+    except Exception as e:
+        logging.error(f"Erreur lors de la sauvegarde du livre '{title}': {e}")
+        return None
+
+def merge_staged_books(stage, staged_books):
+    """Bascule en une transaction les postings en transit et les champs des livres correspondants"""
+    start = time.monotonic()
+    with transaction.atomic():
+        inserted = stage.merge()
+        for book_id, book_fields in staged_books.items():
+            Book.objects.filter(id=book_id).update(**book_fields)
+    logging.info(f"{inserted} postings de {len(staged_books)} livres basculés en {time.monotonic() - start:.1f}s")
+
+def start_generation():
+    last = IndexGeneration.objects.aggregate(last=Max('number'))['last'] or 0
+    return IndexGeneration.objects.create(number=last + 1)
+
+def calculate_tf_idf_for_corpus(full=False, staging=False, workers=1):
+    """Calcule le TF-IDF des livres nouveaux ou modifiés (tout le corpus si ``full``).
+
+    Construction en flux à mémoire bornée : les livres sont lus par paquets
+    via un curseur serveur, tokenisés une seule fois, et leurs statistiques
+    sont déversées dans des fichiers de run temporaires. Les DF des runs sont
+    ensuite fusionnées, puis les runs sont relus pour écrire le TF-IDF. Avec
+    ``workers`` > 1, la tokenisation se fait dans un pool de processus.
+
+    L'index n'est jamais vidé : chaque livre est remplacé dans sa propre
+    transaction et reste interrogeable pendant toute l'exécution. Avec
+    ``staging``, les postings de toute l'exécution passent par une seule
+    table UNLOGGED et sont basculés en une transaction à la fin.
+
+    Les DF (Term) ne sont écrites qu'une fois les postings en place, par
+    agrégation sur Posting : un livre dont l'écriture échoue, ou une
+    exécution interrompue, ne les fausse pas. En mode incrémental, seules
+    les DF des termes touchés sont recalculées ; l'IDF des autres termes
+    (qui dépend aussi du nombre total de livres) est rafraîchi par
+    ``--recompute-only``.
+    """
+    mode = "complet" if full else "incrémental"
+    logging.info(f"Début du calcul TF-IDF pour le corpus (mode {mode})...")
+    generation = start_generation()
+
+    # Livres indexés dont le texte a disparu
+    dropped_book_ids = list(
+        Book.objects.filter(text_content__isnull=True, indexed_generation__isnull=False).values_list('id', flat=True)
+    )
+
+    with tempfile.TemporaryDirectory(prefix='tfidf_runs_') as run_dir:
+        # Étape 1: Extraire les mots de chaque livre (une seule tokenisation)
+        logging.info("Étape 1: Extraction des mots des livres à indexer...")
+        runs, books_to_index, reindexed_book_ids = tokenize_corpus_into_runs(
+            run_dir, iter_books_with_content(full=full), workers=workers
+        )
+        total_books = Book.objects.filter(text_content__isnull=False).count()
+
+        logging.info(f"{books_to_index} livres à indexer répartis dans {len(runs)} runs, {len(dropped_book_ids)} à retirer")
+
+        # Fusion des fréquences documentaires
+        new_doc_frequency = merge_doc_frequencies([df_path for _, df_path in runs])
+
+        if full:
+            doc_frequency = new_doc_frequency
+            touched_words = None
+        else:
+            delta = Counter(new_doc_frequency)
+            delta.subtract(indexed_doc_frequency(reindexed_book_ids + dropped_book_ids))
+            doc_frequency = doc_frequency_with_delta(delta)
+            touched_words = sorted(delta)
+        logging.info(f"DF calculée pour {len(doc_frequency)} mots")
+
+        if dropped_book_ids:
+            remove_book_from_index(dropped_book_ids)
+
+        # Étape 2: Calculer TF-IDF pour chaque livre à partir des runs
+        logging.info("Étape 2: Calcul du TF-IDF...")
+        # Avec staging : une seule table de transit pour toute l'exécution, basculée à la fin
+        with (StagingTable(Posting, POSTING_COLUMNS) if staging else nullcontext()) as stage:
+            saved_books = {}
+            for books_path, _ in runs:
+                for book_id, title, fingerprint, terms in iter_run_records(books_path):
+                    book_fields = save_book_tfidf(
+                        book_id, title, fingerprint, terms, doc_frequency, total_books, generation, stage
+                    )
+                    if book_fields is not None:
+                        saved_books[book_id] = book_fields
+            if stage is not None:
+                merge_staged_books(stage, saved_books)
+
+        # Étape 3: DF recalculées depuis les postings écrits, puis répercutées sur l'IDF
+        logging.info("Étape 3: Mise à jour des DF et de l'IDF des termes touchés...")
+        term_count = refresh_term_table_from_index(touched_words)
+        logging.info(f"DF enregistrée pour {term_count} mots")
+        failed_books = books_to_index - len(saved_books)
+        if failed_books:
+            logging.warning(f"{failed_books} livres non enregistrés : IDF recalculé pour tous les termes concernés")
+        if touched_words is not None or failed_books:
+            refresh_idf_for_words(touched_words if touched_words is not None else sorted(doc_frequency), total_books)
+
+    generation.finished_at = timezone.now()
+    generation.books_indexed = books_to_index
+    generation.save(update_fields=['finished_at', 'books_indexed'])
+
     connection.close()
-    logging.info("Calcul TF-IDF terminé pour tout le corpus.")
+    logging.info(f"Calcul TF-IDF terminé (génération {generation.number}).")
+
+def refresh_term_table_from_index(words=None):
+    """Recalcule les DF de Term par agrégation SQL sur Posting (toutes, ou celles de ``words``).
+
+    Renvoie le nombre de mots de Term (de ``words`` s'il est donné).
+    """
+    forward_table = Posting._meta.db_table
+    term_table = Term._meta.db_table
+    if words is None:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {term_table} (word, document_frequency)
+                SELECT word, COUNT(*) FROM {forward_table} GROUP BY word
+                ON CONFLICT (word) DO UPDATE SET document_frequency = EXCLUDED.document_frequency
+                """
+            )
+            cursor.execute(
+                f"""
+                DELETE FROM {term_table} AS t
+                WHERE NOT EXISTS (SELECT 1 FROM {forward_table} AS fi WHERE fi.word = t.word)
+                """
+            )
+            return Term.objects.count()
+
+    term_count = 0
+    for batch in iter_batches(words):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {term_table} (word, document_frequency)
+                SELECT word, COUNT(*) FROM {forward_table} WHERE word = ANY(%s) GROUP BY word
+                ON CONFLICT (word) DO UPDATE SET document_frequency = EXCLUDED.document_frequency
+                """,
+                [batch],
+            )
+            cursor.execute(
+                f"""
+                DELETE FROM {term_table} AS t
+                WHERE t.word = ANY(%s)
+                AND NOT EXISTS (SELECT 1 FROM {forward_table} AS fi WHERE fi.word = t.word)
+                """,
+                [batch],
+            )
+        term_count += Term.objects.filter(word__in=batch).count()
+    return term_count
+
+def recompute_tfidf_for_books(cursor, book_ids, total_books):
+    """Met à jour TF, IDF et TF-IDF de tous les termes d'un lot de livres en une requête"""
+    forward_table = Posting._meta.db_table
+    cursor.execute(
+        f"""
+        WITH totals AS (
+            SELECT book_id, SUM(occurrences_count) AS total
+            FROM {forward_table}
+            WHERE book_id = ANY(%s)
+            GROUP BY book_id
+        )
+        UPDATE {forward_table} AS fi
+        SET tf = fi.occurrences_count::float / totals.total,
+            idf = LN(%s::float / t.document_frequency),
+            tfidf = (fi.occurrences_count::float / totals.total) * LN(%s::float / t.document_frequency)
+        FROM totals, {Term._meta.db_table} AS t
+        WHERE fi.book_id = totals.book_id AND t.word = fi.word AND totals.total > 0
+        """,
+        [book_ids, total_books, total_books],
+    )
+    return cursor.rowcount
+
+def refresh_minhash_signatures(batch_size=MINHASH_BATCH_SIZE):
+    """Recalcule la signature MinHash de chaque livre indexé depuis ses postings"""
+    postings = Posting.objects.order_by('book_id').values_list('book_id', 'word').iterator(chunk_size=10000)
+    books = []
+    updated = 0
+    for book_id, rows in groupby(postings, key=itemgetter(0)):
+        books.append(Book(id=book_id, minhash=encode_signature(signature(word for _, word in rows))))
+        if len(books) >= batch_size:
+            Book.objects.bulk_update(books, ['minhash'])
+            updated += len(books)
+            books = []
+    if books:
+        Book.objects.bulk_update(books, ['minhash'])
+        updated += len(books)
+    return updated
 
-def recompute_tfidf_for_existing_data():
-    """Recalcule le TF-IDF pour les données existantes sans réindexer"""
+def recompute_tfidf_for_existing_data(batch_size=RECOMPUTE_BOOK_BATCH):
+    """Recalcule le TF-IDF pour les données existantes sans réindexer.
+
+    Tout est ensembliste : les DF sont agrégées en SQL dans Term, puis TF, IDF
+    et TF-IDF sont mis à jour par un UPDATE par lot de ``batch_size`` livres.
+    Une nouvelle génération d'index est terminée à la fin : les index en
+    mémoire des serveurs rechargent les scores recalculés.
+    """
     logging.info("Recalcul du TF-IDF pour les données existantes...")
     
     # Compter le nombre total de documents
@@ -159,60 +487,59 @@ def recompute_tfidf_for_existing_data():
     if total_books == 0:
         logging.warning("Aucun livre trouvé !")
         return
+
+    generation = start_generation()
     
     # Calculer la fréquence documentaire (DF) pour chaque mot
     logging.info("Calcul de la fréquence documentaire...")
-    word_document_frequencies = {}
-    
-    # Compter dans combien de documents chaque mot apparaît
-    for word_stats in Index.objects.values('word').annotate(doc_count=Count('book', distinct=True)):
-        word_document_frequencies[word_stats['word']] = word_stats['doc_count']
-    
-    logging.info(f"Fréquence documentaire calculée pour {len(word_document_frequencies)} mots")
-    
-    # Mettre à jour les scores TF-IDF par livre
-    books_with_forward_index = Book.objects.filter(forwardindex__isnull=False).distinct()
+    start = time.monotonic()
+    term_count = refresh_term_table_from_index()
+    logging.info(f"Fréquence documentaire calculée pour {term_count} mots en {time.monotonic() - start:.1f}s")
     
-    for book in books_with_forward_index:
-        logging.info(f"Mise à jour TF-IDF pour: {book.title}")
-        
-        # Calculer le nombre total de mots dans ce livre
-        total_words_in_book = ForwardIndex.objects.filter(book=book).aggregate(
-            total=Sum('occurrences_count')
-        )['total'] or 1
-        
-        # Mettre à jour chaque terme du livre
-        forward_entries = ForwardIndex.objects.filter(book=book)
-        
-        for entry in forward_entries:
-            # Calcul TF
-            tf = entry.occurrences_count / total_words_in_book
-            
-            # Calcul IDF
-            documents_containing_word = word_document_frequencies.get(entry.word, 1)
-            idf = math.log(total_books / documents_containing_word)
-            
-            # Calcul TF-IDF
-            tf_idf = tf * idf
-            
-            # Mettre à jour l'entrée
-            entry.tf = tf
-            entry.idf = idf
-            entry.tfidf = tf_idf
-            entry.save()
+    # Mettre à jour les scores TF-IDF par lots de livres
+    book_ids = list(Posting.objects.values_list('book_id', flat=True).distinct().order_by('book_id'))
+    books_done = 0
+    rows_updated = 0
+    start = time.monotonic()
+
+    with connection.cursor() as cursor:
+        for batch in iter_batches(book_ids, batch_size):
+            with transaction.atomic():
+                rows_updated += recompute_tfidf_for_books(cursor, batch, total_books)
+            books_done += len(batch)
+
+            elapsed = max(time.monotonic() - start, 1e-6)
+            logging.info(
+                f"TF-IDF mis à jour : {books_done}/{len(book_ids)} livres, "
+                f"{rows_updated} lignes ({rows_updated / elapsed:,.0f} lignes/s)"
+            )
     
-    logging.info("Mise à jour TF-IDF terminée.")
+    logging.info(f"Mise à jour TF-IDF terminée en {time.monotonic() - start:.1f}s.")
+
+    start = time.monotonic()
+    signatures = refresh_minhash_signatures()
+    logging.info(f"Signatures MinHash recalculées pour {signatures} livres en {time.monotonic() - start:.1f}s.")
+
+    generation.finished_at = timezone.now()
+    generation.save(update_fields=['finished_at'])
+    logging.info(f"Recalcul terminé (génération {generation.number}).")
 
 if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description='Calculer TF-IDF pour le corpus')
     parser.add_argument('--recompute-only', action='store_true', 
-                       help='Ne recalculer que le TF-IDF sans réindexer')
+                       help='Ne recalculer que le TF-IDF et les signatures MinHash sans réindexer')
+    parser.add_argument('--full', action='store_true',
+                       help='Réindexer tous les livres, pas seulement les nouveaux ou modifiés')
+    parser.add_argument('--staging', action='store_true',
+                       help='Charger toute l\'exécution dans une table UNLOGGED de transit, basculée en une fois à la fin')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                       help='Nombre de processus de tokenisation (1 : dans le processus principal)')
     
     args = parser.parse_args()
     
     if args.recompute_only:
         recompute_tfidf_for_existing_data()
     else:
-        calculate_tf_idf_for_corpus()
\ No newline at end of file
+        calculate_tf_idf_for_corpus(full=args.full, staging=args.staging, workers=args.workers)
\ No newline at end of file
@@ -0,0 +1,118 @@
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import sys
+import os
+import time
+import django
+from itertools import islice
+from django.db import connection
+from tqdm import tqdm
+
+# Configurer Django
+logging.basicConfig(level=logging.INFO)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mygutenberg.settings')
+django.setup()
+from book.catalog import ENTRY_PARSERS, TextSource, iter_catalog
+from book.importer import AuthorResolver, is_importable, prepare_book_text, store_books
+
+# Nombre de processus de parsing par défaut
+DEFAULT_WORKERS = os.cpu_count() or 2
+# Livres insérés par transaction (les textes font jusqu'à 100 Ko chacun)
+BATCH_SIZE = 200
+
+# Source des textes, fixée une fois par processus worker
+text_source = None
+
+def init_worker(source):
+    global text_source
+    text_source = source
+
+# Parsing d'une entrée du catalogue dans un processus worker
+def load_entry(entry):
+    """Parse une notice du catalogue et lit le texte du livre.
+
+    Renvoie (book_data, texte tronqué) ou None si le livre n'est pas importable.
+    """
+    kind, payload = entry
+    try:
+        book_data = ENTRY_PARSERS[kind](payload)
+        if book_data is None or book_data['id'] not in text_source:
+            return None
+        raw_text = text_source.read(book_data['id'])
+    except Exception as e:
+        logging.error(f"Entrée du catalogue illisible ({kind}) : {e}")
+        return None
+
+    if raw_text is None:
+        return None
+    book_text, word_count = prepare_book_text(book_data, raw_text)
+    if not is_importable(book_data, book_text, word_count):
+        return None
+    return book_data, book_text
+
+def iter_batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def iter_loaded_batches(executor, entries, batch_size, workers):
+    """Lots de livres chargés par le pool ; le lot suivant est parsé pendant l'insertion du courant"""
+    chunksize = max(1, batch_size // (workers * 4))
+    pending = None
+    for batch in iter_batches(entries, batch_size):
+        results = executor.map(load_entry, batch, chunksize=chunksize)
+        if pending is not None:
+            yield [item for item in pending if item is not None]
+        pending = results
+    if pending is not None:
+        yield [item for item in pending if item is not None]
+
+def import_catalog(catalog_path, texts_path, workers=DEFAULT_WORKERS, batch_size=BATCH_SIZE, max_books=None):
+    """Importe Book et Author depuis un catalogue local, sans accès réseau"""
+    start = time.monotonic()
+    source = TextSource(texts_path)
+    logging.info(f"{len(source)} textes trouvés dans {texts_path}")
+
+    resolver = AuthorResolver()
+    total_books = 0
+
+    # Ne pas partager la connexion du parent avec les processus forkés
+    connection.close()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(source,)) as executor:
+        with tqdm(total=max_books, desc="Importing catalog") as pbar:
+            for entries in iter_loaded_batches(executor, iter_catalog(catalog_path), batch_size, workers):
+                if max_books is not None:
+                    entries = entries[:max_books - total_books]
+                try:
+                    books = store_books(entries, resolver)
+                except Exception as e:
+                    logging.error(f"Erreur lors de l'insertion d'un lot de {len(entries)} livres : {e}")
+                    continue
+
+                pbar.update(len(books))
+                total_books += len(books)
+                if max_books is not None and total_books >= max_books:
+                    executor.shutdown(cancel_futures=True)
+                    break
+
+    elapsed = time.monotonic() - start
+    logging.info(f"Import du catalogue terminé : {total_books} livres en {elapsed:.0f}s "
+                 f"({total_books / max(elapsed, 1e-9):.1f} livres/s)")
+    return total_books
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Importer les livres depuis un export local du catalogue Gutenberg")
+    parser.add_argument('--catalog', required=True,
+                        help='pg_catalog.csv, notice .rdf, répertoire de notices ou archive rdf-files (.tar.bz2/.zip)')
+    parser.add_argument('--texts', required=True,
+                        help='Répertoire de textes (miroir Gutenberg, .txt ou .zip) ou archive zip')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Nombre de processus de parsing')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Livres insérés par transaction')
+    parser.add_argument('--max-books', type=int, default=None, help='Nombre maximal de livres à importer')
+
+    args = parser.parse_args()
+    import_catalog(args.catalog, args.texts, args.workers, args.batch_size, args.max_books)
@@ -1,8 +1,11 @@
 from django.contrib import admin
-from .models import Author, Book, Index, ForwardIndex  # ajouter toutes les tables ici
+from .models import Author, Book, Index, ForwardIndex, Posting, Term, IndexGeneration  # ajouter toutes les tables ici
 
 # Enregistrement dans l'admin
 admin.site.register(Author)
 admin.site.register(Book)
 admin.site.register(Index)
 admin.site.register(ForwardIndex)
+admin.site.register(Posting)
+admin.site.register(Term)
+admin.site.register(IndexGeneration)
@@ -0,0 +1,115 @@
+"""
+Analyseur de texte partagé entre l'indexation et la recherche
+
+Les scripts d'indexation et les vues de recherche passent tous par ce module,
+ce qui garantit que les termes produits à l'indexation et à la requête sont
+identiques (minuscules, stopwords retirés, mots de moins de 3 lettres ignorés).
+
+Les listes de stopwords sont une copie du corpus ``stopwords`` de NLTK,
+livrée dans ``resources/stopwords`` : aucun téléchargement n'est nécessaire.
+"""
+
+import re
+from functools import lru_cache
+from pathlib import Path
+
+
+# Mappage des codes de langue aux listes de stopwords
+LANGUAGE_MAPPING = {
+    'en': 'english',
+    'fr': 'french',
+    'es': 'spanish',
+    'de': 'german',
+    'it': 'italian',
+}
+
+DEFAULT_LANGUAGE = 'en'
+
+# Les mots plus courts sont ignorés (à l'indexation comme à la requête)
+MIN_WORD_LENGTH = 3
+
+STOPWORDS_DIR = Path(__file__).resolve().parent / 'resources' / 'stopwords'
+
+# \w+ est équivalent à \b\w+\b (les bornes sont implicites) et plus rapide
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def primary_language(language_field):
+    """Première langue d'un champ Book.language ('en, fr' -> 'en')"""
+    if not language_field:
+        return DEFAULT_LANGUAGE
+    return language_field.split(',')[0].strip().lower() or DEFAULT_LANGUAGE
+
+
+@lru_cache(maxsize=None)
+def get_stopwords(language=DEFAULT_LANGUAGE):
+    """Stopwords d'une langue, lus une seule fois par processus"""
+    file_name = LANGUAGE_MAPPING.get(language, LANGUAGE_MAPPING[DEFAULT_LANGUAGE])
+    path = STOPWORDS_DIR / file_name
+    if not path.exists():
+        return frozenset()
+    return frozenset(path.read_text(encoding='utf-8').split())
+
+
+def iter_words_with_offsets(text, language=DEFAULT_LANGUAGE):
+    """Produit (mot, position, numéro) pour chaque mot indexable du texte.
+
+    La position est l'offset en caractères dans le texte original ; le numéro
+    compte tous les mots du texte, stopwords et mots courts compris : deux
+    mots sont à k mots l'un de l'autre quand leurs numéros diffèrent de k.
+    """
+    stop_words = get_stopwords(language)
+    lowered = text.lower()
+
+    # Chemin rapide : une seule mise en minuscules pour tout le texte, valable
+    # tant qu'elle ne change pas la longueur (sinon les offsets seraient décalés)
+    if len(lowered) == len(text):
+        for ordinal, match in enumerate(WORD_PATTERN.finditer(lowered)):
+            word = match.group()
+            if len(word) >= MIN_WORD_LENGTH and word not in stop_words:
+                yield word, match.start(), ordinal
+        return
+
+    for ordinal, match in enumerate(WORD_PATTERN.finditer(text)):
+        word = match.group().lower()
+        if len(word) >= MIN_WORD_LENGTH and word not in stop_words:
+            yield word, match.start(), ordinal
+
+
+def iter_words_with_positions(text, language=DEFAULT_LANGUAGE):
+    """Produit (mot, position) pour chaque mot indexable du texte.
+
+    La position est l'offset en caractères dans le texte original.
+    """
+    for word, position, _ in iter_words_with_offsets(text, language):
+        yield word, position
+
+
+def extract_words_with_positions(text, language=DEFAULT_LANGUAGE):
+    """Extrait les mots et leurs positions, filtre les stopwords"""
+    word_positions = {}
+    for word, position in iter_words_with_positions(text, language):
+        positions = word_positions.get(word)
+        if positions is None:
+            word_positions[word] = [position]
+        else:
+            positions.append(position)
+    return word_positions
+
+
+def extract_words_with_offsets(text, language=DEFAULT_LANGUAGE):
+    """Extrait les mots, leurs positions et leurs numéros : {mot: (positions, numéros)}"""
+    word_offsets = {}
+    for word, position, ordinal in iter_words_with_offsets(text, language):
+        offsets = word_offsets.get(word)
+        if offsets is None:
+            word_offsets[word] = ([position], [ordinal])
+        else:
+            offsets[0].append(position)
+            offsets[1].append(ordinal)
+    return word_offsets
+
+
+def analyze_query(query, language=DEFAULT_LANGUAGE):
+    """Termes d'une requête, dans l'ordre, analysés comme à l'indexation"""
+    return [word for word, _ in iter_words_with_positions(query, language)]
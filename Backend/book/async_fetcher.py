@@ -0,0 +1,181 @@
+"""
+Client HTTP asynchrone pour l'import du catalogue Gutenberg
+
+Un pool de connexions borné est partagé par toutes les requêtes, avec une
+limite de concurrence par hôte (gutendex.com et gutenberg.org sont limités
+séparément). Au lieu de pauses fixes, chaque hôte a un délai adaptatif :
+il augmente sur 429/503 (en respectant Retry-After) et redescend à chaque
+succès. Aucune dépendance à Django : testable contre un serveur HTTP local.
+"""
+
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+import aiohttp
+
+
+# Réponses indiquant que l'hôte demande de ralentir
+THROTTLE_STATUSES = {429, 503}
+# Erreurs serveur passagères : nouvel essai avec backoff, sans ralentir l'hôte
+TRANSIENT_STATUSES = {500, 502, 504}
+
+
+class HostThrottle:
+    """Concurrence maximale et espacement adaptatif des requêtes vers un hôte"""
+
+    def __init__(self, concurrency, min_delay=0.0, max_delay=60.0, initial_backoff=1.0):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_backoff = initial_backoff
+        self.delay = min_delay
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait_turn(self):
+        """Attend que l'espacement courant autorise le départ d'une nouvelle requête"""
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            wait = self._next_start - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_start = loop.time() + self.delay
+
+    def on_success(self):
+        # Décroissance multiplicative : on revient vite au débit nominal
+        self.delay = max(self.min_delay, self.delay / 2)
+        if self.delay < 0.01:
+            self.delay = self.min_delay
+
+    def on_throttled(self, retry_after=None):
+        loop = asyncio.get_running_loop()
+        self.delay = min(self.max_delay, max(self.delay * 2, self.initial_backoff, retry_after or 0))
+        self._next_start = max(self._next_start, loop.time() + self.delay)
+
+
+def parse_retry_after(value):
+    """Retry-After en secondes (la forme date HTTP est ignorée)"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class AsyncFetcher:
+    """Session aiohttp avec pool borné, limites par hôte et backoff adaptatif.
+
+    À utiliser comme gestionnaire de contexte asynchrone::
+
+        async with AsyncFetcher(concurrency=20, per_host=4) as fetcher:
+            async for page in fetcher.iter_pages(url):
+                ...
+    """
+
+    def __init__(self, concurrency=20, per_host=4, timeout=30, max_retries=5,
+                 max_delay=60.0, initial_backoff=1.0):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_delay = max_delay
+        self.initial_backoff = initial_backoff
+        self.session = None
+        self._throttles = {}
+        # Pages préchargées par iter_pages et pas encore consommées
+        self._prefetches = set()
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # Un parcours interrompu peut laisser une page en cours de téléchargement :
+        # elle est annulée avant la fermeture de la session
+        prefetches = list(self._prefetches)
+        for task in prefetches:
+            task.cancel()
+        await asyncio.gather(*prefetches, return_exceptions=True)
+        await self.session.close()
+
+    def throttle_for(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._throttles:
+            self._throttles[host] = HostThrottle(
+                self.per_host, max_delay=self.max_delay, initial_backoff=self.initial_backoff
+            )
+        return self._throttles[host]
+
+    async def get(self, url, as_json=False):
+        """GET avec nouvelles tentatives ; renvoie le JSON ou le texte, None en cas d'échec"""
+        throttle = self.throttle_for(url)
+        backoff = self.initial_backoff
+
+        for attempt in range(1, self.max_retries + 1):
+            async with throttle.semaphore:
+                await throttle.wait_turn()
+                try:
+                    async with self.session.get(url) as response:
+                        if response.status == 200:
+                            throttle.on_success()
+                            if as_json:
+                                return await response.json(content_type=None)
+                            return await response.text(errors='replace')
+
+                        if response.status in THROTTLE_STATUSES:
+                            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                            throttle.on_throttled(retry_after)
+                            logging.warning(
+                                f"Status {response.status} pour {url}, délai de l'hôte porté à {throttle.delay:.1f}s "
+                                f"(tentative {attempt}/{self.max_retries})"
+                            )
+                            continue
+
+                        if response.status not in TRANSIENT_STATUSES:
+                            logging.warning(f"Status code {response.status} pour {url}")
+                            return None
+
+                        logging.warning(f"Status {response.status} pour {url} (tentative {attempt}/{self.max_retries})")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logging.error(f"Erreur requête (tentative {attempt}/{self.max_retries}) pour {url}: {e}")
+
+            # Erreur passagère : backoff exponentiel local à cette requête
+            if attempt < self.max_retries:
+                await asyncio.sleep(backoff)
+                backoff = min(self.max_delay, backoff * 2)
+
+        logging.error(f"Échec de la requête après {self.max_retries} tentatives : {url}")
+        return None
+
+    async def iter_pages(self, url):
+        """Parcourt les pages paginées (clé ``next``) en préchargeant la page suivante.
+
+        La page N+1 est téléchargée pendant que l'appelant traite la page N.
+        Un appelant qui s'arrête avant la fin doit fermer le générateur
+        (``contextlib.aclosing``) ; sinon le préchargement est annulé à la
+        sortie du gestionnaire de contexte.
+        """
+        pending = self._prefetch(url)
+        try:
+            while pending is not None:
+                page = await pending
+                pending = None
+                if not page:
+                    return
+                next_url = page.get('next')
+                if next_url:
+                    pending = self._prefetch(next_url)
+                yield page
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    def _prefetch(self, url):
+        task = asyncio.ensure_future(self.get(url, as_json=True))
+        self._prefetches.add(task)
+        task.add_done_callback(self._prefetches.discard)
+        return task
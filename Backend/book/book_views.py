@@ -3,17 +3,22 @@
 import re
 import logging
 import json
-import networkx as nx
-from fuzzywuzzy import fuzz
+import numpy as np
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import generics
 from rest_framework.pagination import PageNumberPagination
 from rest_framework import status
 from django.db.models import Q, Count, Sum, Avg
-from .models import Book, Index, ForwardIndex
+from .models import Book, Index, ForwardIndex, SimilarBook
 from .serializers import BookSerializer
-from nltk.tokenize import word_tokenize
+from .analyzer import analyze_query
+from .search_engine import get_index
+from .ranking import RankedResults
+from .similarity import NEIGHBOURS
+from .text_search import search_texts
+from .query import (Term as QueryTerm, evaluate, expand_fuzzy, parse_query, phrase_match_counts, positive_terms, proximity_scores,
+                    union)
 
 
 class CustomPagination(PageNumberPagination):
@@ -22,6 +27,28 @@ class CustomPagination(PageNumberPagination):
     max_page_size = 100
 
 
+def books_in_order(book_ids):
+    """Livres correspondant aux IDs, dans le même ordre (une requête + auteurs préchargés)"""
+    books = Book.objects.prefetch_related('authors').in_bulk(book_ids)
+    return [books[book_id] for book_id in book_ids if book_id in books]
+
+
+class LazyBookList:
+    """Livres d'une liste d'IDs classée ; seule la tranche demandée (une page) est lue en base"""
+
+    def __init__(self, book_ids):
+        self.book_ids = book_ids
+
+    def __len__(self):
+        return len(self.book_ids)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            item = range(len(self))[item]
+            return self[item:item + 1][0]
+        return books_in_order([int(book_id) for book_id in self.book_ids[item]])
+
+
 # Liste des livres avec pagination
 class BookListView(generics.ListAPIView):
     queryset = Book.objects.all().order_by('-download_count')  # Tri par popularité
@@ -41,62 +68,80 @@ class BookDetailView(APIView):
 
 class BookSearchView(generics.ListAPIView):
     """
-    Recherche SIMPLE par mot-clé
-    - Utilise l'index inversé
-    - Calcule Jaccard + PageRank
+    Recherche SIMPLE par mots-clés
+    - Requêtes booléennes : ET implicite, AND, OR, NOT / -mot, parenthèses
+    - Phrases exactes entre guillemets ("old man"), vérifiées sur les positions
+    - Proximité : whale NEAR/10 captain ; ?proximity=true favorise les livres
+      où les termes de la requête sont proches (plus petit intervalle)
+    - Fautes de frappe : un terme absent du vocabulaire est étendu aux termes
+      à 1-2 fautes près (?fuzzy=true : tous les termes, ?fuzzy=false : aucun)
+    - ?ranking=bm25 : classement BM25, seul le top de la page demandée est calculé
+    - Utilise l'index inversé résident en mémoire (search_engine)
+    - PageRank du graphe de Jaccard lu dans Book.pagerank (calculé hors ligne)
+    - Livres similaires par MinHash/LSH (index en mémoire), lus en une requête par page
     """
     serializer_class = BookSerializer
     pagination_class = CustomPagination  
 
     def get_queryset(self):
+        """IDs des livres correspondants, triés par popularité (sans requête sur l'index)"""
         query = self.request.query_params.get("q", "").strip().lower()
         author = self.request.query_params.get("author", "").strip().lower()
         
         if not query and not author:
-            return Book.objects.none()
+            return []
 
-        # Filtrer par mot-clé dans l'index
-        indexed_books = Index.objects.filter(word=query).select_related("book")
-        book_ids_by_keyword = indexed_books.values_list("book_id", flat=True).distinct()
+        index = get_index()
+        tree = self.query_tree(index)
+        if tree is None:
+            return []
 
-        # Filtrer par auteur si spécifié
+        # Les livres de l'auteur sont une liste de postings de plus dans l'évaluation
+        books_by_author = None
         if author:
-            books_by_author = Book.objects.filter(
-                authors__name__icontains=author
-            ).values_list("id", flat=True).distinct()
-        else:
-            books_by_author = Book.objects.values_list("id", flat=True).distinct()
-
-        # Combiner les filtres
-        book_ids = set(book_ids_by_keyword) & set(books_by_author)
-        
-        return Book.objects.filter(id__in=book_ids).order_by("-download_count")
-
-    def jaccard_similarity(self, set1, set2):
-        """Calcul de la similarité de Jaccard entre deux ensembles."""
-        intersection = len(set1 & set2)
-        union = len(set1 | set2)
-        return intersection / union if union != 0 else 0
-
-    def get_similar_books_from_graph(self, book, all_books):
-        """Retourne les voisins dans le graphe de Jaccard pour un livre donné."""
-        similar_books = []
-        book_keywords = set(Index.objects.filter(book_id=book.id).values_list('word', flat=True))
-        
-        # Limiter à 10 livres max pour performance
-        for other_book in all_books[:10]:
-            if book.id == other_book.id:
-                continue
-            other_book_keywords = set(Index.objects.filter(book_id=other_book.id).values_list('word', flat=True))
-            jaccard_score = self.jaccard_similarity(book_keywords, other_book_keywords)
-            
-            if jaccard_score > 0.1:
-                similar_books.append({
-                    "book": BookSerializer(other_book).data,
-                    "jaccard_similarity": jaccard_score
-                })
-        
-        return similar_books[:3]  # Max 3 livres similaires
+            books_by_author = np.unique(np.fromiter(
+                Book.objects.filter(authors__name__icontains=author).values_list("id", flat=True),
+                dtype=np.int64,
+            ))
+
+        book_ids = evaluate(tree, index, restrict=books_by_author)
+        if self.ranks_by_bm25() and positive_terms(tree):
+            return RankedResults(index, positive_terms(tree), book_ids)
+        words = self.proximity_words(tree)
+        boost = proximity_scores(words, index, book_ids) if words else None
+        return index.rank_by_downloads(book_ids, boost).tolist()
+
+    def query_tree(self, index):
+        """Requête booléenne (opérateurs en majuscules, donc lue avant la mise en minuscules),
+        termes inconnus étendus aux termes proches du vocabulaire"""
+        tree = parse_query(self.request.query_params.get("q", ""))
+        fuzzy = self.request.query_params.get("fuzzy", "").lower()
+        if fuzzy in ("0", "false", "no"):
+            return tree
+        return expand_fuzzy(tree, index, known_terms=fuzzy in ("1", "true", "yes"))
+
+    def ranks_by_bm25(self):
+        return self.request.query_params.get("ranking", "").lower() == "bm25"
+
+    def proximity_words(self, tree):
+        """Termes distincts pour le bonus de proximité (au moins deux), si demandé"""
+        if self.request.query_params.get("proximity", "").lower() not in ("1", "true", "yes"):
+            return []
+        words = list(dict.fromkeys(positive_terms(tree)))
+        return words if len(words) > 1 else []
+
+    def similar_books_for(self, index, book_ids):
+        """Livres similaires (MinHash/LSH) de chaque livre de la page, max 3 par livre"""
+        neighbours = {book_id: index.similar_books(book_id) for book_id in book_ids}
+        similar_ids = list(dict.fromkeys(other for pairs in neighbours.values() for other, _ in pairs))
+        books = {book.id: book for book in books_in_order(similar_ids)} if similar_ids else {}
+        return {
+            book_id: [
+                {"book": BookSerializer(books[other]).data, "jaccard_similarity": similarity}
+                for other, similarity in pairs if other in books
+            ]
+            for book_id, pairs in neighbours.items()
+        }
 
     def list(self, request, *args, **kwargs):
         query = request.query_params.get("q", "").strip().lower()
@@ -105,55 +150,177 @@ class BookSearchView(generics.ListAPIView):
         if not query and not author:
             return self.get_paginated_response([])
 
-        queryset = self.get_queryset()
-        page = self.paginate_queryset(queryset)
+        book_ids = self.paginate_queryset(self.get_queryset())
         
-        if not page:
+        if not book_ids:
             return self.get_paginated_response([])
-
-        # Récupération des occurrences
-        index_entries = Index.objects.filter(book_id__in=[book.id for book in page])
-        occurrences_dict = {}
-        for entry in index_entries:
-            if entry.book_id not in occurrences_dict:
-                occurrences_dict[entry.book_id] = 0
-            occurrences_dict[entry.book_id] += entry.occurrences_count
-
-        # Calcul du PageRank (simplifié)
-        pagerank_scores = {}
-        try:
-            pagerank_scores = compute_pagerank(page, index_entries) or {}
-        except Exception as e:
-            logging.warning(f"PageRank calculation failed: {e}")
+        page = books_in_order(book_ids)
+
+        # Occurrences des termes de la requête, lues dans l'index en mémoire
+        index = get_index()
+        tree = self.query_tree(index)
+        occurrences_dict = index.occurrences(positive_terms(tree), book_ids)
+        phrase_counts = phrase_match_counts(tree, index, book_ids)
+        proximity_words = self.proximity_words(tree)
+        proximity = {}
+        if proximity_words:
+            proximity = dict(zip(book_ids, proximity_scores(proximity_words, index, book_ids).tolist()))
+        bm25_scores = {}
+        if self.ranks_by_bm25():
+            bm25_scores = dict(zip(book_ids, index.bm25_scores(positive_terms(tree), book_ids).tolist()))
+        similar_books = self.similar_books_for(index, book_ids)
 
         # Construire les résultats
         results = []
         for book in page:
             book_data = BookSerializer(book).data
             book_data["occurrences_count"] = occurrences_dict.get(book.id, 0)
-            book_data["pagerank_score"] = pagerank_scores.get(book.id, 0)
-            
-            # Livres similaires (désactivé pour performance, réactiver si besoin)
-            book_data["similar_books"] = []
-            # book_data["similar_books"] = self.get_similar_books_from_graph(book, page)
+            book_data["pagerank_score"] = book.pagerank
+            if phrase_counts:
+                book_data["phrase_matches"] = phrase_counts.get(book.id, 0)
+            if proximity:
+                book_data["proximity_score"] = proximity.get(book.id, 0)
+            if bm25_scores:
+                book_data["bm25_score"] = bm25_scores.get(book.id, 0)
+            book_data["similar_books"] = similar_books.get(book.id, [])
             
             results.append(book_data)
 
-        # Trier par occurrences et PageRank
-        results = sorted(
-            results, 
-            key=lambda x: (x["occurrences_count"], x["pagerank_score"]), 
-            reverse=True
-        )
+        # Trier par occurrences et PageRank (la page BM25 est déjà dans l'ordre des scores)
+        if not bm25_scores:
+            results = sorted(
+                results, 
+                key=lambda x: (x["occurrences_count"], x["pagerank_score"]), 
+                reverse=True
+            )
+
+        return self.get_paginated_response(results)
+
+
+class BookTFIDFSearchView(generics.ListAPIView):
+    """
+    Recherche classée par TF-IDF
+    - Un terme : postings lus dans l'ordre par impact (TF-IDF décroissant), sans tri
+    - Plusieurs termes / opérateurs : livres de la requête booléenne, triés par
+      somme des TF-IDF
+    - tfidf_score, tf_score, idf_score et word_occurrences de la page : une
+      requête indexée sur (mot, livre)
+    """
+    serializer_class = BookSerializer
+    pagination_class = CustomPagination
+
+    def query_tree(self):
+        # Compatible avec une requête Django brute (test_direct_tfidf.py)
+        params = getattr(self.request, "query_params", self.request.GET)
+        return parse_query(params.get("q", ""))
+
+    def get_queryset(self):
+        """Livres triés par TF-IDF décroissant (séquence paresseuse pour la pagination)"""
+        tree = self.query_tree()
+        if tree is None:
+            return []
+
+        index = get_index()
+        if isinstance(tree, QueryTerm):
+            return LazyBookList(index.top_tfidf(tree.word))
+        return LazyBookList(index.rank_by_tfidf(positive_terms(tree), evaluate(tree, index)))
+
+    def list(self, request, *args, **kwargs):
+        tree = self.query_tree()
+        if tree is None:
+            return self.get_paginated_response([])
+
+        page = self.paginate_queryset(self.get_queryset())
+        if not page:
+            return self.get_paginated_response([])
+
+        # TF, IDF et TF-IDF enregistrés par fetch_tfidf.py, pour la page seulement
+        scores = {}
+        entries = ForwardIndex.objects.filter(
+            word__in=set(positive_terms(tree)), book_id__in=[book.id for book in page]
+        ).values_list("book_id", "tf", "idf", "tfidf", "occurrences_count")
+        for book_id, tf, idf, tfidf, occurrences in entries:
+            totals = scores.setdefault(book_id, [0.0, 0.0, 0.0, 0])
+            totals[0] += tf
+            totals[1] += idf
+            totals[2] += tfidf
+            totals[3] += occurrences
+
+        results = []
+        for book in page:
+            tf, idf, tfidf, occurrences = scores.get(book.id, (0.0, 0.0, 0.0, 0))
+            book_data = BookSerializer(book).data
+            book_data["tfidf_score"] = tfidf
+            book_data["tf_score"] = tf
+            book_data["idf_score"] = idf
+            book_data["word_occurrences"] = occurrences
+            results.append(book_data)
 
         return self.get_paginated_response(results)
 
 
+class BookSuggestView(APIView):
+    """
+    Autocomplétion des termes de recherche
+    - ?prefix= : début du mot en cours de saisie
+    - Termes du dictionnaire de l'index en mémoire, par nombre de livres décroissant
+    """
+    default_limit = 10
+    max_limit = 50
+
+    def get(self, request):
+        prefix = request.query_params.get("prefix", "").strip().lower()
+        try:
+            limit = min(int(request.query_params.get("limit", self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+
+        suggestions = get_index().complete(prefix, max(limit, 0)) if prefix else []
+        return Response({
+            "prefix": prefix,
+            "suggestions": [
+                {"term": term, "document_frequency": frequency} for term, frequency in suggestions
+            ],
+        })
+
+
+class BookSimilarView(APIView):
+    """
+    Livres similaires (« more like this »)
+    - Voisins précalculés par similarité cosinus des vecteurs TF-IDF
+      (Scripts/compute_similar_books.py), lus dans la table SimilarBook
+    - ?limit= : nombre de voisins (au plus NEIGHBOURS)
+    """
+
+    def get(self, request, pk):
+        try:
+            limit = min(int(request.query_params.get("limit", NEIGHBOURS)), NEIGHBOURS)
+        except ValueError:
+            limit = NEIGHBOURS
+
+        entries = list(
+            SimilarBook.objects.filter(book_id=pk)
+            .select_related("similar")
+            .prefetch_related("similar__authors")[:max(limit, 0)]
+        )
+        if not entries and not Book.objects.filter(pk=pk).exists():
+            return Response({"detail": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            "book_id": pk,
+            "similar_books": [
+                {"book": BookSerializer(entry.similar).data, "cosine_similarity": entry.similarity}
+                for entry in entries
+            ],
+        })
+
+
 class BookAdvancedSearchView(APIView):
     """
     Recherche AVANCÉE avec REGEX
     - Supporte expressions régulières
-    - Recherche dans text_content et index
+    - Recherche dans text_content (candidats préfiltrés par l'index, parcours
+      parallèle avec budget de temps) et dans le vocabulaire de l'index
     """
     pagination_class = CustomPagination
 
@@ -184,32 +351,19 @@ class BookAdvancedSearchView(APIView):
             ).distinct()[:max_results]
 
             # ✅ RECHERCHE 2: Regex dans le contenu (LIMITÉ pour performance)
-            # Ne chercher que dans les 50 premiers livres populaires
-            books_by_regex = Book.objects.filter(
-                Q(text_content__iregex=query)  # iregex = case insensitive
-            ).order_by('-download_count').distinct()[:50]
+            # Les 50 livres les plus populaires parmi les candidats préfiltrés par l'index,
+            # parcourus dans un pool de processus avec un budget de temps
+            index = get_index()
+            regex_book_ids, regex_complete = search_texts(query, index, limit=50)
+            books_by_regex = Book.objects.filter(id__in=regex_book_ids)
 
             # ✅ RECHERCHE 3: Dans l'index
-            # Chercher les mots qui matchent le pattern
-            indexed_books_qs = Index.objects.all()
-            matching_words = set()
+            # Tout le vocabulaire est couvert : filtre par trigrammes, puis vraie regex
+            matching_words = index.matching_terms(query)
             
-            # Compiler le pattern une fois
-            pattern = re.compile(query, re.IGNORECASE)
-            
-            # Chercher dans les 1000 mots les plus fréquents
-            for index_entry in indexed_books_qs[:1000]:
-                if pattern.search(index_entry.word):
-                    matching_words.add(index_entry.word)
-            
-            # Récupérer les livres contenant ces mots
+            # Récupérer les livres contenant ces mots (postings en mémoire)
             if matching_words:
-                indexed_books = Index.objects.filter(
-                    word__in=matching_words
-                ).values("book_id").annotate(
-                    occurrence_count=Count("id")
-                )
-                book_ids = [entry["book_id"] for entry in indexed_books]
+                book_ids = union([index.doc_ids_for(word) for word in matching_words]).tolist()
                 books_in_index = Book.objects.filter(id__in=book_ids)
             else:
                 books_in_index = Book.objects.none()
@@ -217,24 +371,8 @@ class BookAdvancedSearchView(APIView):
             # Fusionner les résultats
             books = (books_by_full_text | books_by_regex | books_in_index).distinct()
 
-            # Calculer PageRank
-            pagerank_scores = {}
-            try:
-                if books.count() > 0:
-                    index_for_books = Index.objects.filter(book_id__in=[b.id for b in books])
-                    pagerank_scores = compute_pagerank(books, index_for_books) or {}
-            except Exception as e:
-                logging.warning(f"PageRank calculation failed: {e}")
-
-            # Calculer scores
-            book_scores = {book.id: pagerank_scores.get(book.id, 0) for book in books}
-
-            # Trier par score
-            sorted_books = sorted(
-                books, 
-                key=lambda book: book_scores.get(book.id, 0), 
-                reverse=True
-            )
+            # Trier par PageRank (colonne précalculée, voir Scripts/compute_pagerank.py)
+            sorted_books = books.order_by('-pagerank', 'id')
 
             # Pagination
             paginator = CustomPagination()
@@ -244,12 +382,15 @@ class BookAdvancedSearchView(APIView):
                 results = []
                 for book in result_page:
                     book_data = BookSerializer(book).data
-                    book_data["pagerank_score"] = pagerank_scores.get(book.id, 0)
+                    book_data["pagerank_score"] = book.pagerank
                     book_data["occurrences_count"] = 0  # Peut être calculé si besoin
                     book_data["similar_books"] = []
                     results.append(book_data)
                 
-                return paginator.get_paginated_response(results)
+                response = paginator.get_paginated_response(results)
+                # Parcours des textes interrompu par le budget de temps : résultats partiels
+                response.data["text_scan_complete"] = regex_complete
+                return response
 
             return Response(
                 {"detail": "No results found."}, 
@@ -280,24 +421,32 @@ class BookHighlightSearchView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        terms = analyze_query(query)
+        if not terms:
+            return Response(
+                {"detail": "No results found."}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        # Le surlignage porte sur le premier terme analysé
+        query = terms[0]
+
         try:
-            # Chercher dans l'index
-            indexed_books = Index.objects.filter(word=query).select_related("book")
-            book_ids = indexed_books.values_list("book_id", flat=True).distinct()
-            books = Book.objects.filter(id__in=book_ids).order_by('-download_count')
+            # Chercher dans l'index en mémoire
+            index = get_index()
+            book_ids = index.rank_by_downloads(index.doc_ids_for(query)).tolist()
 
             # Pagination
             paginator = CustomPagination()
-            result_page = paginator.paginate_queryset(books, request)
+            result_page = paginator.paginate_queryset(book_ids, request)
             
             if result_page is not None:
-                serialized_books = BookSerializer(result_page, many=True).data
-                highlighted_books = self.highlight_words(serialized_books, query)
+                serialized_books = BookSerializer(books_in_order(result_page), many=True).data
+                highlighted_books = self.highlight_words(serialized_books, query, index)
                 return paginator.get_paginated_response(highlighted_books)
 
-            if books:
-                serialized_books = BookSerializer(books, many=True).data
-                highlighted_books = self.highlight_words(serialized_books, query)
+            if book_ids:
+                serialized_books = BookSerializer(books_in_order(book_ids), many=True).data
+                highlighted_books = self.highlight_words(serialized_books, query, index)
                 return Response(highlighted_books)
             else:
                 return Response(
@@ -312,22 +461,13 @@ class BookHighlightSearchView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    def highlight_words(self, books, query):
+    def highlight_words(self, books, query, index=None):
         """Ajoute des balises <mark> autour du mot recherché"""
+        index = index or get_index()
         for book in books:
             try:
-                index_entries = Index.objects.filter(book_id=book['id'], word=query)
-                positions = []
-                
-                for entry in index_entries:
-                    try:
-                        entry_positions = entry.get_positions()
-                        positions.extend(entry_positions)
-                    except Exception as e:
-                        logging.warning(f"Error getting positions: {e}")
-                        continue
-                
-                positions = sorted(set(positions))[:50]  # Max 50 occurrences
+                # Positions triées et uniques dans l'index
+                positions = index.positions(query, book['id'])[:50].tolist()  # Max 50 occurrences
                 
                 text_content = book['text_content']
                 highlighted_text = self.apply_highlight(text_content, positions, query)
@@ -365,45 +505,3 @@ class BookHighlightSearchView(APIView):
         highlighted_text += text[last_pos:last_pos+100] + "..."
         
         return highlighted_text
-
-
-def compute_pagerank(books, index_entries):
-    """Calcule le PageRank basé sur la similarité Jaccard"""
-    try:
-        G = nx.Graph()
-
-        book_ids = {book.id for book in books}
-        for book_id in book_ids:
-            G.add_node(book_id)
-
-        # Construire les ensembles de mots
-        book_word_sets = {}
-        for book_id in book_ids:
-            words = set()
-            for entry in index_entries:
-                if entry.book_id == book_id:
-                    words.add(entry.word)
-            book_word_sets[book_id] = words
-
-        # Ajouter arêtes basées sur Jaccard
-        for book1 in book_ids:
-            for book2 in book_ids:
-                if book1 < book2:  # Éviter doublons
-                    intersection = book_word_sets[book1] & book_word_sets[book2]
-                    union = book_word_sets[book1] | book_word_sets[book2]
-                    
-                    if union:
-                        jaccard_similarity = len(intersection) / len(union)
-                        if jaccard_similarity > 0.1:  # Seuil
-                            G.add_edge(book1, book2, weight=jaccard_similarity)
-
-        # Calculer PageRank
-        if G.number_of_nodes() > 0:
-            pagerank_scores = nx.pagerank(G, weight='weight')
-            return pagerank_scores
-        
-        return {}
-        
-    except Exception as e:
-        logging.error(f"PageRank error: {e}")
-        return {}
\ No newline at end of file
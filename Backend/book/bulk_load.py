@@ -0,0 +1,133 @@
+"""
+Chargement en masse de l'index via COPY (PostgreSQL)
+
+Les scripts d'indexation produisent des millions de lignes ; bulk_create
+construit une instance Django par terme et génère des INSERT volumineux.
+Ici les lignes sont écrites au format texte de COPY dans un tampon mémoire
+puis envoyées telles quelles au serveur.
+"""
+
+import io
+from array import array
+import logging
+import uuid
+
+from django.db import connection, transaction
+
+
+# Colonnes de Posting écrites par les scripts d'indexation
+POSTING_COLUMNS = ('word', 'book_id', 'occurrences_count', 'positions', 'ordinals', 'tf', 'idf', 'tfidf')
+
+# Caractères à échapper dans le format texte de COPY
+_COPY_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+
+
+def supports_copy():
+    """COPY n'est disponible qu'avec PostgreSQL"""
+    return connection.vendor == 'postgresql'
+
+
+def format_copy_value(value):
+    """Convertit une valeur Python en champ du format texte de COPY"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, (list, tuple, array)):
+        # Listes d'entiers (positions) : JSON sans passer par json.dumps
+        return '[' + ','.join(map(str, value)) + ']'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '\\\\x' + bytes(value).hex()
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def build_copy_buffer(rows):
+    """Construit le tampon mémoire (une ligne par tuple, champs séparés par des tabulations)"""
+    buffer = io.StringIO()
+    write = buffer.write
+    for row in rows:
+        write('\t'.join(map(format_copy_value, row)))
+        write('\n')
+    buffer.seek(0)
+    return buffer
+
+
+def copy_rows(table, columns, rows, cursor=None):
+    """Envoie les lignes dans ``table`` par COPY FROM STDIN et renvoie leur nombre"""
+    buffer = build_copy_buffer(rows)
+    if buffer.getvalue() == '':
+        return 0
+
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    if cursor is None:
+        with connection.cursor() as cursor:
+            cursor.copy_expert(sql, buffer)
+            return cursor.rowcount
+    cursor.copy_expert(sql, buffer)
+    return cursor.rowcount
+
+
+def replace_book_rows(model, columns, rows, book_ids):
+    """Remplace les lignes de ``book_ids`` dans la table de ``model`` par ``rows``.
+
+    Les lignes sont copiées directement dans la table après suppression des
+    anciennes, dans une seule transaction.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        model.objects.filter(book_id__in=book_ids).delete()
+        return copy_rows(model._meta.db_table, columns, rows, cursor=cursor)
+
+
+class StagingTable:
+    """Table UNLOGGED de transit pour toute une exécution d'indexation.
+
+    La table est créée une fois à l'entrée du bloc ``with`` ; les lignes de
+    chaque livre y sont ajoutées par un simple COPY (pas de DDL ni de
+    suppression par livre, pas de WAL ni d'index à maintenir). ``merge``
+    bascule ensuite tous les livres d'un coup : suppression de leurs
+    anciennes lignes et INSERT ... SELECT depuis la table de transit, dans la
+    transaction de l'appelant. La table est supprimée à la sortie du bloc.
+    """
+
+    def __init__(self, model, columns):
+        self.model = model
+        self.columns = columns
+        self.table = f"{model._meta.db_table}_staging_{uuid.uuid4().hex[:8]}"
+        self.book_ids = []
+
+    def __enter__(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE UNLOGGED TABLE {self.table} AS "
+                f"SELECT {', '.join(self.columns)} FROM {self.model._meta.db_table} WITH NO DATA"
+            )
+        return self
+
+    def __exit__(self, *exc_info):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def add(self, rows, book_ids):
+        """Met en transit les lignes (nouvelles) des livres ``book_ids``"""
+        count = copy_rows(self.table, self.columns, rows)
+        self.book_ids.extend(book_ids)
+        return count
+
+    def merge(self):
+        """Remplace les lignes de tous les livres mis en transit ; renvoie le nombre de lignes insérées"""
+        table = self.model._meta.db_table
+        column_list = ', '.join(self.columns)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table} WHERE book_id = ANY(%s)", [self.book_ids])
+            cursor.execute(f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {self.table}")
+            inserted = cursor.rowcount
+
+        logging.debug(f"{inserted} lignes basculées depuis {self.table} ({len(self.book_ids)} livres)")
+        return inserted
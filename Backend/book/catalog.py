@@ -0,0 +1,282 @@
+"""
+Lecture d'un export local du catalogue Project Gutenberg
+
+Deux formats de catalogue sont acceptés :
+
+- ``pg_catalog.csv`` (colonnes Text#, Type, Title, Language, Authors...) ;
+- les notices RDF (``pg<id>.rdf``) : fichier seul, répertoire, ou archive
+  ``rdf-files.tar.bz2`` / ``.zip`` lue en flux.
+
+Les textes viennent d'un répertoire (miroir Gutenberg : ``<id>-0.txt``,
+``pg<id>.txt``, ``<id>-8.zip``...) ou d'une grande archive zip. Les livres
+sont produits au format de l'API gutendex pour passer par book.importer.
+Aucune dépendance à Django : les fonctions tournent dans des processus workers.
+"""
+
+import csv
+import io
+import os
+import re
+import tarfile
+import zipfile
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+
+RDF_NS = {
+    'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'dcterms': 'http://purl.org/dc/terms/',
+    'dcam': 'http://purl.org/dc/dcam/',
+    'pgterms': 'http://www.gutenberg.org/2009/pgterms/',
+}
+RDF_ABOUT = f"{{{RDF_NS['rdf']}}}about"
+RDF_RESOURCE = f"{{{RDF_NS['rdf']}}}resource"
+LCSH = 'http://purl.org/dc/terms/LCSH'
+
+# Séparateur des champs multivalués de pg_catalog.csv
+CSV_SEPARATOR = '; '
+
+# "Dickens, Charles, 1812-1870 [Editor]" -> nom, naissance, décès
+AUTHOR_ROLE = re.compile(r'\s*\[[^\]]*\]$')
+AUTHOR_DATES = re.compile(r'^(?P<name>.*?),\s*(?P<birth>[^,-]*)-(?P<death>[^,-]*)$')
+YEAR = re.compile(r'(\d+)\s*(BCE?)?')
+
+# <id>-0.txt (UTF-8), <id>-8.txt (latin-1), <id>.txt (ASCII), pg<id>.txt (UTF-8), ou .zip
+TEXT_FILE_PATTERN = re.compile(r'(?:^|/)(?P<pg>pg)?(?P<id>\d+)(?P<variant>-0|-8)?\.(?P<ext>txt|zip)$')
+
+
+def parse_year(text):
+    match = YEAR.search(text or '')
+    if not match:
+        return None
+    year = int(match.group(1))
+    return -year if match.group(2) else year
+
+
+def parse_author(value):
+    """Auteur au format gutendex depuis une entrée de la colonne Authors"""
+    value = AUTHOR_ROLE.sub('', value.strip())
+    match = AUTHOR_DATES.match(value)
+    if not match:
+        return {'name': value, 'birth_year': None, 'death_year': None}
+    return {
+        'name': match.group('name').strip(),
+        'birth_year': parse_year(match.group('birth')),
+        'death_year': parse_year(match.group('death')),
+    }
+
+
+def split_field(value):
+    return [item.strip() for item in (value or '').split(CSV_SEPARATOR) if item.strip()]
+
+
+def book_from_csv_row(row):
+    """Livre gutendex depuis une ligne de pg_catalog.csv (None si ce n'est pas un texte)"""
+    if row.get('Type', 'Text') != 'Text' or not row.get('Text#', '').isdigit():
+        return None
+    return {
+        'id': int(row['Text#']),
+        'title': ' '.join(row.get('Title', '').split()),
+        'languages': split_field(row.get('Language')),
+        'authors': [parse_author(author) for author in split_field(row.get('Authors'))],
+        'subjects': split_field(row.get('Subjects')),
+        'bookshelves': split_field(row.get('Bookshelves')),
+        'formats': {},
+        'download_count': 0,
+        'copyright': False,
+    }
+
+
+def _rdf_values(element, path):
+    return [value.text.strip() for value in element.iterfind(path, RDF_NS) if value.text and value.text.strip()]
+
+
+def _rdf_text(element, path):
+    values = _rdf_values(element, path)
+    return values[0] if values else None
+
+
+def book_from_rdf(data):
+    """Livre gutendex depuis une notice RDF (octets), None si ce n'est pas un texte"""
+    root = ET.fromstring(data)
+    ebook = root.find('pgterms:ebook', RDF_NS)
+    if ebook is None:
+        return None
+
+    book_type = _rdf_text(ebook, 'dcterms:type/rdf:Description/rdf:value')
+    if book_type not in (None, 'Text'):
+        return None
+
+    book_id = ebook.get(RDF_ABOUT, '').rsplit('/', 1)[-1]
+    if not book_id.isdigit():
+        return None
+
+    authors = []
+    for agent in ebook.iterfind('dcterms:creator/pgterms:agent', RDF_NS):
+        name = _rdf_text(agent, 'pgterms:name')
+        if name:
+            authors.append({
+                'name': name,
+                'birth_year': parse_year(_rdf_text(agent, 'pgterms:birthdate')),
+                'death_year': parse_year(_rdf_text(agent, 'pgterms:deathdate')),
+            })
+
+    subjects = []
+    for description in ebook.iterfind('dcterms:subject/rdf:Description', RDF_NS):
+        member_of = description.find('dcam:memberOf', RDF_NS)
+        if member_of is None or member_of.get(RDF_RESOURCE) == LCSH:
+            subjects.extend(_rdf_values(description, 'rdf:value'))
+
+    formats = {}
+    for file_element in ebook.iterfind('dcterms:hasFormat/pgterms:file', RDF_NS):
+        for mime_type in _rdf_values(file_element, 'dcterms:format/rdf:Description/rdf:value'):
+            formats.setdefault(mime_type, file_element.get(RDF_ABOUT))
+
+    rights = _rdf_text(ebook, 'dcterms:rights') or ''
+    downloads = _rdf_text(ebook, 'pgterms:downloads')
+    return {
+        'id': int(book_id),
+        'title': ' '.join((_rdf_text(ebook, 'dcterms:title') or '').split()),
+        'languages': _rdf_values(ebook, 'dcterms:language/rdf:Description/rdf:value'),
+        'authors': authors,
+        'subjects': sorted(subjects),
+        'bookshelves': _rdf_values(ebook, 'pgterms:bookshelf/rdf:Description/rdf:value'),
+        'summaries': _rdf_values(ebook, 'pgterms:marc520'),
+        'formats': formats,
+        'download_count': int(downloads) if downloads and downloads.isdigit() else 0,
+        'copyright': rights.lower().startswith('copyright'),
+    }
+
+
+# Nom du format -> fonction de parsing d'une entrée (exécutée dans un worker)
+ENTRY_PARSERS = {
+    'csv': book_from_csv_row,
+    'rdf': book_from_rdf,
+}
+
+
+def _iter_rdf_archive(path):
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                if name.endswith('.rdf'):
+                    yield 'rdf', archive.read(name)
+        return
+
+    # Lecture en flux : l'archive officielle contient ~70 000 notices
+    with tarfile.open(path, 'r|*') as archive:
+        for member in archive:
+            if member.isfile() and member.name.endswith('.rdf'):
+                yield 'rdf', archive.extractfile(member).read()
+
+
+def iter_catalog(path):
+    """Produit les entrées brutes (format, données) du catalogue, sans les parser.
+
+    Le parsing (RDF surtout) est laissé aux workers : le lecteur reste séquentiel
+    et léger.
+    """
+    path = Path(path)
+    if path.is_dir():
+        for rdf_path in sorted(path.rglob('*.rdf')):
+            yield 'rdf', rdf_path.read_bytes()
+    elif path.suffix == '.rdf':
+        yield 'rdf', path.read_bytes()
+    elif path.suffix == '.csv':
+        with open(path, newline='', encoding='utf-8') as catalog_file:
+            for row in csv.DictReader(catalog_file):
+                yield 'csv', row
+    else:
+        yield from _iter_rdf_archive(path)
+
+
+def _variant_rank(match):
+    # Préférence : UTF-8, puis ASCII, puis latin-1 ; un .txt avant un .zip
+    if match.group('variant') == '-0' or match.group('pg'):
+        rank = 0
+    elif match.group('variant') == '-8':
+        rank = 2
+    else:
+        rank = 1
+    return rank, match.group('ext') == 'zip'
+
+
+def decode_text(data, latin1=False):
+    if not latin1:
+        try:
+            return data.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            pass
+    return data.decode('latin-1')
+
+
+class TextSource:
+    """Textes des livres dans un répertoire ou une archive zip, indexés par ID Gutenberg.
+
+    Picklable : les archives ouvertes ne sont pas transmises aux workers,
+    chaque processus rouvre les siennes à la demande.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.archive_path = None if self.path.is_dir() else self.path
+        self.files = {}
+        self._archives = {}
+
+        ranks = {}
+        for name in self._iter_names():
+            match = TEXT_FILE_PATTERN.search(name)
+            if not match:
+                continue
+            book_id = int(match.group('id'))
+            rank = _variant_rank(match)
+            if book_id not in ranks or rank < ranks[book_id]:
+                ranks[book_id] = rank
+                self.files[book_id] = (name, match.group('variant') == '-8')
+
+    def _iter_names(self):
+        if self.archive_path is not None:
+            yield from self._archive(self.archive_path).namelist()
+            return
+        for directory, _, file_names in os.walk(self.path):
+            for file_name in file_names:
+                yield os.path.relpath(os.path.join(directory, file_name), self.path).replace(os.sep, '/')
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_archives'] = {}
+        return state
+
+    def __contains__(self, book_id):
+        return book_id in self.files
+
+    def __len__(self):
+        return len(self.files)
+
+    def _archive(self, path):
+        if path not in self._archives:
+            self._archives[path] = zipfile.ZipFile(path)
+        return self._archives[path]
+
+    def _read_bytes(self, name):
+        if self.archive_path is not None:
+            data = self._archive(self.archive_path).read(name)
+        else:
+            data = (self.path / name).read_bytes()
+        if not name.endswith('.zip'):
+            return data
+
+        # Archive d'un seul livre (miroir Gutenberg) : premier .txt qu'elle contient
+        with zipfile.ZipFile(io.BytesIO(data)) as book_archive:
+            for member in book_archive.namelist():
+                if member.endswith('.txt'):
+                    return book_archive.read(member)
+        return None
+
+    def read(self, book_id):
+        """Texte du livre, ou None s'il n'est pas disponible"""
+        if book_id not in self.files:
+            return None
+        name, latin1 = self.files[book_id]
+        data = self._read_bytes(name)
+        return None if data is None else decode_text(data, latin1)
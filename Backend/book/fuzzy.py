@@ -0,0 +1,98 @@
+"""
+Correspondance approchée des termes (fautes de frappe)
+
+Index de suppressions symétriques (SymSpell) sur le vocabulaire de l'index en
+mémoire : deux mots à distance d'édition au plus d deviennent identiques en
+supprimant au plus d caractères de chacun. Pour chaque terme, toutes les
+variantes obtenues en supprimant 0 à MAX_DISTANCE caractères de son préfixe
+(PREFIX_LENGTH caractères) sont précalculées, sous forme de hachages 32 bits
+triés ; une requête calcule les mêmes variantes et les retrouve par
+dichotomie. Les candidats sont ensuite vérifiés par la vraie distance de
+Levenshtein (RapidFuzz) : ni collision de hachage ni préfixe commun ne
+produisent de faux positifs.
+
+Le calcul est vectorisé : les préfixes sont un tableau NumPy de points de
+code (complétés par des zéros), chaque combinaison de positions supprimées
+donne une colonne de hachages pour tout le vocabulaire à la fois. Une
+suppression dans le remplissage équivaut à ne rien supprimer, ce qui permet
+de comparer des variantes de même longueur.
+"""
+
+from itertools import combinations
+
+import numpy as np
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
+
+
+MAX_DISTANCE = 2
+# Seul le début des termes est indexé (les candidats sont vérifiés sur le mot entier)
+PREFIX_LENGTH = 6
+# Les mots plus courts ne tolèrent qu'une faute
+SHORT_WORD_LENGTH = 4
+
+# Multiplicateurs impairs fixes : hachage (modulo 2**64) d'une suite de points de code
+_MULTIPLIERS = np.random.default_rng(20240229).integers(1, 2**63, size=PREFIX_LENGTH + 1, dtype=np.uint64) | np.uint64(1)
+# Contribution de la longueur de la variante (suppressions dans le remplissage comprises)
+_LENGTH_HASHES = _MULTIPLIERS[-1] * np.arange(PREFIX_LENGTH + 1, dtype=np.uint64)
+_DELETIONS = [
+    deleted
+    for count in range(MAX_DISTANCE + 1)
+    for deleted in combinations(range(PREFIX_LENGTH), count)
+]
+
+
+def _prefix_codes(words):
+    """Points de code des PREFIX_LENGTH premiers caractères, complétés par des zéros"""
+    prefixes = np.array([word[:PREFIX_LENGTH] for word in words], dtype=f'<U{PREFIX_LENGTH}')
+    return prefixes.view(np.uint32).reshape(len(words), PREFIX_LENGTH).astype(np.uint64)
+
+
+def _deletion_hashes(codes):
+    """Hachage 32 bits de chaque variante : tableau (mots, combinaisons de suppressions)"""
+    hashes = np.empty((len(codes), len(_DELETIONS)), dtype=np.uint32)
+    for column, deleted in enumerate(_DELETIONS):
+        kept = [i for i in range(PREFIX_LENGTH) if i not in deleted]
+        value = np.full(len(codes), _LENGTH_HASHES[len(kept)], dtype=np.uint64)
+        for rank, i in enumerate(kept):
+            value += codes[:, i] * _MULTIPLIERS[rank]
+        hashes[:, column] = value >> np.uint64(32)
+    return hashes
+
+
+def max_distance_for(word):
+    return 1 if len(word) <= SHORT_WORD_LENGTH else MAX_DISTANCE
+
+
+class DeletionIndex:
+    """Hachages des variantes par suppression -> termes (rangs dans la liste triée)"""
+
+    def __init__(self, terms):
+        self.terms = terms
+        hashes = _deletion_hashes(_prefix_codes(terms)) if terms else np.empty((0, len(_DELETIONS)), np.uint32)
+        term_ids = np.repeat(np.arange(len(terms), dtype=np.int32), len(_DELETIONS))
+
+        # Une variante identique pour un même terme (lettres doublées) n'est gardée qu'une fois
+        keys = np.unique(hashes.ravel().astype(np.uint64) << np.uint64(32) | term_ids.astype(np.uint64))
+        self.hashes = (keys >> np.uint64(32)).astype(np.uint32)
+        self.term_ids = (keys & np.uint64(0xFFFFFFFF)).astype(np.int32)
+
+    def candidates(self, word):
+        """Rangs des termes partageant une variante avec le mot"""
+        probes = np.unique(_deletion_hashes(_prefix_codes([word]))[0])
+        starts = np.searchsorted(self.hashes, probes, side='left')
+        ends = np.searchsorted(self.hashes, probes, side='right')
+        if not (ends - starts).sum():
+            return self.term_ids[:0]
+        return np.unique(np.concatenate([self.term_ids[start:end] for start, end in zip(starts, ends)]))
+
+    def similar_terms(self, word, max_distance=None):
+        """Termes à distance d'édition au plus max_distance : [(terme, distance)], les plus proches d'abord"""
+        if max_distance is None:
+            max_distance = max_distance_for(word)
+        max_distance = min(max_distance, MAX_DISTANCE)
+        choices = [self.terms[term_id] for term_id in self.candidates(word).tolist()]
+        matches = process.extract(
+            word, choices, scorer=Levenshtein.distance, score_cutoff=max_distance, limit=None
+        )
+        return sorted(((term, distance) for term, distance, _ in matches), key=lambda match: (match[1], match[0]))
@@ -0,0 +1,78 @@
+"""
+Graphe de Jaccard du corpus et PageRank, calculés hors ligne
+
+Les livres sont les lignes d'une matrice d'incidence creuse livre x terme
+(1 si le livre contient le mot), chargée depuis les postings par
+similarity.load_book_term_matrix. Les intersections de vocabulaire de toutes
+les paires sont les produits A @ A.T, calculés par blocs de lignes pour
+borner la mémoire ; l'union s'en déduit par |a| + |b| - |a & b|. Seules les
+arêtes de similarité supérieure à JACCARD_THRESHOLD sont gardées, dans une
+matrice d'adjacence creuse symétrique.
+
+Le PageRank est une itération de puissance vectorisée sur cette matrice
+(mêmes conventions que networkx.pagerank : poids des arêtes, nœuds sans
+arête répartis uniformément). Le script Scripts/compute_pagerank.py
+l'enregistre dans Book.pagerank, lu tel quel par les vues de recherche.
+"""
+
+import numpy as np
+from scipy import sparse
+
+
+# Similarité minimale pour relier deux livres
+JACCARD_THRESHOLD = 0.1
+# Lignes de la matrice d'incidence multipliées à la fois
+JACCARD_BLOCK_ROWS = 256
+PAGERANK_DAMPING = 0.85
+PAGERANK_MAX_ITERATIONS = 100
+PAGERANK_TOLERANCE = 1e-6
+
+
+def jaccard_graph(incidence, threshold=JACCARD_THRESHOLD, block_rows=JACCARD_BLOCK_ROWS):
+    """Matrice d'adjacence creuse symétrique : similarité de Jaccard des paires au-dessus du seuil"""
+    book_count = incidence.shape[0]
+    sizes = np.asarray(incidence.sum(axis=1)).ravel()
+    transposed = incidence.T.tocsc()
+    rows, columns, weights = [], [], []
+
+    for start in range(0, book_count, block_rows):
+        end = min(start + block_rows, book_count)
+        intersections = (incidence[start:end] @ transposed).toarray()
+        unions = sizes[start:end, None] + sizes[None, :] - intersections
+        with np.errstate(divide='ignore', invalid='ignore'):
+            similarity = np.where(unions > 0, intersections / unions, 0.0)
+        # Pas de boucle sur un livre
+        similarity[np.arange(end - start), np.arange(start, end)] = 0.0
+        pair_rows, pair_columns = np.nonzero(similarity > threshold)
+        rows.append(pair_rows + start)
+        columns.append(pair_columns)
+        weights.append(similarity[pair_rows, pair_columns])
+
+    if not rows:
+        return sparse.csr_matrix((book_count, book_count))
+    return sparse.csr_matrix(
+        (np.concatenate(weights), (np.concatenate(rows), np.concatenate(columns))),
+        shape=(book_count, book_count),
+    )
+
+
+def pagerank(adjacency, damping=PAGERANK_DAMPING, max_iterations=PAGERANK_MAX_ITERATIONS,
+             tolerance=PAGERANK_TOLERANCE):
+    """Scores PageRank (somme 1) des nœuds d'une matrice d'adjacence pondérée"""
+    node_count = adjacency.shape[0]
+    if node_count == 0:
+        return np.zeros(0)
+    strengths = np.asarray(adjacency.sum(axis=1)).ravel()
+    dangling = strengths == 0
+    inverse = np.divide(1.0, strengths, out=np.zeros(node_count), where=~dangling)
+    # Transition transposée : scores reçus = P.T @ scores
+    transition = (sparse.diags(inverse) @ adjacency).T.tocsr()
+
+    scores = np.full(node_count, 1.0 / node_count)
+    for _ in range(max_iterations):
+        previous = scores
+        scores = damping * (transition @ previous + previous[dangling].sum() / node_count)
+        scores += (1.0 - damping) / node_count
+        if np.abs(scores - previous).sum() < node_count * tolerance:
+            break
+    return scores
@@ -0,0 +1,136 @@
+"""
+Insertion groupée des livres importés
+
+Une page de livres est insérée en un nombre constant de requêtes, quel que
+soit le nombre de livres et d'auteurs : les auteurs sont résolus par nom via
+un cache en mémoire (nom -> id), les manquants sont créés en un seul
+bulk_create, puis les livres et les liens livre-auteur sont insérés en masse.
+
+Les livres sont décrits au format de l'API gutendex (clés id, title,
+languages, authors, formats...).
+"""
+
+import logging
+
+from django.db import transaction
+
+from .models import Author, Book
+
+
+# Seul le début du texte est stocké en base (le texte complet reste en cache)
+MAX_TEXT_LENGTH = 100000
+# Les textes plus courts ne sont pas importés
+MIN_WORD_COUNT = 10000
+
+
+def prepare_book_text(book_data, raw_text):
+    """Nettoie le texte brut d'un livre et renvoie (texte tronqué, nombre de mots)"""
+    text_content = raw_text.strip()
+    if not text_content:
+        logging.warning(f"Le livre ID {book_data['id']} semble vide.")
+        return None, 0
+    word_count = len(text_content.split())
+    return text_content[:MAX_TEXT_LENGTH], word_count
+
+
+def is_importable(book_data, book_text, word_count):
+    if not book_text or word_count < MIN_WORD_COUNT:
+        logging.info(f"Livre ignoré : {book_data['title']} (ID: {book_data['id']}), {word_count} mots.")
+        return False
+    return True
+
+
+def book_fields(book_data, book_text):
+    """Champs du modèle Book pour un livre au format gutendex"""
+    return {
+        'title': book_data['title'],
+        'language': ', '.join(book_data['languages']),
+        'description': book_data.get('summaries', [''])[0] if book_data.get('summaries') else '',
+        'subjects': ', '.join(book_data.get('subjects', [])),
+        'bookshelves': ', '.join(book_data.get('bookshelves', [])),
+        'cover_image': book_data['formats'].get('image/jpeg', ''),
+        'download_count': book_data.get('download_count', 0),
+        'copyright': book_data.get('copyright', False),
+        'text_content': book_text,
+    }
+
+
+class AuthorResolver:
+    """Cache nom -> id des auteurs, partagé par toutes les pages d'un import"""
+
+    def __init__(self):
+        self.ids = {}
+
+    def clear(self):
+        self.ids.clear()
+
+    def resolve(self, authors_data):
+        """Renvoie {nom: id} pour ces auteurs : une lecture et une insertion au plus"""
+        wanted = {}
+        for author_data in authors_data:
+            name = author_data['name']
+            if name not in self.ids and name not in wanted:
+                wanted[name] = author_data
+
+        if wanted:
+            # Author.name n'est pas unique : en cas de doublon, le plus ancien gagne
+            existing = Author.objects.filter(name__in=list(wanted)).order_by('id').values_list('id', 'name')
+            for author_id, name in existing:
+                self.ids.setdefault(name, author_id)
+
+            missing = [
+                Author(
+                    name=name,
+                    birth_year=author_data.get('birth_year'),
+                    death_year=author_data.get('death_year'),
+                )
+                for name, author_data in wanted.items()
+                if name not in self.ids
+            ]
+            for author in Author.objects.bulk_create(missing):
+                self.ids[author.name] = author.id
+
+        return {author_data['name']: self.ids[author_data['name']] for author_data in authors_data}
+
+
+def store_books(entries, resolver):
+    """Insère une page de livres [(book_data, texte)] et renvoie {id: Book}.
+
+    Comme avec get_or_create, un livre déjà présent n'est pas modifié mais
+    ses auteurs manquants lui sont reliés.
+    """
+    if not entries:
+        return {}
+
+    try:
+        with transaction.atomic():
+            author_ids = resolver.resolve(
+                [author_data for book_data, _ in entries for author_data in book_data.get('authors', [])]
+            )
+
+            books = Book.objects.only('id', 'title').in_bulk([book_data['id'] for book_data, _ in entries])
+            new_books = {}
+            for book_data, book_text in entries:
+                if book_data['id'] not in books and book_data['id'] not in new_books:
+                    new_books[book_data['id']] = Book(id=book_data['id'], **book_fields(book_data, book_text))
+            Book.objects.bulk_create(new_books.values())
+            books.update(new_books)
+
+            BookAuthor = Book.authors.through
+            links = {
+                (book_data['id'], author_ids[author_data['name']])
+                for book_data, _ in entries
+                for author_data in book_data.get('authors', [])
+            }
+            BookAuthor.objects.bulk_create(
+                [BookAuthor(book_id=book_id, author_id=author_id) for book_id, author_id in links],
+                ignore_conflicts=True,
+            )
+    except Exception:
+        # Les auteurs créés dans la transaction annulée ne doivent pas rester en cache
+        resolver.clear()
+        raise
+
+    for book in new_books.values():
+        logging.info(f"Livre importé : {book.title} (ID: {book.id})")
+    return books
@@ -0,0 +1,76 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+from book.positions import decode_positions, encode_positions
+
+
+BATCH_SIZE = 5000
+
+
+def encode_existing_positions(apps, schema_editor):
+    """Convertit les listes JSON existantes en octets delta + varint"""
+    for model_name in ('Index', 'ForwardIndex'):
+        model = apps.get_model('book', model_name)
+        batch = []
+        for entry in model.objects.only('id', 'positions').iterator(chunk_size=BATCH_SIZE):
+            entry.encoded_positions = encode_positions(sorted(entry.positions or []))
+            batch.append(entry)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, ['encoded_positions'])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, ['encoded_positions'])
+
+
+def decode_existing_positions(apps, schema_editor):
+    for model_name in ('Index', 'ForwardIndex'):
+        model = apps.get_model('book', model_name)
+        batch = []
+        for entry in model.objects.only('id', 'encoded_positions').iterator(chunk_size=BATCH_SIZE):
+            entry.positions = decode_positions(entry.encoded_positions)
+            batch.append(entry)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, ['positions'])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, ['positions'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book', '0006_incremental_indexing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='index',
+            name='encoded_positions',
+            field=models.BinaryField(blank=True, default=bytes),
+        ),
+        migrations.AddField(
+            model_name='forwardindex',
+            name='encoded_positions',
+            field=models.BinaryField(blank=True, default=bytes),
+        ),
+        migrations.RunPython(encode_existing_positions, decode_existing_positions),
+        migrations.RemoveField(
+            model_name='index',
+            name='positions',
+        ),
+        migrations.RemoveField(
+            model_name='forwardindex',
+            name='positions',
+        ),
+        migrations.RenameField(
+            model_name='index',
+            old_name='encoded_positions',
+            new_name='positions',
+        ),
+        migrations.RenameField(
+            model_name='forwardindex',
+            old_name='encoded_positions',
+            new_name='positions',
+        ),
+    ]
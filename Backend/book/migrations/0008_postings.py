@@ -0,0 +1,100 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Fusionne Index et ForwardIndex dans book_posting, puis les remplace par des vues.
+# Les vues simples sur une seule table sont modifiables (UPDATE/DELETE) sous PostgreSQL.
+POSTINGS_FORWARD_SQL = """
+INSERT INTO book_posting (word, book_id, occurrences_count, positions, tf, idf, tfidf)
+SELECT COALESCE(f.word, i.word),
+       COALESCE(f.book_id, i.book_id),
+       COALESCE(f.occurrences_count, i.occurrences_count),
+       COALESCE(f.positions, i.positions),
+       COALESCE(f.tf, 0), COALESCE(f.idf, 0), COALESCE(f.tfidf, 0)
+FROM book_forwardindex AS f
+FULL OUTER JOIN book_index AS i ON i.word = f.word AND i.book_id = f.book_id;
+
+DROP TABLE book_index;
+DROP TABLE book_forwardindex;
+
+CREATE VIEW book_index AS
+    SELECT id, word, book_id, occurrences_count, positions
+    FROM book_posting;
+
+CREATE VIEW book_forwardindex AS
+    SELECT id, book_id, word, occurrences_count, positions, tf, idf, tfidf
+    FROM book_posting;
+"""
+
+POSTINGS_REVERSE_SQL = """
+DROP VIEW book_index;
+DROP VIEW book_forwardindex;
+
+CREATE TABLE book_index (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    word varchar(255) NOT NULL,
+    occurrences_count integer NOT NULL,
+    positions bytea NOT NULL,
+    book_id bigint NOT NULL REFERENCES book_book (id) DEFERRABLE INITIALLY DEFERRED,
+    UNIQUE (word, book_id)
+);
+CREATE INDEX book_index_word_idx ON book_index (word);
+CREATE INDEX book_index_book_id_idx ON book_index (book_id);
+
+CREATE TABLE book_forwardindex (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    word varchar(255) NOT NULL,
+    occurrences_count integer NOT NULL,
+    positions bytea NOT NULL,
+    tf double precision NOT NULL,
+    idf double precision NOT NULL,
+    tfidf double precision NOT NULL,
+    book_id bigint NOT NULL REFERENCES book_book (id) DEFERRABLE INITIALLY DEFERRED,
+    UNIQUE (book_id, word)
+);
+CREATE INDEX book_forwardindex_book_id_idx ON book_forwardindex (book_id);
+
+INSERT INTO book_index (word, book_id, occurrences_count, positions)
+SELECT word, book_id, occurrences_count, positions FROM book_posting;
+
+INSERT INTO book_forwardindex (word, book_id, occurrences_count, positions, tf, idf, tfidf)
+SELECT word, book_id, occurrences_count, positions, tf, idf, tfidf FROM book_posting;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book', '0007_binary_positions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Posting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('word', models.CharField(max_length=255)),
+                ('occurrences_count', models.IntegerField(default=0)),
+                ('positions', models.BinaryField(blank=True, default=bytes)),
+                ('tf', models.FloatField(default=0.0)),
+                ('idf', models.FloatField(default=0.0)),
+                ('tfidf', models.FloatField(default=0.0)),
+                ('book', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='book.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['book', 'word'], name='book_postin_book_id_word_idx')],
+                'unique_together': {('word', 'book')},
+            },
+        ),
+        migrations.RunSQL(POSTINGS_FORWARD_SQL, POSTINGS_REVERSE_SQL),
+        migrations.AlterModelOptions(
+            name='forwardindex',
+            options={'managed': False},
+        ),
+        migrations.AlterModelOptions(
+            name='index',
+            options={'managed': False},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book', '0008_postings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='pagerank',
+            field=models.FloatField(default=0.0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book', '0009_book_pagerank'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='minhash',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
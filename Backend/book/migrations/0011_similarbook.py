@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book', '0010_book_minhash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarBook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('similarity', models.FloatField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_entries', to='book.book')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='book.book')),
+            ],
+            options={
+                'ordering': ['book', '-similarity'],
+                'unique_together': {('book', 'similar')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+def reset_fingerprints(apps, schema_editor):
+    """Les numéros de mot ne se déduisent pas des positions : la prochaine indexation reprend tous les livres"""
+    apps.get_model('book', 'Book').objects.update(content_fingerprint=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book', '0011_similarbook'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='posting',
+            name='ordinals',
+            field=models.BinaryField(blank=True, default=bytes),
+        ),
+        migrations.RunPython(reset_fingerprints, migrations.RunPython.noop),
+    ]
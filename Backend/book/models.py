@@ -1,6 +1,7 @@
-import json
 from django.db import models
 
+from .positions import decode_positions, decode_positions_array
+
 class Author(models.Model):
     name = models.CharField(max_length=200)
     birth_year = models.IntegerField(null=True, blank=True)
@@ -24,6 +25,13 @@ class Book(models.Model):
     download_count = models.IntegerField(default=0)
     copyright = models.BooleanField(default=False)
     text_content = models.TextField(null=True, blank=True)
+    # Suivi de l'indexation incrémentale
+    content_fingerprint = models.CharField(max_length=64, null=True, blank=True)  # md5 du texte indexé
+    indexed_generation = models.IntegerField(null=True, blank=True, db_index=True)
+    # PageRank du graphe de Jaccard du corpus, calculé hors ligne (Scripts/compute_pagerank.py)
+    pagerank = models.FloatField(default=0.0)
+    # Signature MinHash du vocabulaire, calculée à l'indexation (voir minhash.py)
+    minhash = models.BinaryField(null=True, blank=True)
 
     def __str__(self):
         return self.title
@@ -32,38 +40,121 @@ class Book(models.Model):
         app_label = 'book'
 
 
+class Posting(models.Model):
+    """Table unique des postings (mot, livre).
+
+    Sert les deux chemins d'accès : mot -> livres (index (word, book)) pour la
+    recherche, et livre -> mots (index (book, word)) pour le TF-IDF et Jaccard.
+    Index et ForwardIndex sont des vues SQL sur cette table.
+    """
+    word = models.CharField(max_length=255)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=False)
+    occurrences_count = models.IntegerField(default=0)
+    positions = models.BinaryField(default=bytes, blank=True)  # delta + varint, voir positions.py
+    # Numéros des occurrences parmi tous les mots du texte (distance en mots de NEAR), même encodage
+    ordinals = models.BinaryField(default=bytes, blank=True)
+    tf = models.FloatField(default=0.0)
+    idf = models.FloatField(default=0.0)
+    tfidf = models.FloatField(default=0.0)
+
+    class Meta:
+        unique_together = ('word', 'book')
+        indexes = [models.Index(fields=['book', 'word'], name='book_postin_book_id_word_idx')]
+
+    def __str__(self):
+        return f"{self.word} in {self.book_id}"
+
+    def get_positions(self):
+        return decode_positions(self.positions)
+
+    def get_positions_array(self):
+        return decode_positions_array(self.positions)
+
+
 class Index(models.Model):
-    """Index inversé : mot -> livres"""
+    """Index inversé : mot -> livres (vue sur Posting)"""
     word = models.CharField(max_length=255, db_index=True)
     book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=True)
     occurrences_count = models.IntegerField()
-    positions = models.JSONField(default=list, blank=True)
+    positions = models.BinaryField(default=bytes, blank=True)  # delta + varint, voir positions.py
 
     class Meta:
+        managed = False
         unique_together = ('word', 'book')
 
     def __str__(self):
         return f"{self.word} in {self.book.title}"
 
     def get_positions(self):
-        return self.positions or []
+        return decode_positions(self.positions)
+
+    def get_positions_array(self):
+        return decode_positions_array(self.positions)
 
 
 class ForwardIndex(models.Model):
+    """Index direct : livre -> mots avec TF-IDF (vue sur Posting)"""
     book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=True)
     word = models.CharField(max_length=255)
     occurrences_count = models.IntegerField(default=0)
-    positions = models.JSONField(default=list, blank=True)
+    positions = models.BinaryField(default=bytes, blank=True)  # delta + varint, voir positions.py
     # Champs TF-IDF
     tf = models.FloatField(default=0.0)  # Term Frequency
     idf = models.FloatField(default=0.0)  # Inverse Document Frequency
     tfidf = models.FloatField(default=0.0)  # Score TF-IDF
 
     class Meta:
+        managed = False
         unique_together = ('book', 'word')
 
     def __str__(self):
         return f"{self.book.title} -> {self.word} (TF-IDF: {self.tfidf:.4f})"
 
     def get_positions(self):
-        return self.positions or []
+        return decode_positions(self.positions)
+
+    def get_positions_array(self):
+        return decode_positions_array(self.positions)
+
+
+class SimilarBook(models.Model):
+    """Voisins précalculés d'un livre par similarité cosinus TF-IDF (voir similarity.py)"""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='similar_entries')
+    similar = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    similarity = models.FloatField()
+
+    class Meta:
+        unique_together = ('book', 'similar')
+        ordering = ['book', '-similarity']
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.similar_id} ({self.similarity:.3f})"
+
+
+class Term(models.Model):
+    """Vocabulaire dédoublonné : mot -> nombre de livres le contenant (DF)"""
+    word = models.CharField(max_length=255, unique=True)
+    document_frequency = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.word} (DF: {self.document_frequency})"
+
+
+class IndexGeneration(models.Model):
+    """Une exécution de l'indexeur ; les livres indexés portent son numéro"""
+    number = models.IntegerField(unique=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    books_indexed = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-number']
+
+    def __str__(self):
+        return f"Génération {self.number}"
+
+    @classmethod
+    def current(cls):
+        """Numéro de la dernière génération terminée (0 si aucune)"""
+        last = cls.objects.filter(finished_at__isnull=False).order_by('-number').values_list('number', flat=True).first()
+        return last or 0
@@ -0,0 +1,76 @@
+"""
+Encodage compact des positions de mots
+
+Les positions (offsets en caractères, triés) sont stockées sous forme
+d'écarts successifs encodés en varint : 7 bits utiles par octet, le bit de
+poids fort indique qu'un octet suit. Un mot courant passe ainsi de ~6 octets
+JSON par position à 1-2 octets.
+"""
+
+import numpy as np
+
+
+def encode_positions(positions):
+    """Encode une liste croissante de positions en octets (delta + varint)"""
+    out = bytearray()
+    append = out.append
+    previous = 0
+    for position in positions:
+        delta = int(position) - previous
+        previous = int(position)
+        while delta >= 0x80:
+            append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        append(delta)
+    return bytes(out)
+
+
+def _decode_varints(buffer):
+    """Valeurs des varints d'un tampon uint8 (écarts non cumulés) et masque des derniers octets"""
+    is_last = buffer < 0x80
+
+    # Début de chaque varint et rang de chaque octet dans son varint
+    starts = np.flatnonzero(np.concatenate(([True], is_last[:-1])))
+    value_index = np.cumsum(np.concatenate(([False], is_last[:-1])))
+    byte_rank = np.arange(buffer.size) - starts[value_index]
+
+    parts = (buffer & 0x7F).astype(np.int64) << (7 * byte_rank)
+    return np.add.reduceat(parts, starts), is_last
+
+
+def decode_positions_array(data):
+    """Décode les positions en tableau NumPy int64, sans boucle Python"""
+    if not data:
+        return np.empty(0, dtype=np.int64)
+
+    deltas, _ = _decode_varints(np.frombuffer(bytes(data), dtype=np.uint8))
+    return np.cumsum(deltas)
+
+
+def decode_positions_segments(buffer, segment_lengths):
+    """Décode d'un coup plusieurs listes de positions mises bout à bout.
+
+    buffer : tableau uint8 des listes encodées concaténées ;
+    segment_lengths : longueur en octets de chaque liste.
+    Renvoie (positions, nombre de positions par liste).
+    """
+    segment_lengths = np.asarray(segment_lengths, dtype=np.int64)
+    counts = np.zeros(len(segment_lengths), dtype=np.int64)
+    if not buffer.size:
+        return np.empty(0, dtype=np.int64), counts
+
+    deltas, is_last = _decode_varints(buffer)
+    non_empty = segment_lengths > 0
+    byte_starts = np.cumsum(segment_lengths) - segment_lengths
+    counts[non_empty] = np.add.reduceat(is_last.astype(np.int64), byte_starts[non_empty])
+
+    # Cumul des écarts remis à zéro au début de chaque liste
+    totals = np.cumsum(deltas)
+    value_starts = np.cumsum(counts) - counts
+    bases = np.where(value_starts > 0, totals[np.maximum(value_starts - 1, 0)], 0)
+    return totals - np.repeat(bases, counts), counts
+
+
+def decode_positions(data):
+    """Décode les positions en liste d'entiers Python"""
+    return decode_positions_array(data).tolist()
@@ -0,0 +1,414 @@
+"""
+Requêtes booléennes évaluées sur l'index en mémoire
+
+Syntaxe (opérateurs en majuscules, pour ne pas confondre avec les mots) :
+
+- ``sea monster``         : ET implicite entre les termes ;
+- ``sea AND monster``     : ET explicite ;
+- ``whale OR shark``      : OU ;
+- ``whale NOT shark``     : exclusion (``-shark`` est équivalent) ;
+- ``"old man"``           : phrase exacte (mots consécutifs) ;
+- ``whale NEAR/10 captain``: proximité, au plus 10 mots entre les deux (NEAR seul : 10) ;
+- parenthèses pour grouper : ``(whale OR shark) -ship``.
+
+Chaque terme passe par l'analyseur (minuscules, stopwords retirés) : un
+stopword seul disparaît de la requête. Une requête mal formée n'est jamais
+une erreur, les opérateurs orphelins et parenthèses en trop sont ignorés.
+
+L'évaluation travaille sur les listes triées d'IDs de livres de l'index :
+les listes d'un ET sont intersectées de la plus rare à la plus fréquente,
+chaque livre candidat étant localisé par dichotomie dans l'autre liste
+(restreinte à l'intervalle commun), d'où un coût proche de la taille de la
+liste la plus rare.
+
+Une phrase est d'abord réduite aux livres contenant tous ses mots, puis
+l'adjacence est vérifiée sur les positions (offsets en caractères) : chaque
+mot doit suivre le précédent à la distance observée dans la requête, à
+PHRASE_SLACK caractères près (« ,\\r\\n » en fin de ligne au lieu d'une
+espace). Les mots non indexés (stopwords, moins de 3 lettres) ne sont pas
+vérifiés : seule la place qu'ils occupent compte, un mot d'une lettre peut
+donc s'intercaler.
+
+NEAR et le bonus de proximité reposent sur le plus petit intervalle couvrant
+tous les mots dans chaque livre, calculé en une passe linéaire sur la fusion
+des listes de numéros de mot (fenêtre glissante). Les numéros comptent tous
+les mots du texte, stopwords et mots courts compris : l'intervalle se mesure
+en mots, quelle que soit leur longueur.
+"""
+
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from .analyzer import analyze_query, iter_words_with_positions
+
+
+Term = namedtuple('Term', 'word')
+And = namedtuple('And', 'children')
+Or = namedtuple('Or', 'children')
+Not = namedtuple('Not', 'child')
+# gaps[i] : distance en caractères entre le début de words[i] et celui de words[i + 1]
+Phrase = namedtuple('Phrase', 'words gaps')
+# Tous les mots dans une fenêtre d'au plus distance mots supplémentaires (stopwords compris)
+Near = namedtuple('Near', 'words distance')
+
+TOKEN_PATTERN = re.compile(r'"[^"]*"?|\(|\)|[^\s()"]+')
+OPERATORS = {'AND', 'OR', 'NOT'}
+NEAR_PATTERN = re.compile(r'NEAR(?:/(\d+))?$')
+
+# Caractères de séparation supplémentaires tolérés entre deux mots d'une phrase
+PHRASE_SLACK = 2
+# Clé (rang du livre, position) sur un seul entier : positions < 2**40
+KEY_STRIDE = 1 << 40
+
+# Distance de NEAR sans /k, en mots
+DEFAULT_NEAR_DISTANCE = 10
+# Intervalle des livres où les mots ne sont pas tous présents
+NO_SPAN = np.iinfo(np.int64).max
+# Termes proches gardés au plus pour un terme de la requête
+FUZZY_EXPANSIONS = 10
+
+EMPTY = np.empty(0, dtype=np.int64)
+
+
+# Analyse syntaxique
+
+class _Parser:
+    def __init__(self, query):
+        self.tokens = TOKEN_PATTERN.findall(query)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == 'OR':
+            self.next()
+            children.append(self.parse_and())
+        return _combine(Or, children)
+
+    def parse_and(self):
+        children = []
+        while self.peek() not in (None, ')', 'OR'):
+            if self.peek() == 'AND' or _near_distance(self.peek()) is not None:
+                self.next()
+                continue
+            children.append(self.parse_near())
+        return _combine(And, children)
+
+    def parse_near(self):
+        node = self.parse_unary()
+        while self.peek() is not None and _near_distance(self.peek()) is not None:
+            distance = _near_distance(self.next())
+            if self.peek() in (None, ')', 'OR', 'AND'):
+                break
+            if _near_distance(self.peek()) is not None:
+                continue
+            node = _near_node(node, self.parse_unary(), distance)
+        return node
+
+    def parse_unary(self):
+        token = self.peek()
+        if token == 'NOT':
+            self.next()
+            child = self.parse_unary() if self.peek() not in (None, ')', 'OR') else None
+            return Not(child) if child is not None else None
+        if token.startswith('-') and len(token) > 1:
+            self.next()
+            child = _term_node(token[1:])
+            return Not(child) if child is not None else None
+        return self.parse_primary()
+
+    def parse_primary(self):
+        token = self.next()
+        if token == '(':
+            node = self.parse_or()
+            if self.peek() == ')':
+                self.next()
+            return node
+        if token.startswith('"'):
+            return _phrase_node(token.strip('"'))
+        return _term_node(token)
+
+
+def _combine(node_type, children):
+    children = [child for child in children if child is not None]
+    if not children:
+        return None
+    if len(children) == 1:
+        return children[0]
+    return node_type(tuple(children))
+
+
+def _term_node(token):
+    """Un mot de la requête, analysé comme à l'indexation (plusieurs termes -> ET)"""
+    return _combine(And, [Term(word) for word in analyze_query(token)])
+
+
+def _near_distance(token):
+    """Distance d'un opérateur NEAR ou NEAR/k, None pour un autre token"""
+    match = NEAR_PATTERN.match(token)
+    if not match:
+        return None
+    return int(match.group(1)) if match.group(1) else DEFAULT_NEAR_DISTANCE
+
+
+def _near_node(left, right, distance):
+    """a NEAR/k b ; une chaîne a NEAR b NEAR c garde une seule fenêtre, de la plus grande distance"""
+    if isinstance(left, Near):
+        distance = max(distance, left.distance)
+    words = tuple(dict.fromkeys(positive_terms(left) + positive_terms(right)))
+    if isinstance(left, Not) or isinstance(right, Not) or len(words) < 2:
+        return _combine(And, [left, right])
+    return Near(words, distance)
+
+
+def _phrase_node(text):
+    words = list(iter_words_with_positions(text))
+    if len(words) < 2:
+        return _combine(And, [Term(word) for word, _ in words])
+    gaps = tuple(position - previous for (_, previous), (_, position) in zip(words, words[1:]))
+    return Phrase(tuple(word for word, _ in words), gaps)
+
+
+def parse_query(query):
+    """Arbre de la requête (Term/Phrase/Near/And/Or/Not), ou None si elle ne contient aucun terme"""
+    parser = _Parser(query or '')
+    node = parser.parse_or()
+    # Parenthèses fermantes en trop : on continue l'analyse après elles
+    while parser.peek() is not None:
+        parser.next()
+        node = _combine(And, [node, parser.parse_or()])
+    return node
+
+
+def expand_fuzzy(node, index, known_terms=False):
+    """Remplace chaque terme par un OU des termes du vocabulaire à 1-2 fautes près.
+
+    Par défaut seuls les termes absents du vocabulaire (fautes probables) sont
+    étendus ; known_terms=True étend aussi les autres. Les phrases et NEAR ne
+    sont pas modifiés.
+    """
+    if node is None or isinstance(node, (Phrase, Near)):
+        return node
+    if isinstance(node, Term):
+        if not known_terms and index.term_id(node.word) is not None:
+            return node
+        # Les plus proches d'abord, puis les plus fréquents
+        similar = sorted(
+            (distance, -index.document_frequency(word), word)
+            for word, distance in index.similar_terms(node.word) if word != node.word
+        )
+        words = [node.word] + [word for _, _, word in similar[:FUZZY_EXPANSIONS]]
+        return _combine(Or, [Term(word) for word in words])
+    if isinstance(node, Not):
+        return Not(expand_fuzzy(node.child, index, known_terms))
+    return type(node)(tuple(expand_fuzzy(child, index, known_terms) for child in node.children))
+
+
+def positive_terms(node):
+    """Termes de la requête hors exclusions, dans l'ordre (pour compter et surligner)"""
+    if node is None or isinstance(node, Not):
+        return []
+    if isinstance(node, Term):
+        return [node.word]
+    if isinstance(node, (Phrase, Near)):
+        return list(node.words)
+    return [word for child in node.children for word in positive_terms(child)]
+
+
+def positive_phrases(node):
+    if node is None or isinstance(node, (Not, Term, Near)):
+        return []
+    if isinstance(node, Phrase):
+        return [node]
+    return [phrase for child in node.children for phrase in positive_phrases(child)]
+
+
+# Opérations sur les listes triées d'IDs
+
+def intersect(small, large):
+    """Intersection de deux listes triées, en O(len(small) · log len(large))"""
+    if not len(small) or not len(large):
+        return EMPTY
+    # Seule la partie de la grande liste qui recouvre la petite est parcourue
+    lo = np.searchsorted(large, small[0])
+    hi = np.searchsorted(large, small[-1], side='right')
+    window = large[lo:hi]
+    if not len(window):
+        return EMPTY
+    rows = np.minimum(np.searchsorted(window, small), len(window) - 1)
+    return small[window[rows] == small]
+
+
+def difference(values, excluded):
+    """Éléments de values absents de excluded (listes triées)"""
+    if not len(values) or not len(excluded):
+        return values
+    rows = np.minimum(np.searchsorted(excluded, values), len(excluded) - 1)
+    return values[excluded[rows] != values]
+
+
+def union(lists):
+    lists = [values for values in lists if len(values)]
+    if not lists:
+        return EMPTY
+    if len(lists) == 1:
+        return lists[0]
+    return np.unique(np.concatenate(lists))
+
+
+# Phrases
+
+def phrase_matches(phrase, index, book_ids):
+    """Nombre d'occurrences de la phrase dans chaque livre (tableau aligné sur book_ids)"""
+    book_ids = np.asarray(book_ids, dtype=np.int64)
+    ranks, positions = index.positions_in_books(phrase.words[0], book_ids)
+    keys = ranks * KEY_STRIDE + positions
+
+    for previous, word, gap in zip(phrase.words, phrase.words[1:], phrase.gaps):
+        if not len(keys):
+            break
+        next_ranks, next_positions = index.positions_in_books(word, book_ids)
+        next_keys = next_ranks * KEY_STRIDE + next_positions
+        # Première occurrence du mot suivant après le précédent et au moins un séparateur :
+        # la phrase continue si elle n'est pas plus loin que dans la requête (+ PHRASE_SLACK)
+        rows = np.searchsorted(next_keys, keys + len(previous) + 1)
+        valid = rows < len(next_keys)
+        valid[valid] = next_keys[rows[valid]] <= keys[valid] + gap + PHRASE_SLACK
+        keys = next_keys[rows[valid]]
+
+    return np.bincount(keys // KEY_STRIDE, minlength=len(book_ids))
+
+
+def phrase_match_counts(node, index, book_ids):
+    """Occurrences des phrases de la requête par livre : {livre: total}, vide sans phrase"""
+    phrases = positive_phrases(node)
+    if not phrases:
+        return {}
+    book_ids = np.sort(np.asarray(book_ids, dtype=np.int64))
+    totals = sum(phrase_matches(phrase, index, book_ids) for phrase in phrases)
+    return dict(zip(book_ids.tolist(), totals.tolist()))
+
+
+# Proximité
+
+def minimal_spans(words, index, book_ids):
+    """Plus petit intervalle (en mots) couvrant tous les mots, pour chaque livre.
+
+    Les listes de numéros de mot des livres sont fusionnées (elles sont déjà triées :
+    le tri stable se réduit à une fusion), puis parcourues comme une fenêtre
+    glissante : la plus courte fenêtre finissant à une position commence à la
+    plus ancienne des dernières occurrences de chaque mot. Coût linéaire en
+    nombre de positions par mot, sans comparaison deux à deux.
+    Renvoie un tableau aligné sur book_ids, NO_SPAN où un mot manque.
+    """
+    words = list(dict.fromkeys(words))
+    book_ids = np.asarray(book_ids, dtype=np.int64)
+    spans = np.full(len(book_ids), NO_SPAN, dtype=np.int64)
+    if not words or not len(book_ids):
+        return spans
+
+    keys, terms = [], []
+    for term, word in enumerate(words):
+        ranks, ordinals = index.positions_in_books(word, book_ids, 'ordinals')
+        keys.append(ranks * KEY_STRIDE + ordinals)
+        terms.append(np.full(len(ordinals), term, dtype=np.int16))
+    keys = np.concatenate(keys)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    terms = np.concatenate(terms)[order]
+    if not len(keys):
+        return spans
+
+    # Début de la plus courte fenêtre finissant à chaque position
+    window_starts = np.full(len(keys), NO_SPAN, dtype=np.int64)
+    for term in range(len(words)):
+        latest = np.where(terms == term, keys, -1)
+        np.maximum.accumulate(latest, out=latest)
+        np.minimum(window_starts, latest, out=window_starts)
+
+    # Une fenêtre n'est valide que si tous les mots ont été vus dans le même livre
+    ranks = keys // KEY_STRIDE
+    windows = np.where(window_starts >= ranks * KEY_STRIDE, keys - window_starts, NO_SPAN)
+    first = np.flatnonzero(np.concatenate(([True], ranks[1:] != ranks[:-1])))
+    spans[ranks[first]] = np.minimum.reduceat(windows, first)
+    return spans
+
+
+def near_span(near):
+    """Intervalle maximal (en mots) autorisé par un NEAR : au plus distance autres mots intercalés"""
+    return near.distance + len(near.words) - 1
+
+
+def proximity_scores(words, index, book_ids):
+    """Bonus de proximité dans [0, 1] par livre : 1 quand les mots sont adjacents.
+
+    Rapport entre l'intervalle de mots consécutifs et le plus petit intervalle
+    couvrant tous les mots ; 0 si un mot manque.
+    """
+    words = list(dict.fromkeys(words))
+    spans = minimal_spans(words, index, book_ids)
+    adjacent = len(words) - 1
+    scores = np.zeros(len(spans))
+    found = spans != NO_SPAN
+    scores[found] = np.minimum(1.0, adjacent / np.maximum(spans[found], 1))
+    return scores
+
+
+# Évaluation
+
+def _postings(node, index):
+    if isinstance(node, Term):
+        return index.doc_ids_for(node.word)
+    if isinstance(node, Phrase):
+        candidates = _conjunction([Term(word) for word in node.words], index)
+        return candidates[phrase_matches(node, index, candidates) > 0]
+    if isinstance(node, Near):
+        candidates = _conjunction([Term(word) for word in node.words], index)
+        return candidates[minimal_spans(node.words, index, candidates) <= near_span(node)]
+    if isinstance(node, Or):
+        return union([_postings(child, index) for child in node.children])
+    if isinstance(node, Not):
+        return difference(index.book_ids, _postings(node.child, index))
+    return _conjunction(node.children, index)
+
+
+def _conjunction(children, index, extra=()):
+    positives = [child for child in children if not isinstance(child, Not)]
+    negatives = [child.child for child in children if isinstance(child, Not)]
+
+    # La liste la plus rare d'abord : chaque intersection ne peut que la réduire
+    lists = sorted([_postings(child, index) for child in positives] + list(extra), key=len)
+    result = lists[0] if lists else index.book_ids
+    for other in lists[1:]:
+        if not len(result):
+            return EMPTY
+        result = intersect(result, other)
+
+    for child in negatives:
+        if not len(result):
+            break
+        result = difference(result, _postings(child, index))
+    return result
+
+
+def evaluate(node, index, restrict=None):
+    """IDs triés des livres satisfaisant la requête.
+
+    restrict (liste triée d'IDs, par exemple les livres d'un auteur) est
+    intersectée comme une liste de postings de plus, dans le même ET.
+    """
+    if node is None:
+        return EMPTY
+    if restrict is None:
+        return _postings(node, index)
+    children = node.children if isinstance(node, And) else (node,)
+    return _conjunction(children, index, extra=(np.asarray(restrict, dtype=np.int64),))
@@ -0,0 +1,112 @@
+"""
+Classement BM25 avec arrêt anticipé du top-k (block-max)
+
+Les scores BM25 sont précalculés au chargement de l'index en mémoire : un
+« impact » par posting, qui intègre déjà l'IDF du terme et la longueur du
+livre (nombre de mots indexés). Le score d'un livre est la somme des impacts
+des termes de la requête qu'il contient.
+
+Pour le top-k, l'espace des livres est découpé en fenêtres de SCORE_WINDOW
+livres consécutifs. Chaque terme garde l'impact maximal de ses postings dans
+chaque fenêtre (block-max) ; la somme de ces maxima borne le score de tout
+livre de la fenêtre. Les fenêtres sont visitées par borne décroissante et la
+recherche s'arrête dès que la borne de la suivante ne peut plus battre le
+k-ième meilleur score : les livres des fenêtres restantes ne sont jamais
+évalués.
+"""
+
+import numpy as np
+
+
+# Paramètres BM25 usuels
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Livres consécutifs (par ID) partageant une borne block-max
+SCORE_WINDOW = 256
+
+
+def bm25_idf(document_frequencies, total_books):
+    """IDF BM25 (variante toujours positive de Lucene)"""
+    document_frequencies = np.asarray(document_frequencies, dtype=np.float64)
+    return np.log1p((total_books - document_frequencies + 0.5) / (document_frequencies + 0.5))
+
+
+def bm25_impacts(counts, idf, lengths, average_length):
+    """Impact BM25 de chaque posting : occurrences, IDF du terme et longueur du livre"""
+    counts = np.asarray(counts, dtype=np.float64)
+    norms = BM25_K1 * (1 - BM25_B + BM25_B * np.asarray(lengths) / max(average_length, 1e-9))
+    return (idf * counts * (BM25_K1 + 1) / (counts + norms)).astype(np.float32)
+
+
+def window_maxima(impacts, terms, windows, term_count):
+    """Maxima block-max au format CSR : pour le terme i, la tranche
+    ``block_offsets[i]:block_offsets[i + 1]`` de (block_windows, block_max).
+
+    terms et windows donnent le terme et la fenêtre du livre de chaque posting ;
+    les postings étant triés par (terme, livre), les blocs sont des suites contiguës.
+    """
+    if not len(impacts):
+        return np.zeros(term_count + 1, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    keys = terms * (int(windows.max()) + 1) + windows
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    block_offsets = np.searchsorted(terms[starts], np.arange(term_count + 1))
+    return block_offsets, windows[starts], np.maximum.reduceat(impacts, starts)
+
+
+def top_k(index, words, candidates, k):
+    """Les k meilleurs livres de candidates (IDs triés) pour ces termes, par BM25.
+
+    Renvoie (IDs, scores) triés par score décroissant (ID croissant à égalité).
+    """
+    words = list(dict.fromkeys(words))
+    candidates = np.asarray(candidates, dtype=np.int64)
+    best_ids = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float64)
+    if k <= 0 or not len(candidates):
+        return best_ids, best_scores
+
+    # Borne supérieure de chaque fenêtre : somme des maxima des termes
+    bounds = np.zeros(index.window_count)
+    for word in words:
+        windows, maxima = index.window_maxima_for(word)
+        bounds[windows] += maxima
+
+    candidate_windows = index.windows_of(candidates)
+    present, first = np.unique(candidate_windows, return_index=True)
+    last = np.append(first[1:], len(candidates))
+    for rank in np.argsort(-bounds[present], kind='stable'):
+        # Aucun livre de cette fenêtre (ni des suivantes) ne peut entrer dans le top-k
+        if len(best_ids) >= k and bounds[present[rank]] < best_scores[-1]:
+            break
+        book_ids = candidates[first[rank]:last[rank]]
+        best_ids = np.concatenate((best_ids, book_ids))
+        best_scores = np.concatenate((best_scores, index.bm25_scores(words, book_ids)))
+        order = np.lexsort((best_ids, -best_scores))[:k]
+        best_ids, best_scores = best_ids[order], best_scores[order]
+
+    return best_ids, best_scores
+
+
+class RankedResults:
+    """Résultats classés par BM25, évalués à la demande par la pagination.
+
+    Se comporte comme une liste d'IDs de longueur len(candidates) : une page
+    [début:fin] ne calcule que le top-fin.
+    """
+
+    def __init__(self, index, words, candidates):
+        self.index = index
+        self.words = words
+        self.candidates = np.asarray(candidates, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            item = range(len(self))[item]
+            return self[item:item + 1][0]
+        start, stop, step = item.indices(len(self))
+        book_ids, _ = top_k(self.index, self.words, self.candidates, stop)
+        return book_ids[start:stop:step].tolist()
@@ -0,0 +1,23 @@
+"""
+Parcours d'un lot de textes par une regex, exécuté dans les processus du pool
+
+Les processus sont lancés par spawn (voir text_search.py) : ils n'importent
+que ce module, qui ne doit donc dépendre ni de Django ni du reste de
+l'application.
+"""
+
+import re
+import time
+
+
+def scan_chunk(pattern, books, deadline):
+    """IDs des livres [(id, texte)] où la regex trouve une correspondance.
+
+    deadline (time.time()) est l'échéance de la requête : un lot resté en
+    file au-delà n'est pas parcouru et renvoie None. L'interruption d'un lot
+    en cours est l'affaire du processus parent.
+    """
+    if deadline <= time.time():
+        return None
+    compiled = re.compile(pattern, re.IGNORECASE)
+    return [book_id for book_id, text in books if text and compiled.search(text)]
@@ -0,0 +1,527 @@
+"""
+Index inversé résident en mémoire pour les vues de recherche
+
+Les postings sont chargés une fois par processus (worker WSGI) depuis la table
+Posting, puis servis sans requête SQL :
+
+- dictionnaire de termes : liste triée, recherche par dichotomie ; le rang
+  d'un mot dans la liste est son identifiant de terme ;
+- postings au format CSR : les postings du terme i occupent la tranche
+  ``offsets[i]:offsets[i + 1]`` des tableaux NumPy ``doc_ids`` (triés),
+  ``counts`` et ``tfidf`` ;
+- positions (offsets en caractères) et numéros des mots (distance en mots
+  de NEAR) : non chargés par load(), ils sont lus en base à la demande, pour
+  un mot et les seuls livres demandés (clé unique (mot, livre)), puis
+  gardés dans un cache borné (DatabasePositions) ; un index construit par
+  build() les garde en blocs d'octets (BlobPositions) ;
+- classement BM25 : impacts par posting et maxima par fenêtre de livres,
+  calculés au chargement (voir ranking.py) ;
+- ordre par impact : pour chaque terme, ses postings triés par TF-IDF
+  décroissant (permutation ``tfidf_order``, même découpage que ``doc_ids``),
+  le top-k d'un terme se lit sans tri ;
+- vocabulaire indexé par trigrammes pour la recherche par regex
+  (vocabulary.py) et par suppressions pour les fautes de frappe (fuzzy.py),
+  construits au premier usage ;
+- livres similaires : signatures MinHash de Book.minhash et bandes LSH
+  (minhash.py), chargées avec les postings.
+
+L'index est rechargé quand la génération d'indexation (IndexGeneration)
+change ; la génération courante est vérifiée au plus toutes les
+REFRESH_CHECK_SECONDS secondes. Le rechargement se fait dans un thread,
+hors des requêtes : l'ancien index reste servi jusqu'à ce que le nouveau
+soit prêt. Seul le tout premier chargement, lancé par le premier appel à
+get_index() du processus, est attendu par les requêtes.
+"""
+
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+import numpy as np
+from django.db import connection
+
+from .models import Book, IndexGeneration, Posting
+from .positions import decode_positions_segments
+from .ranking import SCORE_WINDOW, bm25_idf, bm25_impacts, window_maxima
+from .fuzzy import DeletionIndex
+from .minhash import SIMILAR_BOOKS, SimilarityIndex
+from .vocabulary import TrigramIndex
+
+
+# Intervalle minimal entre deux vérifications de la génération courante
+REFRESH_CHECK_SECONDS = 30
+# Lignes lues par aller-retour pendant le chargement
+LOAD_CHUNK_SIZE = 20000
+# Octets de positions gardés en cache par index chargé depuis la base
+POSITIONS_CACHE_BYTES = 32 * 1024 * 1024
+
+
+class BlobPositions:
+    """Positions et numéros de mot en mémoire (index de build()) : par champ, un bloc d'octets découpé par offsets"""
+
+    def __init__(self, fields):
+        # {champ: (bloc, offsets)}
+        self.fields = {
+            field: (np.frombuffer(blob, dtype=np.uint8), offsets) for field, (blob, offsets) in fields.items()
+        }
+
+    def segments(self, word, book_ids, postings, field='positions'):
+        """Octets concaténés des postings et longueur de chacun"""
+        buffer, offsets = self.fields[field]
+        # Extraits du bloc global sans boucle Python
+        byte_starts = offsets[postings]
+        byte_lengths = offsets[postings + 1] - byte_starts
+        byte_index = np.repeat(byte_starts - (np.cumsum(byte_lengths) - byte_lengths), byte_lengths)
+        byte_index += np.arange(len(byte_index))
+        return buffer[byte_index], byte_lengths
+
+
+class DatabasePositions:
+    """Positions et numéros de mot lus en base à la demande, avec un cache LRU borné en octets.
+
+    Un livre réindexé depuis le chargement de l'index renvoie ses positions
+    courantes (ou aucune) : l'écart dure jusqu'au rechargement suivant.
+    """
+
+    def __init__(self, max_bytes=POSITIONS_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _fetch(self, word, book_ids, field):
+        rows = dict(
+            Posting.objects.filter(word=word, book_id__in=book_ids).values_list('book_id', field)
+        )
+        return {book_id: bytes(rows.get(book_id, b'')) for book_id in book_ids}
+
+    def segments(self, word, book_ids, postings, field='positions'):
+        book_ids = book_ids.tolist()
+        found = {}
+        with self._lock:
+            for book_id in book_ids:
+                data = self._cache.get((field, word, book_id))
+                if data is not None:
+                    self._cache.move_to_end((field, word, book_id))
+                    found[book_id] = data
+        missing = [book_id for book_id in book_ids if book_id not in found]
+        if missing:
+            fetched = self._fetch(word, missing, field)
+            found.update(fetched)
+            with self._lock:
+                for book_id, data in fetched.items():
+                    if (field, word, book_id) not in self._cache:
+                        self._cache[(field, word, book_id)] = data
+                        self._size += len(data)
+                while self._size > self.max_bytes and self._cache:
+                    _, data = self._cache.popitem(last=False)
+                    self._size -= len(data)
+
+        data = [found[book_id] for book_id in book_ids]
+        buffer = np.frombuffer(b''.join(data), dtype=np.uint8)
+        return buffer, np.array([len(part) for part in data], dtype=np.int64)
+
+
+class InvertedIndex:
+    """Postings de tout le corpus en tableaux NumPy compacts"""
+
+    def __init__(self, terms, offsets, doc_ids, counts, tfidf, position_store,
+                 book_ids, download_counts, generation=0):
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.counts = counts
+        self.tfidf = tfidf
+        self.position_store = position_store
+        self.book_ids = book_ids
+        self.download_counts = download_counts
+        self.generation = generation
+        self._trigrams = None
+        self._deletions = None
+        self.similarity = None
+        self._prepare_ranking()
+
+    @classmethod
+    def build(cls, postings, books, generation=0, position_store=None):
+        """Construit l'index depuis des itérables Python.
+
+        postings : (mot, livre, occurrences, tfidf, positions encodées[, numéros de mot encodés]),
+        triés par (mot, livre) ;
+        books : (livre, nombre de téléchargements) ;
+        position_store : source des positions et numéros de mot (DatabasePositions) ; les
+        postings sont alors des (mot, livre, occurrences, tfidf), sans positions.
+
+        Les livres sont lus d'abord : un posting dont le livre n'y figure pas
+        (livre ajouté ou supprimé entre les deux lectures) est écarté, au lieu
+        de recevoir la longueur et la popularité d'un livre voisin.
+        """
+        book_ids = array('q')
+        download_counts = array('q')
+        for book_id, download_count in sorted(books):
+            book_ids.append(book_id)
+            download_counts.append(download_count or 0)
+        known_books = set(book_ids)
+
+        terms = []
+        offsets = array('q', [0])
+        doc_ids = array('q')
+        counts = array('i')
+        weights = array('f')
+        blobs = {'positions': (bytearray(), array('q', [0])), 'ordinals': (bytearray(), array('q', [0]))}
+
+        previous = None
+        dropped = 0
+        for word, book_id, count, tfidf, *encoded in postings:
+            if book_id not in known_books:
+                dropped += 1
+                continue
+            if word != previous:
+                if previous is not None:
+                    offsets.append(len(doc_ids))
+                terms.append(word)
+                previous = word
+            doc_ids.append(book_id)
+            counts.append(count)
+            weights.append(tfidf)
+            if position_store is None:
+                for (blob, blob_offsets), data in zip(blobs.values(), (*encoded, b'')):
+                    blob += data
+                    blob_offsets.append(len(blob))
+        if terms:
+            offsets.append(len(doc_ids))
+        if dropped:
+            logging.warning(f"{dropped} postings de livres inconnus écartés de l'index en mémoire")
+
+        if position_store is None:
+            position_store = BlobPositions({
+                field: (bytes(blob), np.frombuffer(blob_offsets, dtype=np.int64))
+                for field, (blob, blob_offsets) in blobs.items()
+            })
+        return cls(
+            terms,
+            np.frombuffer(offsets, dtype=np.int64),
+            np.frombuffer(doc_ids, dtype=np.int64),
+            np.frombuffer(counts, dtype=np.int32),
+            np.frombuffer(weights, dtype=np.float32),
+            position_store,
+            np.frombuffer(book_ids, dtype=np.int64),
+            np.frombuffer(download_counts, dtype=np.int64),
+            generation,
+        )
+
+    @classmethod
+    def load(cls, generation=None):
+        """Charge les postings sans leurs positions (curseur côté serveur, par lots)"""
+        if generation is None:
+            generation = IndexGeneration.current()
+        start = time.monotonic()
+
+        postings = (
+            Posting.objects.order_by('word', 'book_id')
+            .values_list('word', 'book_id', 'occurrences_count', 'tfidf')
+            .iterator(chunk_size=LOAD_CHUNK_SIZE)
+        )
+        books = Book.objects.values_list('id', 'download_count').iterator(chunk_size=LOAD_CHUNK_SIZE)
+        index = cls.build(postings, books, generation, DatabasePositions())
+        index.similarity = SimilarityIndex.from_rows(
+            Book.objects.filter(minhash__isnull=False).values_list('id', 'minhash').iterator(chunk_size=LOAD_CHUNK_SIZE)
+        )
+
+        logging.info(
+            f"Index en mémoire chargé (génération {generation}) : {len(index.terms)} termes, "
+            f"{len(index.doc_ids)} postings en {time.monotonic() - start:.1f}s"
+        )
+        return index
+
+    def _prepare_ranking(self):
+        """Impacts BM25, maxima par fenêtre de SCORE_WINDOW livres et ordre TF-IDF des postings"""
+        book_count = len(self.book_ids)
+        terms = np.repeat(np.arange(len(self.terms), dtype=np.int64), np.diff(self.offsets))
+        # Chaque posting a son livre dans book_ids (voir build)
+        ranks = np.searchsorted(self.book_ids, self.doc_ids)
+        lengths = np.bincount(ranks, weights=self.counts, minlength=book_count)
+        average_length = lengths[lengths > 0].mean() if (lengths > 0).any() else 1.0
+        # Livres sans aucun posting (pas encore indexés, ou sans mot indexable)
+        self.unindexed_book_ids = self.book_ids[lengths[:book_count] == 0]
+
+        idf = np.repeat(bm25_idf(np.diff(self.offsets), book_count), np.diff(self.offsets))
+        self.impacts = bm25_impacts(self.counts, idf, lengths[ranks], average_length)
+        self.window_count = book_count // SCORE_WINDOW + 1
+        self.block_offsets, self.block_windows, self.block_max = window_maxima(
+            self.impacts, terms, ranks // SCORE_WINDOW, len(self.terms)
+        )
+        # Postings de chaque terme par TF-IDF décroissant (livre croissant à égalité)
+        self.tfidf_order = np.lexsort((self.doc_ids, -self.tfidf, terms))
+
+    # Dictionnaire de termes
+
+    def term_id(self, word):
+        """Rang du mot dans le dictionnaire, ou None s'il n'est pas indexé"""
+        i = bisect_left(self.terms, word)
+        if i < len(self.terms) and self.terms[i] == word:
+            return i
+        return None
+
+    def term_range(self, word):
+        """Tranche (début, fin) des postings du mot ; vide s'il n'est pas indexé"""
+        i = self.term_id(word)
+        if i is None:
+            return 0, 0
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def document_frequency(self, word):
+        start, end = self.term_range(word)
+        return end - start
+
+    def complete(self, prefix, k=10):
+        """Termes commençant par prefix, par fréquence documentaire décroissante : [(terme, DF)].
+
+        Les termes d'un préfixe forment une tranche contiguë de la liste triée
+        (deux dichotomies), seuls les k plus fréquents de la tranche sont triés.
+        """
+        if not prefix:
+            return []
+        start = bisect_left(self.terms, prefix)
+        end = bisect_left(self.terms, prefix[:-1] + chr(ord(prefix[-1]) + 1), start)
+        frequencies = np.diff(self.offsets[start:end + 1])
+        if len(frequencies) > k:
+            best = np.argpartition(-frequencies, k)[:k]
+        else:
+            best = np.arange(len(frequencies))
+        best = best[np.lexsort((best, -frequencies[best]))]
+        return [(self.terms[start + i], int(frequencies[i])) for i in best.tolist()]
+
+    def similar_terms(self, word, max_distance=None):
+        """Termes à 1-2 fautes de frappe du mot : [(terme, distance)], les plus proches d'abord"""
+        if self._deletions is None:
+            self._deletions = DeletionIndex(self.terms)
+        return self._deletions.similar_terms(word, max_distance)
+
+    def trigram_index(self):
+        """Index de trigrammes du vocabulaire, construit au premier usage"""
+        if self._trigrams is None:
+            self._trigrams = TrigramIndex(self.terms)
+        return self._trigrams
+
+    def matching_terms(self, pattern):
+        """Termes où la regex trouve une correspondance, via l'index de trigrammes"""
+        return self.trigram_index().matching_terms(pattern)
+
+    def similar_books(self, book_id, n=SIMILAR_BOOKS):
+        """Livres au vocabulaire le plus proche (LSH) : [(livre, similarité de Jaccard estimée)]"""
+        if self.similarity is None:
+            return []
+        return self.similarity.similar_books(book_id, n)
+
+    # Postings
+
+    def doc_ids_for(self, word):
+        """Livres contenant le mot, triés (vue sur le tableau, sans copie)"""
+        start, end = self.term_range(word)
+        return self.doc_ids[start:end]
+
+    def posting_index(self, word, book_id):
+        """Indice global du posting (mot, livre), ou None"""
+        start, end = self.term_range(word)
+        i = start + int(np.searchsorted(self.doc_ids[start:end], book_id))
+        if i < end and self.doc_ids[i] == book_id:
+            return i
+        return None
+
+    def positions(self, word, book_id):
+        """Positions décodées du mot dans un livre"""
+        if self.posting_index(word, book_id) is None:
+            return np.empty(0, dtype=np.int64)
+        return self.positions_in_books(word, [book_id])[1]
+
+    def positions_in_books(self, word, book_ids, field='positions'):
+        """Positions du mot dans plusieurs livres, décodées en une seule passe vectorisée.
+
+        book_ids doit être trié. Renvoie (rangs, positions) : rangs[i] est l'indice
+        dans book_ids du livre de positions[i], et les couples sont triés.
+        field='ordinals' donne les numéros des mots dans le texte au lieu des
+        offsets en caractères.
+        """
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        start, end = self.term_range(word)
+        term_docs = self.doc_ids[start:end]
+        rows = np.searchsorted(term_docs, book_ids)
+        found = rows < len(term_docs)
+        found[found] = term_docs[rows[found]] == book_ids[found]
+        postings = start + rows[found]
+        if not len(postings):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        buffer, byte_lengths = self.position_store.segments(word, book_ids[found], postings, field)
+        positions, counts = decode_positions_segments(buffer, byte_lengths)
+        return np.repeat(np.flatnonzero(found), counts), positions
+
+    def _postings_in_books(self, word, book_ids):
+        """(masque des livres contenant le mot, indices globaux de leurs postings)"""
+        start, end = self.term_range(word)
+        rows = np.searchsorted(self.doc_ids[start:end], book_ids)
+        found = rows < end - start
+        found[found] = self.doc_ids[start:end][rows[found]] == book_ids[found]
+        return found, start + rows[found]
+
+    def occurrences(self, words, book_ids):
+        """Occurrences cumulées des mots dans chacun des livres : {livre: total}"""
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        totals = np.zeros(len(book_ids), dtype=np.int64)
+        for word in set(words):
+            found, postings = self._postings_in_books(word, book_ids)
+            totals[found] += self.counts[postings]
+        return dict(zip(book_ids.tolist(), totals.tolist()))
+
+    # Classement TF-IDF
+
+    def top_tfidf(self, word, k=None):
+        """Livres contenant le mot par TF-IDF décroissant, lus dans l'ordre par impact"""
+        start, end = self.term_range(word)
+        if k is not None:
+            end = min(end, start + k)
+        return self.doc_ids[self.tfidf_order[start:end]]
+
+    def tfidf_scores(self, words, book_ids):
+        """Somme des TF-IDF des mots dans chaque livre (tableau aligné sur book_ids)"""
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        scores = np.zeros(len(book_ids))
+        for word in dict.fromkeys(words):
+            found, postings = self._postings_in_books(word, book_ids)
+            scores[found] += self.tfidf[postings]
+        return scores
+
+    def rank_by_tfidf(self, words, book_ids):
+        """Livres triés par somme des TF-IDF décroissante (ID croissant à égalité)"""
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        return book_ids[np.lexsort((book_ids, -self.tfidf_scores(words, book_ids)))]
+
+    # Classement BM25
+
+    def bm25_scores(self, words, book_ids):
+        """Score BM25 de chaque livre pour les mots (tableau aligné sur book_ids)"""
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        scores = np.zeros(len(book_ids))
+        for word in dict.fromkeys(words):
+            found, postings = self._postings_in_books(word, book_ids)
+            scores[found] += self.impacts[postings]
+        return scores
+
+    def window_maxima_for(self, word):
+        """(fenêtres, impact maximal du mot dans chacune)"""
+        i = self.term_id(word)
+        if i is None:
+            return self.block_windows[:0], self.block_max[:0]
+        start, end = self.block_offsets[i], self.block_offsets[i + 1]
+        return self.block_windows[start:end], self.block_max[start:end]
+
+    def windows_of(self, book_ids):
+        """Fenêtre block-max de chaque livre"""
+        return np.searchsorted(self.book_ids, book_ids) // SCORE_WINDOW
+
+    # Livres
+
+    def download_counts_for(self, book_ids):
+        """Téléchargements de chaque livre (0 pour un livre inconnu)"""
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        if not len(self.book_ids):
+            return np.zeros(len(book_ids), dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.book_ids, book_ids), len(self.book_ids) - 1)
+        return np.where(self.book_ids[rows] == book_ids, self.download_counts[rows], 0)
+
+    def rank_by_downloads(self, book_ids, boost=None):
+        """Livres triés par popularité décroissante (ordre de BookListView).
+
+        boost (tableau aligné sur book_ids, dans [0, 1]) multiplie le poids
+        log-popularité d'un livre jusqu'à (1 + boost) : bonus de proximité.
+        """
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        downloads = self.download_counts_for(book_ids)
+        if boost is None:
+            order = np.argsort(-downloads, kind='stable')
+        else:
+            order = np.argsort(-(1 + np.log1p(downloads)) * (1 + np.asarray(boost)), kind='stable')
+        return book_ids[order]
+
+
+_index = None
+_last_check = 0.0
+_lock = threading.Lock()
+# Thread de chargement en cours (un seul à la fois)
+_loader = None
+
+
+def _load_in_background(generation):
+    global _index, _loader
+    try:
+        index = InvertedIndex.load(generation)
+        with _lock:
+            _index = index
+    except Exception:
+        logging.exception("Échec du chargement de l'index en mémoire")
+    finally:
+        with _lock:
+            _loader = None
+        # Connexion propre à ce thread
+        connection.close()
+
+
+def _start_loader(generation=None):
+    """Lance le chargement s'il n'y en a pas déjà un ; à appeler sous _lock"""
+    global _loader
+    # Un thread hérité d'un fork (gunicorn --preload) n'est plus vivant
+    if _loader is None or not _loader.is_alive():
+        _loader = threading.Thread(
+            target=_load_in_background, args=(generation,), name='search-index-loader', daemon=True
+        )
+        _loader.start()
+    return _loader
+
+
+def wait_for_index(timeout=None):
+    """Attend la fin du chargement en cours ; renvoie l'index résident (None s'il n'y en a pas)"""
+    loader = _loader
+    if loader is not None:
+        loader.join(timeout)
+    return _index
+
+
+def get_index():
+    """Index résident du processus.
+
+    Quand la génération d'indexation change, le nouvel index est chargé en
+    arrière-plan et l'ancien reste servi. Seule une requête arrivant avant le
+    tout premier chargement l'attend.
+    """
+    global _last_check
+
+    index = _index
+    if index is not None and time.monotonic() - _last_check < REFRESH_CHECK_SECONDS:
+        return index
+
+    with _lock:
+        if _index is not None:
+            if time.monotonic() - _last_check >= REFRESH_CHECK_SECONDS:
+                _last_check = time.monotonic()
+                generation = IndexGeneration.current()
+                if _index.generation != generation:
+                    _start_loader(generation)
+            return _index
+        _start_loader()
+
+    index = wait_for_index()
+    if index is None:
+        raise RuntimeError("Index de recherche indisponible (voir les journaux du chargement)")
+    return index
+
+
+def reset_index():
+    """Oublie l'index chargé : le prochain appel à get_index() le recharge"""
+    global _index, _last_check
+    wait_for_index()
+    with _lock:
+        _index = None
+        _last_check = 0.0
@@ -15,6 +15,11 @@ class BookSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'authors', 'language', 'description', 'subjects', 'bookshelves', 'cover_image', 'download_count', 'copyright', 'text_content']
 
 class IndexSerializer(serializers.ModelSerializer):
+    positions = serializers.SerializerMethodField()
+
     class Meta:
         model = Index
         fields = ['id', 'word', 'book', 'occurrences_count','positions']
+
+    def get_positions(self, obj):
+        return obj.get_positions()
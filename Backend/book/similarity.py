@@ -0,0 +1,118 @@
+"""
+Livres similaires par similarité cosinus des vecteurs TF-IDF
+
+Les poids TF-IDF des postings (ForwardIndex) forment une matrice creuse
+livre x terme, lue en une passe. Les termes présents dans plus de
+MAX_DOCUMENT_RATIO des livres sont retirés : leur IDF est faible et ce sont
+eux qui rendent le produit coûteux (son coût suit la somme des carrés des
+fréquences documentaires). Les lignes sont ensuite normalisées (norme L2),
+la similarité cosinus de toutes les paires est donc M @ M.T.
+
+Ce produit est calculé par blocs de COSINE_BLOCK_ROWS livres, répartis sur un
+pool de processus : chaque bloc ne garde, pour chacun de ses livres, que les
+NEIGHBOURS voisins de similarité supérieure à COSINE_THRESHOLD. La mémoire
+reste bornée par la taille d'un bloc dense (lignes x livres), quel que soit
+le nombre de livres. Les voisins sont enregistrés dans la table SimilarBook,
+lue telle quelle par /books/<id>/similar/.
+"""
+
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+from .models import Posting
+
+
+# Voisins gardés par livre
+NEIGHBOURS = 10
+# Similarité minimale d'un voisin
+COSINE_THRESHOLD = 0.05
+# Termes retirés au-delà de cette proportion de livres les contenant
+MAX_DOCUMENT_RATIO = 0.5
+# Livres par bloc du produit matriciel
+COSINE_BLOCK_ROWS = 256
+# Lignes lues par aller-retour du curseur serveur
+LOAD_CHUNK_SIZE = 20000
+
+_matrix = None
+_transposed = None
+
+
+def load_book_term_matrix(book_ids, weighted=False):
+    """Matrice creuse livre x terme depuis les postings (lignes dans l'ordre de book_ids triés).
+
+    weighted : poids TF-IDF des postings, sinon 1.0 (incidence).
+    """
+    book_ranks = array('q')
+    term_ids = array('q')
+    weights = array('f')
+    term_count = 0
+    previous = None
+    fields = ('word', 'book_id', 'tfidf') if weighted else ('word', 'book_id')
+    postings = Posting.objects.order_by('word').values_list(*fields).iterator(chunk_size=LOAD_CHUNK_SIZE)
+    for row in postings:
+        if row[0] != previous:
+            term_count += 1
+            previous = row[0]
+        book_ranks.append(row[1])
+        term_ids.append(term_count - 1)
+        weights.append(row[2] if weighted else 1.0)
+
+    book_ranks = np.searchsorted(book_ids, np.frombuffer(book_ranks, dtype=np.int64))
+    matrix = sparse.csr_matrix(
+        (np.frombuffer(weights, dtype=np.float32), (book_ranks, np.frombuffer(term_ids, dtype=np.int64))),
+        shape=(len(book_ids), term_count),
+    )
+    matrix.sum_duplicates()
+    return matrix
+
+
+def normalized_rows(matrix, max_document_ratio=MAX_DOCUMENT_RATIO):
+    """Lignes de norme 1, sans les termes trop fréquents ni les poids nuls"""
+    matrix = matrix.tocsc()
+    document_frequency = np.diff(matrix.indptr)
+    if max_document_ratio is not None:
+        matrix = matrix[:, np.flatnonzero(document_frequency <= max_document_ratio * matrix.shape[0])]
+    matrix = matrix.tocsr().astype(np.float32)
+    matrix.eliminate_zeros()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return (sparse.diags(inverse.astype(np.float32)) @ matrix).tocsr()
+
+
+def _init_worker(matrix):
+    global _matrix, _transposed
+    _matrix = matrix
+    _transposed = matrix.T.tocsr()
+
+
+def _block_neighbours(start, end, k, threshold):
+    """Exécuté dans un processus du pool : (livres, voisins, similarités) d'un bloc de lignes"""
+    similarity = (_matrix[start:end] @ _transposed).toarray()
+    similarity[np.arange(end - start), np.arange(start, end)] = 0.0
+    if similarity.shape[1] > k:
+        candidates = np.argpartition(-similarity, k, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(similarity.shape[1]), similarity.shape)
+    scores = np.take_along_axis(similarity, candidates, axis=1)
+    rows, columns = np.nonzero(scores > threshold)
+    return rows + start, candidates[rows, columns], scores[rows, columns]
+
+
+def cosine_neighbours(matrix, k=NEIGHBOURS, threshold=COSINE_THRESHOLD, block_rows=COSINE_BLOCK_ROWS, workers=None):
+    """Voisins de chaque ligne d'une matrice normalisée : tableaux (ligne, voisin, similarité)"""
+    blocks = [(start, min(start + block_rows, matrix.shape[0])) for start in range(0, matrix.shape[0], block_rows)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(matrix)
+        results = [_block_neighbours(start, end, k, threshold) for start, end in blocks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(matrix,)) as pool:
+            results = list(pool.map(_block_neighbours, *zip(*blocks), [k] * len(blocks), [threshold] * len(blocks)))
+    if not results:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    rows, columns, scores = (np.concatenate(parts) for parts in zip(*results))
+    return rows, columns, scores
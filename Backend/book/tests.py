@@ -3,8 +3,42 @@ from rest_framework.test import APIRequestFactory
 from rest_framework.response import Response
 from types import SimpleNamespace
 from unittest.mock import patch
+import asyncio
+import multiprocessing
+import re
+import time
+import numpy as np
+import gzip
+import tempfile
+from pathlib import Path
 
-from book.book_views import BookSearchView, BookHighlightSearchView, BookAdvancedSearchView
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from book.book_views import (BookSearchView, BookHighlightSearchView, BookAdvancedSearchView, BookTFIDFSearchView,
+                             BookSuggestView, BookSimilarView)
+from book.positions import encode_positions, decode_positions, decode_positions_array
+from book.analyzer import (analyze_query, extract_words_with_offsets, extract_words_with_positions, get_stopwords,
+                           primary_language)
+from book.search_engine import InvertedIndex
+from book import search_engine
+from book.query import (And, Near, Not, Or, Phrase, Term, evaluate, expand_fuzzy, intersect, minimal_spans,
+                        parse_query, phrase_match_counts, positive_terms, proximity_scores)
+from book.async_fetcher import AsyncFetcher
+from book.text_cache import ImportCheckpoint, TextCache
+from book.importer import AuthorResolver
+from book.catalog import TextSource, book_from_csv_row, book_from_rdf
+from book.ranking import RankedResults, top_k
+from book.vocabulary import TrigramIndex, regex_filter
+from book.text_search import candidate_books, scan_texts
+from book import text_search
+from book.fuzzy import DeletionIndex
+from book.graph import jaccard_graph, pagerank
+from book.similarity import cosine_neighbours, load_book_term_matrix, normalized_rows
+from book.minhash import SimilarityIndex, decode_signature, encode_signature, signature
+import networkx as nx
+from scipy import sparse
+from rapidfuzz.distance import Levenshtein
 
 # Sérialiseur factice pour ne pas toucher à la BDD pendant les tests
 class FakeBookSerializer:
@@ -24,8 +58,31 @@ class FakeBookSerializer:
         }
 
 # Utilitaires
-def make_book(id, title, text=''):
-    return SimpleNamespace(id=id, title=title, text_content=text)
+def make_book(id, title, text='', pagerank=0.0):
+    return SimpleNamespace(id=id, title=title, text_content=text, pagerank=pagerank)
+
+def make_index(postings, downloads=None, ordinals=None):
+    """Index en mémoire construit à partir de {mot: {livre: positions}} (et des numéros de mot, même forme)"""
+    downloads = downloads or {}
+    ordinals = ordinals or {}
+    rows = [
+        (word, book_id, len(positions), 0.0, encode_positions(positions),
+         encode_positions(ordinals.get(word, {}).get(book_id, [])))
+        for word in sorted(postings)
+        for book_id, positions in sorted(postings[word].items())
+    ]
+    book_ids = {book_id for books in postings.values() for book_id in books} | set(downloads)
+    return InvertedIndex.build(rows, [(book_id, downloads.get(book_id, 0)) for book_id in book_ids])
+
+def index_from_texts(texts):
+    """Index en mémoire des textes {livre: texte}, analysés comme à l'indexation"""
+    postings = {}
+    ordinals = {}
+    for book_id, text in texts.items():
+        for word, (positions, numbers) in extract_words_with_offsets(text).items():
+            postings.setdefault(word, {})[book_id] = positions
+            ordinals.setdefault(word, {})[book_id] = numbers
+    return make_index(postings, ordinals=ordinals)
 
 class FakeQuerySet:
     def __init__(self, items):
@@ -106,22 +163,22 @@ class SearchEndpointTests(LabeledTestCase):
         self.book2 = make_book(2, 'Dog Stories', 'dog and cat play')
 
     @patch('book.book_views.BookSerializer', FakeBookSerializer)
-    @patch('book.book_views.compute_pagerank', return_value={1: 0.7, 2: 0.3})
     @patch('book.book_views.Index')
-    @patch.object(BookSearchView, 'get_queryset', return_value=[make_book(1, 'Cat Tales'), make_book(2, 'Dog Stories')])
-    def test_simple_search(self, mocked_get_queryset, mock_index_model, mock_compute_pagerank):
+    @patch('book.book_views.books_in_order',
+           return_value=[make_book(1, 'Cat Tales', pagerank=0.7), make_book(2, 'Dog Stories', pagerank=0.3)])
+    @patch('book.book_views.get_index', return_value=make_index({'cat': {1: [0, 19], 2: [11]}, 'dog': {2: [0]}}))
+    @patch.object(BookSearchView, 'get_queryset', return_value=[1, 2])
+    def test_simple_search(self, mocked_get_queryset, mock_get_index, mock_books_in_order, mock_index_model):
         # Recherche simple
         mock_index_model.objects.filter.return_value = [FakeIndexEntry(book_id=1, occurrences_count=2), FakeIndexEntry(book_id=2, occurrences_count=1)]
 
         # Simule la pagination et capture la réponse
-        with patch.object(BookSearchView, 'paginate_queryset', return_value=[self.book1, self.book2]):
+        with patch.object(BookSearchView, 'paginate_queryset', return_value=[1, 2]):
             def fake_get_paginated_response(self, data):
                 return Response({'results': data})
             with patch.object(BookSearchView, 'get_paginated_response', new=fake_get_paginated_response):
-                # Évite l'appel à get_similar_books_from_graph pendant le test
-                with patch.object(BookSearchView, 'get_similar_books_from_graph', return_value=[]):
-                    request = self.factory.get('/api/books/search/', {'q': 'cat'})
-                    response = BookSearchView.as_view()(request)
+                request = self.factory.get('/api/books/search/', {'q': 'cat'})
+                response = BookSearchView.as_view()(request)
 
         self.assertEqual(response.status_code, 200)
         results = response.data['results']
@@ -150,20 +207,14 @@ class SearchEndpointTests(LabeledTestCase):
     @patch('book.book_views.BookSerializer', FakeBookSerializer)
     @patch('book.book_views.CustomPagination.paginate_queryset', lambda self, books, request: books)
     @patch('book.book_views.CustomPagination.get_paginated_response', lambda self, data: Response({'results': data}))
-    @patch('book.book_views.Index')
+    @patch('book.book_views.get_index')
     @patch('book.book_views.Book')
-    def test_highlight_search(self, mock_book_model, mock_index_model):
-        # Simule les entrées d'index avec positions
-        full_index = FakeQuerySet([FakeIndexEntry(book_id=1, positions=[0, 10])])
-        # Si book_id en param, renvoie les positions correspondantes
-        def index_filter_side_effect(*args, **kwargs):
-            if 'book_id' in kwargs:
-                return [FakeIndexEntry(book_id=kwargs['book_id'], positions=[0, 10])]
-            return full_index
-        mock_index_model.objects.filter.side_effect = index_filter_side_effect
+    def test_highlight_search(self, mock_book_model, mock_get_index):
+        # Simule l'index en mémoire avec positions
+        mock_get_index.return_value = make_index({'cat': {1: [0, 16]}})
 
-        # Book.objects.filter renvoie les livres correspondants
-        mock_book_model.objects.filter.return_value = FakeQuerySet([self.book1])
+        # Book.objects...in_bulk renvoie les livres correspondants
+        mock_book_model.objects.prefetch_related.return_value.in_bulk.return_value = {1: self.book1}
 
         request = self.factory.get('/api/books/highlight-search/', {'q': 'cat'})
         response = BookHighlightSearchView.as_view()(request)
@@ -172,13 +223,40 @@ class SearchEndpointTests(LabeledTestCase):
         results = response.data['results']
         self.assertTrue(any('highlighted_text' in r for r in results))
 
+    @patch('book.book_views.BookSerializer', FakeBookSerializer)
+    @patch('book.book_views.CustomPagination.paginate_queryset', lambda self, books, request, view=None: books[0:10])
+    @patch('book.book_views.CustomPagination.get_paginated_response', lambda self, data: Response({'results': data}))
+    @patch('book.book_views.ForwardIndex')
+    @patch('book.book_views.get_index')
+    @patch('book.book_views.Book')
+    def test_tfidf_search(self, mock_book_model, mock_get_index, mock_forward_index):
+        """Les livres sont classés par TF-IDF décroissant, avec le détail des scores"""
+        mock_get_index.return_value = InvertedIndex.build(
+            [('cat', 1, 2, 0.1, b''), ('cat', 2, 1, 0.4, b'')], [(1, 0), (2, 0)]
+        )
+        mock_book_model.objects.prefetch_related.return_value.in_bulk.return_value = {1: self.book1, 2: self.book2}
+        mock_forward_index.objects.filter.return_value.values_list.return_value = [
+            (1, 0.05, 2.0, 0.1, 2), (2, 0.2, 2.0, 0.4, 1),
+        ]
+
+        request = self.factory.get('/api/books/tfidf-search/', {'q': 'cat'})
+        response = BookTFIDFSearchView.as_view()(request)
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([r['id'] for r in results], [2, 1])
+        self.assertAlmostEqual(results[0]['tfidf_score'], 0.4)
+        self.assertAlmostEqual(results[0]['idf_score'], 2.0)
+        self.assertEqual(results[1]['word_occurrences'], 2)
+
     @patch('book.book_views.BookSerializer', FakeBookSerializer)
     @patch('book.book_views.CustomPagination.paginate_queryset', lambda self, books, request: books)
     @patch('book.book_views.CustomPagination.get_paginated_response', lambda self, data: Response({'results': data}))
-    @patch('book.book_views.compute_pagerank', return_value={1: 0.9, 2: 0.1})
+    @patch('book.book_views.get_index', return_value=make_index({'cat': {1: [0], 2: [11]}, 'dog': {2: [0]}}))
+    @patch('book.book_views.search_texts', return_value=([1], True))
     @patch('book.book_views.Index')
     @patch('book.book_views.Book')
-    def test_advanced_search(self, mock_book_model, mock_index_model, mock_compute):
+    def test_advanced_search(self, mock_book_model, mock_index_model, mock_search_texts, mock_get_index):
         # Recherche avancée
         class FakeValues:
             def __init__(self, data):
@@ -206,4 +284,661 @@ class SearchEndpointTests(LabeledTestCase):
 
         request = self.factory.get('/api/books/advanced-search/', {'q': 'cat'})
         response = BookAdvancedSearchView.as_view()(request)
-        self.assertIn(response.status_code, (200, 404))
\ No newline at end of file
+        self.assertIn(response.status_code, (200, 404))
+
+
+class PositionsEncodingTests(LabeledTestCase):
+    def test_round_trip(self):
+        """Les positions encodées (delta + varint) se décodent à l'identique"""
+        positions = [0, 3, 127, 128, 300, 16384, 2**31 + 5]
+        encoded = encode_positions(positions)
+        self.assertIsInstance(encoded, bytes)
+        self.assertEqual(decode_positions(encoded), positions)
+        self.assertEqual(decode_positions_array(encoded).tolist(), positions)
+
+    def test_compact_and_empty(self):
+        """Les petits écarts tiennent sur un octet et une liste vide donne b''"""
+        self.assertEqual(encode_positions([]), b'')
+        self.assertEqual(decode_positions(b''), [])
+        self.assertEqual(len(encode_positions(range(0, 1000, 10))), 100)
+
+
+class AnalyzerTests(LabeledTestCase):
+    def test_index_and_query_terms_match(self):
+        """La requête est analysée comme le texte indexé (minuscules, stopwords, mots courts)"""
+        text = "The Whale and the CAPTAIN of the ship"
+        indexed = extract_words_with_positions(text, 'en')
+        self.assertEqual(indexed, {'whale': [4], 'captain': [18], 'ship': [33]})
+        self.assertEqual(analyze_query("the WHALE of a captain"), ['whale', 'captain'])
+
+    def test_bundled_stopwords(self):
+        """Les stopwords sont lus depuis les ressources livrées, par langue"""
+        self.assertIn('the', get_stopwords('en'))
+        self.assertIn('avec', get_stopwords('fr'))
+        self.assertIs(get_stopwords('fr'), get_stopwords('fr'))
+        self.assertEqual(primary_language('fr, en'), 'fr')
+        self.assertEqual(extract_words_with_positions("Avec le capitaine", primary_language('fr')), {'capitaine': [8]})
+
+
+class AsyncFetcherTests(LabeledTestCase):
+    def run_with_server(self, scenario):
+        """Lance un faux gutendex local et exécute le scénario contre lui"""
+        calls = {'text': 0}
+
+        async def books(request):
+            page = int(request.query.get('page', 1))
+            next_url = str(request.url.with_query(page=page + 1)) if page < 3 else None
+            return web.json_response({'count': 3, 'next': next_url, 'results': [{'id': page}]})
+
+        async def text(request):
+            calls['text'] += 1
+            if calls['text'] == 1:
+                return web.Response(status=429, headers={'Retry-After': '0'})
+            return web.Response(text='Call me Ishmael.')
+
+        async def main():
+            app = web.Application()
+            app.router.add_get('/books/', books)
+            app.router.add_get('/text', text)
+            async with TestServer(app) as server:
+                async with AsyncFetcher(concurrency=4, per_host=2, initial_backoff=0.01, max_delay=0.05) as fetcher:
+                    return await scenario(fetcher, str(server.make_url('')))
+
+        return asyncio.run(main()), calls
+
+    def test_pages_are_followed(self):
+        """Toutes les pages du catalogue sont parcourues via la clé next"""
+        async def scenario(fetcher, base_url):
+            return [page['results'][0]['id'] async for page in fetcher.iter_pages(base_url + '/books/')]
+
+        ids, _ = self.run_with_server(scenario)
+        self.assertEqual(ids, [1, 2, 3])
+
+    def test_interrupted_pages_cancel_prefetch(self):
+        """Un parcours interrompu ne laisse aucun préchargement actif après la fermeture de la session"""
+        prefetched = []
+
+        async def scenario(fetcher, base_url):
+            # Le générateur reste référencé : il n'est pas fermé par le ramasse-miettes
+            pages = fetcher.iter_pages(base_url + '/books/')
+            async for page in pages:
+                prefetched.extend(fetcher._prefetches)
+                break
+            return fetcher, pages
+
+        (fetcher, _), _ = self.run_with_server(scenario)
+        self.assertTrue(prefetched)
+        self.assertTrue(all(task.cancelled() for task in prefetched))
+        self.assertFalse(fetcher._prefetches)
+        self.assertTrue(fetcher.session.closed)
+
+    def test_retry_after_throttling(self):
+        """Une réponse 429 ralentit l'hôte puis la requête est retentée"""
+        async def scenario(fetcher, base_url):
+            text = await fetcher.get(base_url + '/text')
+            return text, fetcher.throttle_for(base_url + '/text').delay
+
+        (text, delay), calls = self.run_with_server(scenario)
+        self.assertEqual(text, 'Call me Ishmael.')
+        self.assertEqual(calls['text'], 2)
+        self.assertLess(delay, 0.05)
+
+
+class TextCacheTests(LabeledTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_texts_are_shared_and_verified(self):
+        """Les textes identiques sont stockés une fois et un objet corrompu est ignoré"""
+        cache = TextCache(self.root / 'texts')
+        digest = cache.put(11, 'Alice was beginning to get very tired')
+        self.assertEqual(cache.put(12, 'Alice was beginning to get very tired'), digest)
+        self.assertEqual(len(list((self.root / 'texts' / 'objects').rglob('*.txt.gz'))), 1)
+        self.assertIn(12, cache)
+        self.assertEqual(cache.get(11), 'Alice was beginning to get very tired')
+        self.assertIsNone(cache.get(13))
+
+        cache._object_path(digest).write_bytes(gzip.compress(b'altered'))
+        self.assertIsNone(cache.get(11))
+
+    def test_checkpoint_round_trip(self):
+        """Le point de reprise survit à un redémarrage et disparaît une fois effacé"""
+        path = self.root / 'checkpoint.json'
+        ImportCheckpoint(path).save('https://gutendex.com/books/?page=3', 64)
+        checkpoint = ImportCheckpoint(path)
+        self.assertEqual((checkpoint.next_url, checkpoint.books_done), ('https://gutendex.com/books/?page=3', 64))
+        checkpoint.clear()
+        self.assertFalse(path.exists())
+        self.assertIsNone(ImportCheckpoint(path).next_url)
+
+
+class AuthorResolverTests(LabeledTestCase):
+    @patch('book.importer.Author')
+    def test_authors_resolved_in_bulk_and_cached(self, mock_author):
+        """Les auteurs d'une page sont résolus en une lecture et une insertion, puis servis par le cache"""
+        mock_author.objects.filter.return_value.order_by.return_value.values_list.return_value = [(7, 'Dickens, Charles')]
+        mock_author.side_effect = lambda **fields: SimpleNamespace(id=None, **fields)
+
+        def bulk_create(authors):
+            for new_id, author in enumerate(authors, start=100):
+                author.id = new_id
+            return authors
+        mock_author.objects.bulk_create.side_effect = bulk_create
+
+        resolver = AuthorResolver()
+        page = [{'name': 'Dickens, Charles'}, {'name': 'Austen, Jane', 'birth_year': 1775}, {'name': 'Dickens, Charles'}]
+        self.assertEqual(resolver.resolve(page), {'Dickens, Charles': 7, 'Austen, Jane': 100})
+        self.assertEqual(mock_author.objects.filter.call_count, 1)
+        self.assertEqual(mock_author.objects.bulk_create.call_count, 1)
+
+        self.assertEqual(resolver.resolve([{'name': 'Austen, Jane'}]), {'Austen, Jane': 100})
+        self.assertEqual(mock_author.objects.filter.call_count, 1)
+
+
+class CatalogTests(LabeledTestCase):
+    RDF = b"""<?xml version="1.0" encoding="utf-8"?>
+<rdf:RDF xmlns:dcterms="http://purl.org/dc/terms/" xmlns:pgterms="http://www.gutenberg.org/2009/pgterms/"
+         xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:dcam="http://purl.org/dc/dcam/">
+  <pgterms:ebook rdf:about="ebooks/98">
+    <dcterms:creator><pgterms:agent><pgterms:name>Dickens, Charles</pgterms:name>
+      <pgterms:birthdate>1812</pgterms:birthdate><pgterms:deathdate>1870</pgterms:deathdate></pgterms:agent></dcterms:creator>
+    <dcterms:title>A Tale of Two Cities</dcterms:title>
+    <dcterms:language><rdf:Description><rdf:value>en</rdf:value></rdf:Description></dcterms:language>
+    <dcterms:subject><rdf:Description><dcam:memberOf rdf:resource="http://purl.org/dc/terms/LCSH"/>
+      <rdf:value>Historical fiction</rdf:value></rdf:Description></dcterms:subject>
+    <dcterms:subject><rdf:Description><dcam:memberOf rdf:resource="http://purl.org/dc/terms/LCC"/>
+      <rdf:value>PR</rdf:value></rdf:Description></dcterms:subject>
+    <pgterms:downloads>1234</pgterms:downloads>
+  </pgterms:ebook>
+</rdf:RDF>"""
+
+    def test_catalog_entries_in_gutendex_format(self):
+        """Les notices RDF et CSV donnent des livres au format gutendex"""
+        book = book_from_rdf(self.RDF)
+        self.assertEqual((book['id'], book['title'], book['languages']), (98, 'A Tale of Two Cities', ['en']))
+        self.assertEqual(book['authors'], [{'name': 'Dickens, Charles', 'birth_year': 1812, 'death_year': 1870}])
+        self.assertEqual((book['subjects'], book['download_count']), (['Historical fiction'], 1234))
+
+        row = {'Text#': '98', 'Type': 'Text', 'Title': 'A Tale', 'Language': 'en; fr',
+               'Authors': 'Dickens, Charles, 1812-1870; Browne, Hablot K., 1815?-1882 [Illustrator]'}
+        book = book_from_csv_row(row)
+        self.assertEqual(book['languages'], ['en', 'fr'])
+        self.assertEqual([(a['name'], a['birth_year'], a['death_year']) for a in book['authors']],
+                         [('Dickens, Charles', 1812, 1870), ('Browne, Hablot K.', 1815, 1882)])
+        self.assertIsNone(book_from_csv_row(dict(row, Type='Sound')))
+
+    def test_text_source_prefers_utf8_variant(self):
+        """Les textes sont trouvés par ID dans un miroir, la variante UTF-8 en priorité"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = Path(tmp_dir)
+            (root / '9' / '8').mkdir(parents=True)
+            (root / '9' / '8' / '98.txt').write_text('ascii')
+            (root / '9' / '8' / '98-0.txt').write_text('Café', encoding='utf-8')
+            (root / '99-8.txt').write_bytes('Noël'.encode('latin-1'))
+            source = TextSource(root)
+            self.assertEqual((source.read(98), source.read(99)), ('Café', 'Noël'))
+            self.assertNotIn(100, source)
+
+
+class InvertedIndexTests(LabeledTestCase):
+    def test_postings_served_from_memory(self):
+        """Les postings, positions et occurrences sont lus dans les tableaux en mémoire"""
+        index = make_index(
+            {'whale': {3: [5, 40], 1: [7]}, 'ship': {3: [12]}},
+            downloads={1: 10, 3: 500},
+        )
+        self.assertEqual(index.terms, ['ship', 'whale'])
+        self.assertEqual(index.doc_ids_for('whale').tolist(), [1, 3])
+        self.assertEqual(index.document_frequency('captain'), 0)
+        self.assertEqual(index.positions('whale', 3).tolist(), [5, 40])
+        self.assertEqual(index.occurrences(['whale', 'ship'], [1, 3, 9]), {1: 1, 3: 3, 9: 0})
+        self.assertEqual(index.rank_by_downloads([1, 3]).tolist(), [3, 1])
+
+    def test_postings_ordered_by_impact(self):
+        """Chaque terme garde ses livres par TF-IDF décroissant : le top-k se lit sans tri"""
+        index = InvertedIndex.build(
+            [('ship', 4, 1, 0.3, b''), ('whale', 1, 1, 0.2, b''), ('whale', 2, 1, 0.9, b''), ('whale', 3, 1, 0.5, b'')],
+            [(book_id, 0) for book_id in range(1, 5)],
+        )
+        self.assertEqual(index.top_tfidf('whale').tolist(), [2, 3, 1])
+        self.assertEqual(index.top_tfidf('whale', 2).tolist(), [2, 3])
+        self.assertEqual(index.top_tfidf('ship').tolist(), [4])
+        self.assertEqual(index.rank_by_tfidf(['whale', 'ship'], [1, 3, 4]).tolist(), [3, 4, 1])
+
+    def test_postings_of_unknown_books_dropped(self):
+        """Un posting dont le livre manque à la liste des livres est écarté, sans emprunter un livre voisin"""
+        index = InvertedIndex.build(
+            [('ship', 9, 4, 0.1, b''), ('whale', 1, 1, 0.2, b''), ('whale', 9, 3, 0.9, b'')],
+            [(1, 10), (12, 500)],
+        )
+        self.assertEqual(index.terms, ['whale'])
+        self.assertEqual(index.doc_ids_for('whale').tolist(), [1])
+        self.assertEqual(index.top_tfidf('whale').tolist(), [1])
+        self.assertEqual(index.unindexed_book_ids.tolist(), [12])
+
+    @patch('book.search_engine.InvertedIndex.load')
+    @patch('book.search_engine.IndexGeneration')
+    def test_reloaded_when_generation_changes(self, mock_generation, mock_load):
+        """L'index est rechargé en arrière-plan à la génération suivante, l'ancien reste servi entre-temps"""
+        mock_generation.current.return_value = 1
+        def load(generation):
+            generation = generation or mock_generation.current.return_value
+            return InvertedIndex.build([], [(generation, 0)], generation)
+
+        mock_load.side_effect = load
+        search_engine.reset_index()
+        try:
+            first = search_engine.get_index()
+            self.assertEqual(first.book_ids.tolist(), [1])
+            self.assertIs(search_engine.get_index(), first)
+            with patch('book.search_engine.REFRESH_CHECK_SECONDS', 0):
+                self.assertIs(search_engine.get_index(), first)
+                mock_generation.current.return_value = 2
+                self.assertIs(search_engine.get_index(), first)
+                self.assertEqual(search_engine.wait_for_index().book_ids.tolist(), [2])
+                self.assertEqual(search_engine.get_index().book_ids.tolist(), [2])
+            self.assertEqual(mock_load.call_count, 2)
+        finally:
+            search_engine.reset_index()
+
+    def test_positions_read_on_demand(self):
+        """Un index chargé depuis la base ne lit que les positions des livres demandés, une seule fois"""
+        store = search_engine.DatabasePositions()
+        index = InvertedIndex.build(
+            [('whale', 1, 1, 0.0), ('whale', 3, 2, 0.0)], [(1, 0), (3, 0), (5, 0)], position_store=store
+        )
+        rows = {(1, 'whale'): encode_positions([7]), (3, 'whale'): encode_positions([5, 40])}
+        with patch.object(store, '_fetch', side_effect=lambda word, books, field: {
+            book_id: rows[book_id, word] for book_id in books
+        }) as mock_fetch:
+            self.assertEqual(index.positions('whale', 3).tolist(), [5, 40])
+            ranks, positions = index.positions_in_books('whale', [1, 3, 5])
+            self.assertEqual((ranks.tolist(), positions.tolist()), ([0, 1, 1], [7, 5, 40]))
+            self.assertEqual(index.positions('whale', 5).tolist(), [])
+        self.assertEqual([call.args for call in mock_fetch.call_args_list],
+                         [('whale', [3], 'positions'), ('whale', [1], 'positions')])
+
+
+class BooleanQueryTests(LabeledTestCase):
+    def setUp(self):
+        self.index = make_index({
+            'sea': {1: [0], 2: [0], 3: [0], 5: [0]},
+            'monster': {2: [4], 3: [4], 4: [0]},
+            'whale': {3: [9], 6: [0]},
+        })
+
+    def test_parse_operators(self):
+        """AND implicite, OR, NOT/-mot et parenthèses ; les stopwords disparaissent"""
+        self.assertEqual(parse_query('the sea monster'), And((Term('sea'), Term('monster'))))
+        self.assertEqual(
+            parse_query('(sea OR whale) -monster'),
+            And((Or((Term('sea'), Term('whale'))), Not(Term('monster')))),
+        )
+        self.assertEqual(parse_query('sea AND NOT whale)'), And((Term('sea'), Not(Term('whale')))))
+        self.assertIsNone(parse_query('the OR and'))
+        self.assertEqual(positive_terms(parse_query('sea -whale monster')), ['sea', 'monster'])
+
+    def test_evaluate_with_author_filter(self):
+        """Les requêtes sont évaluées sur les postings, le filtre auteur dans le même ET"""
+        self.assertEqual(evaluate(parse_query('sea monster'), self.index).tolist(), [2, 3])
+        self.assertEqual(evaluate(parse_query('monster OR whale'), self.index).tolist(), [2, 3, 4, 6])
+        self.assertEqual(evaluate(parse_query('sea NOT monster'), self.index).tolist(), [1, 5])
+        self.assertEqual(evaluate(parse_query('-sea'), self.index).tolist(), [4, 6])
+        self.assertEqual(evaluate(parse_query('sea'), self.index, restrict=[3, 4, 5]).tolist(), [3, 5])
+        self.assertEqual(evaluate(parse_query('kraken sea'), self.index).tolist(), [])
+
+    def test_intersect_matches_set_intersection(self):
+        """L'intersection par dichotomie donne le même résultat qu'une intersection d'ensembles"""
+        rng = np.random.default_rng(7)
+        for _ in range(20):
+            small = np.unique(rng.integers(0, 500, 20))
+            large = np.unique(rng.integers(0, 500, 300))
+            self.assertEqual(intersect(small, large).tolist(), sorted(set(small.tolist()) & set(large.tolist())))
+
+
+class PhraseQueryTests(LabeledTestCase):
+    def setUp(self):
+        self.index = index_from_texts({
+            1: "The old man and the sea. An old,\r\nman. Old man!",
+            2: "An old boat, a man and a dog; the sea was calm.",
+            3: "Old men and old women by the sea, but no old man",
+        })
+
+    def test_phrase_parsed_with_query_gaps(self):
+        """Une phrase entre guillemets garde l'écart entre ses mots, stopwords compris"""
+        self.assertEqual(parse_query('"old man"'), Phrase(('old', 'man'), (4,)))
+        self.assertEqual(parse_query('"man and the sea" -dog'), And((Phrase(('man', 'sea'), (12,)), Not(Term('dog')))))
+        self.assertEqual(parse_query('"the sea"'), Term('sea'))
+
+    def test_phrase_verified_on_positions(self):
+        """Seuls les livres où les mots sont adjacents correspondent, avec le nombre d'occurrences"""
+        tree = parse_query('"old man"')
+        self.assertEqual(evaluate(tree, self.index).tolist(), [1, 3])
+        self.assertEqual(phrase_match_counts(tree, self.index, [1, 2, 3]), {1: 3, 2: 0, 3: 1})
+        self.assertEqual(evaluate(parse_query('"man and the sea"'), self.index).tolist(), [1])
+        self.assertEqual(evaluate(parse_query('"old sea"'), self.index).tolist(), [])
+
+
+class ProximityQueryTests(LabeledTestCase):
+    def setUp(self):
+        self.index = index_from_texts({
+            # Douze mots courts entre les deux : proches en caractères, loin en mots
+            1: "The whale is on a ship, as it was in my old day: a captain.",
+            # Deux mots longs entre les deux : loin en caractères, proches en mots
+            2: "A whale, incomprehensibly extraordinary captain, sank the ship.",
+            3: "Whale captain.",
+        })
+
+    def test_near_parsed_and_evaluated(self):
+        """NEAR/k garde les livres où au plus k mots séparent les termes, quelle que soit leur longueur"""
+        self.assertEqual(parse_query('whale NEAR/3 captain'), Near(('whale', 'captain'), 3))
+        self.assertEqual(parse_query('whale NEAR captain -ship'), And((Near(('whale', 'captain'), 10), Not(Term('ship')))))
+        self.assertEqual(evaluate(parse_query('whale NEAR/5 captain'), self.index).tolist(), [2, 3])
+        self.assertEqual(evaluate(parse_query('whale NEAR/0 captain'), self.index).tolist(), [3])
+        self.assertEqual(evaluate(parse_query('whale NEAR/12 captain'), self.index).tolist(), [1, 2, 3])
+
+    def test_minimal_span_and_proximity_ranking(self):
+        """Plus petit intervalle (en mots) couvrant tous les mots, et bonus de proximité dans le classement"""
+        spans = minimal_spans(['whale', 'captain', 'ship'], self.index, [1, 2, 3])
+        self.assertEqual(spans[:2].tolist(), [13, 6])
+        self.assertEqual(spans[2], np.iinfo(np.int64).max)
+        scores = proximity_scores(['whale', 'captain'], self.index, [1, 2, 3])
+        self.assertEqual(scores.argmax(), 2)
+        self.assertEqual(self.index.rank_by_downloads([1, 2, 3], scores).tolist(), [3, 2, 1])
+
+
+class BM25RankingTests(LabeledTestCase):
+    def setUp(self):
+        # 2000 livres : "whale" partout, "storm" fréquent seulement dans les 100 premiers
+        rng = np.random.default_rng(0)
+        postings = {'whale': {}, 'storm': {}}
+        for book_id in range(1, 2001):
+            postings['whale'][book_id] = list(range(0, 10 * int(rng.integers(1, 5)), 10))
+            if book_id <= 100 or book_id % 7 == 0:
+                postings['storm'][book_id] = list(range(1, 10 * (20 if book_id <= 100 else 1), 10))
+        self.index = make_index(postings)
+
+    def test_top_k_matches_full_sort(self):
+        """Le top-k block-max donne le même classement qu'un tri de tous les scores"""
+        candidates = self.index.doc_ids_for('whale')
+        scores = self.index.bm25_scores(['whale', 'storm'], candidates)
+        expected = candidates[np.lexsort((candidates, -scores))][:10]
+        book_ids, top_scores = top_k(self.index, ['whale', 'storm'], candidates, 10)
+        self.assertEqual(book_ids.tolist(), expected.tolist())
+        self.assertTrue(np.all(np.diff(top_scores) <= 0))
+        results = RankedResults(self.index, ['whale', 'storm'], candidates)
+        self.assertEqual(len(results), 2000)
+        self.assertEqual(results[5:10], expected[5:10].tolist())
+
+    def test_non_competitive_windows_skipped(self):
+        """Les fenêtres dont la borne ne peut battre le top-k ne sont pas évaluées"""
+        candidates = self.index.doc_ids_for('whale')
+        with patch.object(self.index, 'bm25_scores', wraps=self.index.bm25_scores) as scored:
+            top_k(self.index, ['whale', 'storm'], candidates, 10)
+        self.assertLess(sum(len(call.args[1]) for call in scored.call_args_list), len(candidates) // 2)
+
+
+class VocabularyRegexTests(LabeledTestCase):
+    def setUp(self):
+        self.terms = sorted(['whale', 'whaling', 'whalebone', 'narwhal', 'ship', 'shipwreck', 'captain', 'wheel', 'x42'])
+        self.trigrams = TrigramIndex(self.terms)
+
+    def test_regex_compiled_to_trigram_filter(self):
+        """Les littéraux obligatoires deviennent un ET / OU de trigrammes"""
+        self.assertEqual(regex_filter('whal(e|ing)'), ('and', ('wha', 'hal')))
+        self.assertEqual(regex_filter('^ship(wreck)?$'), ('and', ('shi', 'hip')))
+        self.assertEqual(regex_filter('cap|wreck'), ('or', ('cap', ('and', ('wre', 'rec', 'eck')))))
+        self.assertIsNone(regex_filter('[a-z]+'))
+        self.assertEqual(regex_filter('old man'), ('or', ()))
+
+    def test_candidates_checked_with_real_regex(self):
+        """Le filtre ne perd aucun terme : mêmes résultats qu'un parcours complet du vocabulaire"""
+        for pattern in ['whal(e|ing)', 'WHALE', '^ship', 'wh.*l$', 'cap|wreck', 'e{2}', r'\d+', 'old man']:
+            expected = [term for term in self.terms if re.search(pattern, term, re.IGNORECASE)]
+            self.assertEqual(self.trigrams.matching_terms(pattern), expected, pattern)
+
+
+class TextRegexSearchTests(LabeledTestCase):
+    def test_candidates_pruned_by_index(self):
+        """Seuls les livres contenant un mot avec les fragments imposés sont candidats"""
+        index = make_index(
+            {'whale': {1: [0]}, 'whaling': {2: [0]}, 'ship': {2: [9], 3: [0]}, 'shipwreck': {4: [0]}},
+            downloads={5: 0},
+        )
+        self.assertEqual(candidate_books(r'whal(e|ing)\s+\w+', index).tolist(), [1, 2, 5])
+        self.assertEqual(candidate_books('(old )?ship|wreck', index).tolist(), [2, 3, 4, 5])
+        self.assertEqual(candidate_books('old ship|wreck', index).tolist(), [4, 5])
+        # "her" tient dans un stopword : aucun préfiltrage possible sur ce fragment
+        self.assertIsNone(candidate_books('her', index))
+        self.assertIsNone(candidate_books(r'\d+', index))
+
+    def test_chunks_scanned_in_order_with_limit(self):
+        """Les lots sont parcourus en parallèle, les résultats gardent l'ordre des lots"""
+        chunks = [[(book_id, 'a whale' if book_id % 2 else 'a ship') for book_id in range(start, start + 5)]
+                  for start in range(0, 50, 5)]
+        with multiprocessing.get_context('spawn').Pool(2) as pool:
+            self.assertEqual(scan_texts('WHALE', chunks, limit=4, pool=pool), ([1, 3, 5, 7], True))
+            self.assertEqual(scan_texts('whale', chunks, limit=100, pool=pool), (list(range(1, 50, 2)), True))
+            self.assertEqual(scan_texts('whale', chunks, limit=100, time_budget=0, pool=pool)[1], False)
+
+    def test_expired_scan_kills_workers(self):
+        """À l'expiration du budget, aucun processus ne reste bloqué sur une regex catastrophique"""
+        chunks = [[(book_id, 'a' * 40 + 'b')] for book_id in range(4)]
+        pool = multiprocessing.get_context('spawn').Pool(2)
+        workers = multiprocessing.active_children()
+        start = time.monotonic()
+        self.assertEqual(scan_texts(r'(a+)+$', chunks, limit=10, time_budget=0.5, pool=pool), ([], False))
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertTrue(workers)
+        self.assertFalse([worker for worker in workers if worker.is_alive()])
+
+    @patch('book.text_search.SCAN_WORKERS', 2)
+    def test_overdue_abandoned_chunks_replace_pool(self):
+        """Des lots laissés en cours par un arrêt anticipé font remplacer le pool partagé après l'échéance"""
+        chunks = [[(1, 'whale')], [(2, 'a' * 40 + 'b')], [(3, 'a' * 40 + 'b')]]
+        pool = text_search._get_pool()
+        self.addCleanup(lambda: text_search._terminate_pool(text_search._pool) if text_search._pool else None)
+        pool.apply(time.sleep, (0,))
+        self.assertEqual(scan_texts(r'whale|(a+)+$', chunks, limit=1, time_budget=1), ([1], True))
+        self.assertIs(text_search._get_pool(), pool)
+        time.sleep(1)
+        self.assertIsNot(text_search._get_pool(), pool)
+        self.assertFalse([worker for worker in pool._pool if worker.is_alive()])
+
+
+class SuggestTests(LabeledTestCase):
+    def setUp(self):
+        self.index = make_index({
+            'whale': {1: [0], 2: [0], 3: [0]},
+            'whaler': {1: [9]},
+            'wharf': {2: [9], 3: [9]},
+            'what': {1: [20], 2: [20], 3: [20], 4: [0]},
+            'wheel': {4: [9]},
+            'ship': {1: [30]},
+        })
+
+    def test_completions_ranked_by_document_frequency(self):
+        """Les termes du préfixe sont classés par nombre de livres, les k premiers seulement"""
+        self.assertEqual(self.index.complete('wha', 3), [('what', 4), ('whale', 3), ('wharf', 2)])
+        self.assertEqual(self.index.complete('whale'), [('whale', 3), ('whaler', 1)])
+        self.assertEqual(self.index.complete('x'), [])
+
+    @patch('book.book_views.get_index')
+    def test_suggest_endpoint(self, mock_get_index):
+        """/books/suggest/?prefix= répond depuis l'index en mémoire"""
+        mock_get_index.return_value = self.index
+        request = APIRequestFactory().get('/api/books/suggest/', {'prefix': ' WH ', 'limit': 2})
+        response = BookSuggestView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['suggestions'], [
+            {'term': 'what', 'document_frequency': 4}, {'term': 'whale', 'document_frequency': 3},
+        ])
+
+
+class FuzzyTermTests(LabeledTestCase):
+    def setUp(self):
+        self.index = make_index({
+            'whale': {1: [0], 2: [0]},
+            'whales': {3: [0]},
+            'while': {4: [0]},
+            'shale': {5: [0]},
+            'captain': {1: [5], 6: [0]},
+        })
+
+    def test_similar_terms_match_brute_force(self):
+        """L'index de suppressions trouve exactement les termes à 1-2 fautes près"""
+        rng = np.random.default_rng(3)
+        letters = list('abcde')
+        terms = sorted({''.join(rng.choice(letters, rng.integers(1, 10))) for _ in range(400)})
+        deletions = DeletionIndex(terms)
+        for _ in range(50):
+            word = ''.join(rng.choice(letters, rng.integers(1, 10)))
+            for max_distance in (1, 2):
+                expected = sorted(
+                    (term, Levenshtein.distance(word, term)) for term in terms
+                    if Levenshtein.distance(word, term) <= max_distance
+                )
+                self.assertEqual(sorted(deletions.similar_terms(word, max_distance)), expected)
+
+    def test_misspelled_terms_expanded(self):
+        """Seuls les termes absents du vocabulaire sont étendus, sauf si tous sont demandés"""
+        self.assertEqual(self.index.similar_terms('whsle'),
+                         [('whale', 1), ('while', 1), ('shale', 2), ('whales', 2)])
+        self.assertEqual(evaluate(expand_fuzzy(parse_query('whsle captain'), self.index), self.index).tolist(), [1])
+        self.assertEqual(expand_fuzzy(parse_query('whale'), self.index), Term('whale'))
+        self.assertEqual(
+            evaluate(expand_fuzzy(parse_query('whale'), self.index, known_terms=True), self.index).tolist(),
+            [1, 2, 3, 4, 5],
+        )
+
+
+class PageRankTests(LabeledTestCase):
+    @patch('book.similarity.Posting')
+    def setUp(self, mock_posting):
+        # Vocabulaires des livres 10 à 50 (rangs 0 à 4) ; le livre 50 n'a aucun mot
+        vocabularies = {10: {0, 1, 2, 3}, 20: {1, 2, 3, 4}, 30: {2, 3, 4, 5}, 40: {7, 8, 9}, 50: set()}
+        rows = sorted((f'word{word}', book_id) for book_id, words in vocabularies.items() for word in words)
+        mock_posting.objects.order_by.return_value.values_list.return_value.iterator.return_value = rows
+        self.incidence = load_book_term_matrix(np.array(sorted(vocabularies)))
+
+    def test_jaccard_graph_by_blocks(self):
+        """Le graphe par blocs de produits creux garde les paires au-dessus du seuil, symétriques"""
+        adjacency = jaccard_graph(self.incidence, threshold=0.3, block_rows=2).toarray()
+        expected = np.zeros((5, 5))
+        expected[0, 1] = expected[1, 0] = expected[1, 2] = expected[2, 1] = 3 / 5
+        expected[0, 2] = expected[2, 0] = 2 / 6
+        np.testing.assert_allclose(adjacency, expected)
+
+    def test_pagerank_matches_networkx(self):
+        """L'itération de puissance vectorisée donne les scores de networkx.pagerank"""
+        adjacency = jaccard_graph(self.incidence, threshold=0.1)
+        graph = nx.Graph()
+        graph.add_nodes_from(range(5))
+        edges = adjacency.tocoo()
+        graph.add_weighted_edges_from(zip(edges.row.tolist(), edges.col.tolist(), edges.data.tolist()))
+        expected = nx.pagerank(graph, weight='weight')
+        np.testing.assert_allclose(pagerank(adjacency), [expected[node] for node in range(5)], atol=1e-6)
+
+
+class MinHashTests(LabeledTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.vocabulary = [f'word{i}' for i in range(5000)]
+        base = set(rng.choice(5000, 600, replace=False).tolist())
+        # Livre 2 : presque le même vocabulaire que le livre 1 ; livre 3 : sans rapport
+        self.books = {
+            1: base,
+            2: set(list(base)[:500]) | set(rng.choice(5000, 100).tolist()),
+            3: set(rng.choice(5000, 600, replace=False).tolist()),
+        }
+        self.signatures = {
+            book_id: signature(self.vocabulary[i] for i in words) for book_id, words in self.books.items()
+        }
+
+    def test_signature_estimates_jaccard(self):
+        """La proportion de valeurs égales des signatures estime la similarité de Jaccard"""
+        first, second = self.signatures[1], self.signatures[2]
+        exact = len(self.books[1] & self.books[2]) / len(self.books[1] | self.books[2])
+        self.assertAlmostEqual((first == second).mean(), exact, delta=0.15)
+        self.assertEqual(decode_signature(encode_signature(first)).tolist(), first.tolist())
+        self.assertIsNone(signature([]))
+
+    def test_similar_books_from_lsh_buckets(self):
+        """Les candidats viennent des bandes LSH : le quasi-doublon est trouvé, pas le livre sans rapport"""
+        index = SimilarityIndex.from_rows(
+            [(book_id, encode_signature(values)) for book_id, values in self.signatures.items()] + [(4, None)]
+        )
+        neighbours = index.similar_books(1)
+        self.assertEqual([book_id for book_id, _ in neighbours], [2])
+        self.assertGreater(neighbours[0][1], 0.5)
+        self.assertEqual(index.similar_books(4), [])
+
+    def test_lsh_threshold_matches_graph(self):
+        """Les bandes LSH gardent les livres au-dessus du seuil du graphe et écartent presque tous les autres"""
+        rng = np.random.default_rng(7)
+        base = sorted(self.books[1])
+        words_of = {}
+        for book_id in range(10, 60):
+            # Sans rapport (similarité ~0.03)
+            words_of[book_id] = set(rng.choice(5000, 200, replace=False).tolist())
+        for book_id in range(60, 70):
+            # Un tiers du vocabulaire du livre 1 (similarité ~0.3)
+            words_of[book_id] = set(rng.choice(base, 200, replace=False).tolist()) | set(rng.choice(5000, 250).tolist())
+        rows = [(book_id, encode_signature(values)) for book_id, values in self.signatures.items()]
+        rows += [(book_id, encode_signature(signature(self.vocabulary[i] for i in words)))
+                 for book_id, words in words_of.items()]
+        index = SimilarityIndex.from_rows(rows)
+        candidates = set(index.book_ids[index.candidates(int(np.searchsorted(index.book_ids, 1)))].tolist())
+        self.assertLessEqual(set(range(60, 70)) | {2}, candidates)
+        self.assertLessEqual(len(candidates & set(range(10, 60))), 10)
+        similar = [book_id for book_id, _ in index.similar_books(1, n=20)]
+        self.assertEqual(similar[0], 2)
+        self.assertEqual(set(similar), set(range(60, 70)) | {2})
+
+
+class CosineSimilarityTests(LabeledTestCase):
+    def test_blocked_neighbours_match_dense_cosine(self):
+        """Les voisins calculés par blocs sont les k plus proches du calcul dense, au-dessus du seuil"""
+        rng = np.random.default_rng(11)
+        weights = sparse.random(40, 60, density=0.15, random_state=rng, format='csr', dtype=np.float32)
+        matrix = normalized_rows(weights, max_document_ratio=None)
+        rows, columns, scores = cosine_neighbours(matrix, k=3, threshold=0.2, block_rows=7, workers=1)
+
+        dense = weights.toarray()
+        dense /= np.maximum(np.linalg.norm(dense, axis=1, keepdims=True), 1e-12)
+        cosine = dense @ dense.T
+        np.fill_diagonal(cosine, 0.0)
+        for row in range(40):
+            expected = sorted(cosine[row][cosine[row] > 0.2], reverse=True)[:3]
+            found = sorted(scores[rows == row].tolist(), reverse=True)
+            np.testing.assert_allclose(found, expected, rtol=1e-5)
+            np.testing.assert_allclose(cosine[row, columns[rows == row]], scores[rows == row], rtol=1e-5)
+
+        # Un terme présent dans tous les livres est retiré avant le produit
+        common = sparse.csr_matrix(np.array([[1.0, 2.0], [1.0, 0.0], [1.0, 0.0]]))
+        self.assertEqual(normalized_rows(common, max_document_ratio=0.5).toarray().tolist(), [[1.0], [0.0], [0.0]])
+
+    @patch('book.book_views.BookSerializer', FakeBookSerializer)
+    @patch('book.book_views.Book')
+    @patch('book.book_views.SimilarBook')
+    def test_similar_endpoint(self, mock_similar_book, mock_book_model):
+        """/books/<id>/similar/ lit les voisins précalculés, 404 pour un livre inconnu"""
+        entries = [SimpleNamespace(similar=make_book(2, 'Dog Stories'), similarity=0.8),
+                   SimpleNamespace(similar=make_book(3, 'Cat Tales'), similarity=0.4)]
+        queryset = mock_similar_book.objects.filter.return_value.select_related.return_value.prefetch_related.return_value
+        queryset.__getitem__.side_effect = lambda item: entries[item]
+
+        response = BookSimilarView.as_view()(APIRequestFactory().get('/api/books/1/similar/', {'limit': 1}), pk=1)
+        self.assertEqual(response.status_code, 200)
+        similar = response.data['similar_books']
+        self.assertEqual([(entry['book']['id'], entry['cosine_similarity']) for entry in similar], [(2, 0.8)])
+        mock_similar_book.objects.filter.assert_called_with(book_id=1)
+
+        entries = []
+        mock_book_model.objects.filter.return_value.exists.return_value = False
+        response = BookSimilarView.as_view()(APIRequestFactory().get('/api/books/9/similar/'), pk=9)
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,108 @@
+"""
+Cache disque des textes téléchargés
+
+Les textes sont stockés compressés (gzip) et adressés par leur contenu :
+``objects/<sha256[:2]>/<sha256>.txt.gz``. Un fichier de référence par
+livre (``refs/<gutenberg_id>``) contient le hash de son texte, ce qui permet
+de vérifier l'intégrité à la lecture et de partager les textes identiques.
+
+Le module contient aussi le point de reprise (checkpoint) des imports.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def write_atomically(path, data):
+    """Écrit dans un fichier temporaire puis le renomme : pas de fichier à moitié écrit"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class TextCache:
+    """Textes de livres indexés par ID Gutenberg et hash de contenu"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _object_path(self, digest):
+        return self.root / 'objects' / digest[:2] / f"{digest}.txt.gz"
+
+    def _ref_path(self, book_id):
+        return self.root / 'refs' / str(book_id)
+
+    def get_digest(self, book_id):
+        try:
+            return self._ref_path(book_id).read_text(encoding='ascii').strip()
+        except FileNotFoundError:
+            return None
+
+    def __contains__(self, book_id):
+        digest = self.get_digest(book_id)
+        return digest is not None and self._object_path(digest).exists()
+
+    def get(self, book_id):
+        """Texte en cache du livre, ou None s'il est absent ou corrompu"""
+        digest = self.get_digest(book_id)
+        if digest is None:
+            return None
+        try:
+            with gzip.open(self._object_path(digest), 'rt', encoding='utf-8') as cached:
+                text = cached.read()
+        except (FileNotFoundError, OSError, EOFError) as e:
+            logging.warning(f"Cache illisible pour le livre ID {book_id}: {e}")
+            return None
+        if content_hash(text) != digest:
+            logging.warning(f"Cache corrompu pour le livre ID {book_id}, il sera retéléchargé.")
+            return None
+        return text
+
+    def put(self, book_id, text):
+        """Enregistre le texte du livre et renvoie son hash"""
+        digest = content_hash(text)
+        object_path = self._object_path(digest)
+        if not object_path.exists():
+            write_atomically(object_path, gzip.compress(text.encode('utf-8'), compresslevel=6))
+        write_atomically(self._ref_path(book_id), digest.encode('ascii'))
+        return digest
+
+
+class ImportCheckpoint:
+    """Point de reprise d'un import : prochaine page à traiter et livres déjà faits"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.next_url = None
+        self.books_done = 0
+        if self.path.exists():
+            state = json.loads(self.path.read_text(encoding='utf-8'))
+            self.next_url = state.get('next_url')
+            self.books_done = state.get('books_done', 0)
+
+    def save(self, next_url, books_done):
+        self.next_url = next_url
+        self.books_done = books_done
+        state = {'next_url': next_url, 'books_done': books_done}
+        write_atomically(self.path, json.dumps(state).encode('utf-8'))
+
+    def clear(self):
+        self.next_url = None
+        self.books_done = 0
+        if self.path.exists():
+            self.path.unlink()
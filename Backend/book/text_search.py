@@ -0,0 +1,198 @@
+"""
+Recherche par expression régulière dans le texte des livres
+
+Au lieu d'un ``text_content ~* regex`` qui parcourt tout le corpus dans
+PostgreSQL, la recherche se fait en deux temps :
+
+1. préfiltrage sur l'index : toute suite d'au moins 3 caractères de mot que
+   la regex impose se trouve à l'intérieur d'un mot du texte, donc d'un terme
+   indexé (sauf si elle tient dans un stopword). Les livres candidats sont
+   ceux qui contiennent un terme du vocabulaire contenant ce fragment
+   (vocabulaire indexé par trigrammes, voir vocabulary.py) ; les livres sans
+   postings restent toujours candidats ;
+2. les candidats, par popularité décroissante, sont lus par lots et parcourus
+   avec la vraie regex dans un pool de processus, avec un budget de temps par
+   requête : au-delà, les lots restants sont abandonnés et le résultat est
+   marqué incomplet.
+
+Une regex au retour arrière catastrophique ne doit pas survivre à sa
+requête : le processus web attend chaque lot au plus jusqu'à l'échéance, et
+tue le pool (Pool.terminate) si des lots sont encore en cours à ce moment.
+Un lot resté en file après l'échéance n'est pas parcouru, et des lots
+abandonnés après un arrêt anticipé qui dépassent leur échéance font
+remplacer le pool à la requête suivante : aucun processus ne reste occupé.
+Les processus sont lancés par spawn (sans fork d'un serveur multithread,
+et disponible sous Windows) et n'exécutent que regex_scan.py.
+
+Le coût suit donc le nombre de livres candidats, pas la taille du corpus
+(sauf pour une regex sans fragment exploitable, comme ``\\d+``).
+"""
+
+import logging
+import multiprocessing
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from .analyzer import LANGUAGE_MAPPING, MIN_WORD_LENGTH, get_stopwords
+from .models import Book
+from .query import intersect, union
+from .regex_scan import scan_chunk
+from .vocabulary import ANY, NOTHING, all_of, regex_filter
+
+
+# Processus de parcours des textes
+SCAN_WORKERS = 4
+# Livres envoyés à un processus en une fois
+SCAN_CHUNK_SIZE = 20
+# Durée maximale du parcours pour une requête (secondes)
+SCAN_TIME_BUDGET = 2.0
+
+WORD_FRAGMENT = re.compile(r'\w+')
+
+# Processus neufs plutôt que fork du serveur web (threads, connexion à la BDD)
+_context = multiprocessing.get_context('spawn')
+_pool = None
+# (échéance, AsyncResult) des lots encore en cours après un arrêt anticipé
+_abandoned = []
+_pool_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _all_stopwords():
+    return frozenset().union(*(get_stopwords(language) for language in LANGUAGE_MAPPING))
+
+
+def _fragment_filter(text):
+    """Fragments de mot (3 caractères au moins) d'une suite de caractères obligatoires"""
+    stop_words = _all_stopwords()
+    fragments = []
+    for fragment in WORD_FRAGMENT.findall(text):
+        # Un fragment contenu dans un stopword peut n'apparaître que dans des mots non indexés
+        if len(fragment) >= MIN_WORD_LENGTH and not any(fragment in word for word in stop_words):
+            fragments.append(fragment)
+    return all_of(fragments)
+
+
+def candidate_books(pattern, index):
+    """IDs triés des livres pouvant contenir une correspondance, None si aucun préfiltrage"""
+    node = regex_filter(pattern, _fragment_filter)
+    if node is ANY:
+        return None
+    return union([_books_for(node, index.trigram_index(), index), index.unindexed_book_ids])
+
+
+def _books_for(node, trigrams, index):
+    if node == NOTHING:
+        return index.book_ids[:0]
+    if isinstance(node, str):
+        term_ids = trigrams.terms_containing(node)
+        return union([index.doc_ids_for(index.terms[term_id]) for term_id in term_ids.tolist()])
+    kind, children = node
+    results = [_books_for(child, trigrams, index) for child in children]
+    if kind == 'or':
+        return union(results)
+    results.sort(key=len)
+    matched = results[0]
+    for other in results[1:]:
+        matched = intersect(matched, other)
+    return matched
+
+
+# Parcours des textes
+
+def _get_pool():
+    """Pool partagé, remplacé si un lot abandonné tourne encore après son échéance"""
+    global _pool
+    stuck = None
+    with _pool_lock:
+        _abandoned[:] = [(deadline, result) for deadline, result in _abandoned if not result.ready()]
+        if any(deadline <= time.monotonic() for deadline, _ in _abandoned):
+            stuck, _pool = _pool, None
+            _abandoned.clear()
+        if _pool is None:
+            _pool = _context.Pool(SCAN_WORKERS)
+        pool = _pool
+    if stuck is not None:
+        stuck.terminate()
+        stuck.join()
+    return pool
+
+
+def _abandon(pool, deadline, results):
+    """Lots laissés en cours par un arrêt anticipé, surveillés jusqu'à leur échéance"""
+    with _pool_lock:
+        if pool is _pool:
+            _abandoned.extend((deadline, result) for result in results if not result.ready())
+
+
+def _terminate_pool(pool):
+    """Tue les processus d'un pool encore occupés par une requête expirée"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+            _abandoned.clear()
+    pool.terminate()
+    pool.join()
+
+
+def iter_text_chunks(book_ids, chunk_size=SCAN_CHUNK_SIZE):
+    """Lots [(id, texte)] dans l'ordre de book_ids, une requête par clé primaire par lot"""
+    for start in range(0, len(book_ids), chunk_size):
+        chunk = [int(book_id) for book_id in book_ids[start:start + chunk_size]]
+        texts = dict(Book.objects.filter(id__in=chunk).values_list('id', 'text_content'))
+        yield [(book_id, texts.get(book_id)) for book_id in chunk]
+
+
+def scan_texts(pattern, chunks, limit, time_budget=SCAN_TIME_BUDGET, pool=None):
+    """Parcourt les lots dans le pool (multiprocessing.Pool) et renvoie (IDs trouvés dans l'ordre des lots, complet).
+
+    Au plus SCAN_WORKERS * 2 lots sont en cours ; le parcours s'arrête dès
+    que les premiers lots ont donné limit livres, ou à l'expiration du budget
+    (le pool est alors tué si des lots tournent encore).
+    """
+    pool = pool or _get_pool()
+    deadline = time.monotonic() + time_budget
+    worker_deadline = time.time() + time_budget
+    chunks = iter(chunks)
+    running = deque()
+    matched = []
+
+    while True:
+        while len(running) < SCAN_WORKERS * 2:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            running.append(pool.apply_async(scan_chunk, (pattern, chunk, worker_deadline)))
+        if not running:
+            return matched[:limit], True
+
+        # Les résultats sont consommés dans l'ordre des lots (ordre de popularité)
+        head = running.popleft()
+        try:
+            found = head.get(timeout=max(deadline - time.monotonic(), 0))
+        except multiprocessing.TimeoutError:
+            found = None
+        if found is None:
+            logging.warning(f"Recherche regex interrompue après {time_budget}s : {pattern!r}")
+            if not all(result.ready() for result in (head, *running)):
+                _terminate_pool(pool)
+            return matched[:limit], False
+        matched.extend(found)
+        if len(matched) >= limit:
+            _abandon(pool, deadline, running)
+            return matched[:limit], True
+
+
+def search_texts(pattern, index, limit, time_budget=SCAN_TIME_BUDGET):
+    """Livres dont le texte correspond à la regex, par popularité : (IDs, complet)"""
+    candidates = candidate_books(pattern, index)
+    if candidates is None:
+        candidates = index.book_ids
+    if not len(candidates):
+        return [], True
+    ranked = index.rank_by_downloads(candidates)
+    return scan_texts(pattern, iter_text_chunks(ranked), limit, time_budget)
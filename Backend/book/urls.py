@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .book_views import BookListView, BookDetailView, BookSearchView, BookAdvancedSearchView, BookHighlightSearchView, BookTFIDFSearchView
+from .book_views import BookListView, BookDetailView, BookSearchView, BookAdvancedSearchView, BookHighlightSearchView, BookTFIDFSearchView, BookSuggestView, BookSimilarView
 from .author_views import AuthorListView, AuthorDetailView
 
 
@@ -10,7 +10,9 @@ urlpatterns = [
     path('authors/<int:pk>/', AuthorDetailView.as_view(), name='author-detail'),
     path('books/', BookListView.as_view(), name='book-list'),
     path('books/<int:pk>/', BookDetailView.as_view(), name='book-detail'),
+    path('books/<int:pk>/similar/', BookSimilarView.as_view(), name='book-similar'),
     path('books/search/', BookSearchView.as_view(), name='book-search'),
+    path('books/suggest/', BookSuggestView.as_view(), name='book-suggest'),
     path('books/tfidf-search/', BookTFIDFSearchView.as_view(), name='book-tfidf-search'),
     path('books/advanced-search/', BookAdvancedSearchView.as_view(), name='advanced-search'),
     path('books/highlight-search/', BookHighlightSearchView.as_view(), name='book-highlight-search'),
@@ -0,0 +1,201 @@
+"""
+Recherche par expression régulière dans le vocabulaire de l'index
+
+Le vocabulaire (termes dédoublonnés de l'index en mémoire) est indexé par
+trigrammes : pour chaque suite de 3 caractères, la liste triée des termes qui
+la contiennent. Une regex est d'abord traduite en filtre de trigrammes (ET /
+OU de trigrammes obligatoires, d'après les littéraux qu'elle impose), puis
+seuls les termes candidats sont testés avec la vraie regex.
+
+La traduction est conservatrice : tout terme qui correspond à la regex passe
+le filtre. Une regex sans littéral d'au moins 3 caractères (``.*``, ``[a-z]+``)
+donne un filtre vide et tout le vocabulaire est testé, en une recherche sur
+les termes joints par des retours à la ligne plutôt qu'un appel par terme.
+"""
+
+import re
+from bisect import bisect_right
+
+import numpy as np
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from .query import intersect, union
+
+
+GRAM_LENGTH = 3
+
+# Nœuds du filtre : None (aucune contrainte), un trigramme, ('and', enfants) ou ('or', enfants)
+ANY = None
+# Un littéral impossible dans un terme (espace, ponctuation) : aucun terme ne correspond
+NOTHING = ('or', ())
+
+TERM_CHARACTER = re.compile(r'\w')
+
+
+def all_of(children):
+    children = [child for child in children if child is not ANY]
+    if NOTHING in children:
+        return NOTHING
+    if not children:
+        return ANY
+    return children[0] if len(children) == 1 else ('and', tuple(children))
+
+
+def any_of(children):
+    if ANY in children:
+        return ANY
+    children = [child for child in children if child != NOTHING]
+    if not children:
+        return NOTHING
+    return children[0] if len(children) == 1 else ('or', tuple(children))
+
+
+def _literal_filter(text):
+    """Trigrammes d'une suite de caractères obligatoires"""
+    if not all(TERM_CHARACTER.match(char) for char in text):
+        return NOTHING
+    return all_of([text[i:i + GRAM_LENGTH] for i in range(len(text) - GRAM_LENGTH + 1)])
+
+
+def _sequence_filter(items, literal_filter):
+    """Filtre d'une concaténation : ET des suites de littéraux et des sous-motifs"""
+    children = []
+    run = []
+    for op, value in items:
+        if op is sre_parse.LITERAL:
+            run.append(chr(value).lower())
+            continue
+        if run:
+            children.append(literal_filter(''.join(run)))
+            run = []
+        children.append(_item_filter(op, value, literal_filter))
+    if run:
+        children.append(literal_filter(''.join(run)))
+    return all_of(children)
+
+
+def _item_filter(op, value, literal_filter):
+    if op is sre_parse.SUBPATTERN:
+        return _sequence_filter(value[-1], literal_filter)
+    if op is sre_parse.BRANCH:
+        return any_of([_sequence_filter(branch, literal_filter) for branch in value[1]])
+    if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+        minimum, _, item = value
+        return _sequence_filter(item, literal_filter) if minimum >= 1 else ANY
+    # Classes de caractères, points, ancres... : pas de contrainte
+    return ANY
+
+
+def _looks_outside_term(items):
+    """Vrai si la regex contient une assertion qui verrait au-delà d'un terme
+    une fois les termes joints (lookaround, \\A, \\Z)"""
+    for op, value in items:
+        if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            return True
+        if op is sre_parse.AT and value in (sre_parse.AT_BEGINNING_STRING, sre_parse.AT_END_STRING):
+            return True
+        if op is sre_parse.SUBPATTERN and _looks_outside_term(value[-1]):
+            return True
+        if op is sre_parse.BRANCH and any(_looks_outside_term(branch) for branch in value[1]):
+            return True
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and _looks_outside_term(value[2]):
+            return True
+    return False
+
+
+def regex_filter(pattern, literal_filter=_literal_filter):
+    """Filtre vérifié par tout terme correspondant à la regex.
+
+    literal_filter traduit chaque suite de caractères obligatoires en nœud
+    du filtre (par défaut : ses trigrammes).
+    """
+    return _sequence_filter(sre_parse.parse(pattern), literal_filter)
+
+
+class TrigramIndex:
+    """Trigrammes -> termes (rangs dans la liste triée du vocabulaire)"""
+
+    def __init__(self, terms):
+        self.terms = terms
+        grams = []
+        term_ids = []
+        for term_id, term in enumerate(terms):
+            term_grams = {term[i:i + GRAM_LENGTH] for i in range(len(term) - GRAM_LENGTH + 1)}
+            grams.extend(term_grams)
+            term_ids.extend([term_id] * len(term_grams))
+
+        # Format CSR : les termes du trigramme i sont term_ids[offsets[i]:offsets[i + 1]], triés
+        grams = np.array(grams, dtype=f'<U{GRAM_LENGTH}')
+        term_ids = np.array(term_ids, dtype=np.int64)
+        order = np.lexsort((term_ids, grams))
+        grams, self.term_ids = grams[order], term_ids[order]
+        self.grams, starts = np.unique(grams, return_index=True)
+        self.offsets = np.append(starts, len(grams))
+        self._text = None
+
+    def _joined(self):
+        """Vocabulaire en un seul texte, un terme par ligne, et début de chaque ligne"""
+        if self._text is None:
+            self._line_starts = np.cumsum([0] + [len(term) + 1 for term in self.terms[:-1]]).tolist()
+            self._text = '\n'.join(self.terms)
+        return self._text, self._line_starts
+
+    def _scan(self, pattern, compiled):
+        """Termes correspondants, par recherches successives dans le texte joint.
+
+        Une correspondance qui déborde sur les termes suivants désigne seulement
+        un candidat, revérifié seul ; la recherche reprend au terme suivant.
+        """
+        text, line_starts = self._joined()
+        joined = re.compile(pattern, re.IGNORECASE | re.MULTILINE)
+        matched = []
+        position = 0
+        while position <= len(text) and (match := joined.search(text, position)):
+            term_id = bisect_right(line_starts, match.start()) - 1
+            if compiled.search(self.terms[term_id]):
+                matched.append(self.terms[term_id])
+            position = line_starts[term_id] + len(self.terms[term_id]) + 1
+        return matched
+
+    def terms_with(self, gram):
+        i = int(np.searchsorted(self.grams, gram))
+        if i == len(self.grams) or self.grams[i] != gram:
+            return self.term_ids[:0]
+        return self.term_ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def terms_containing(self, fragment):
+        """Rangs triés des termes contenant le fragment (3 caractères au moins)"""
+        term_ids = self.candidates(_literal_filter(fragment))
+        return term_ids[[fragment in self.terms[term_id] for term_id in term_ids.tolist()]]
+
+    def candidates(self, node):
+        """Rangs triés des termes passant le filtre (None : tout le vocabulaire)"""
+        if node is ANY:
+            return None
+        if isinstance(node, str):
+            return self.terms_with(node)
+        kind, children = node
+        results = [self.candidates(child) for child in children]
+        if kind == 'or':
+            return union(results)
+        results = sorted((result for result in results if result is not None), key=len)
+        matched = results[0]
+        for other in results[1:]:
+            matched = intersect(matched, other)
+        return matched
+
+    def matching_terms(self, pattern):
+        """Termes du vocabulaire où la regex (insensible à la casse) trouve une correspondance"""
+        compiled = re.compile(pattern, re.IGNORECASE)
+        term_ids = self.candidates(regex_filter(pattern))
+        if term_ids is None:
+            if not self.terms:
+                return []
+            if _looks_outside_term(sre_parse.parse(pattern)):
+                return [term for term in self.terms if compiled.search(term)]
+            return self._scan(pattern, compiled)
+        return [self.terms[term_id] for term_id in term_ids.tolist() if compiled.search(self.terms[term_id])]
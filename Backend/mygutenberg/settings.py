@@ -154,4 +154,7 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # CORS settings
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+# Cache disque des textes téléchargés et point de reprise des imports
+BOOK_TEXT_CACHE_DIR = env('BOOK_TEXT_CACHE_DIR', default=str(BASE_DIR / 'data' / 'texts'))
+BOOK_IMPORT_CHECKPOINT = env('BOOK_IMPORT_CHECKPOINT', default=str(BASE_DIR / 'data' / 'import_checkpoint.json'))